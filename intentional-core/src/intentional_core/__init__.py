@@ -18,6 +18,7 @@ from intentional_core.bot_structures.direct_to_llm import DirectToLLMBotStructur
 from intentional_core.llm_client import LLMClient, load_llm_client_from_dict
 from intentional_core.tools import Tool, load_tools_from_dict
 from intentional_core.intent_routing import IntentRouter
+from intentional_core.tokenization import Tokenizer, load_tokenizer_from_dict
 
 __all__ = [
     "EventEmitter",
@@ -33,4 +34,6 @@ __all__ = [
     "Tool",
     "IntentRouter",
     "load_tools_from_dict",
+    "Tokenizer",
+    "load_tokenizer_from_dict",
 ]
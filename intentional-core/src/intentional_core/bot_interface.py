@@ -4,7 +4,7 @@
 Functions to load bots from config files.
 """
 
-from typing import Dict, Any, Optional, Set
+from typing import Dict, Any, Optional
 
 import json
 from pathlib import Path
@@ -13,8 +13,9 @@ from abc import ABC, abstractmethod
 import yaml
 import structlog
 
-from intentional_core.utils import import_plugin, inheritors, import_all_plugins
+from intentional_core.utils import import_plugin, import_all_plugins, register_class
 from intentional_core.intent_routing import IntentRouter
+from intentional_core.tool_execution import configure_tool_execution
 
 
 log = structlog.get_logger(logger_name=__name__)
@@ -46,6 +47,13 @@ class BotInterface(ABC):
     "whatsapp", etc.
     """
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        """
+        Register every subclass as soon as it's defined, so that it can be found by its `name`.
+        """
+        super().__init_subclass__(**kwargs)
+        register_class(_BOT_INTERFACES, cls, cls.name, "bot interface", key_name="name")
+
     @abstractmethod
     async def run(self):
         """
@@ -69,6 +77,9 @@ def load_configuration_file(path: Path) -> BotInterface:
     log.debug("Loading YAML configuration file", config_file_path=path)
     with open(path, "r", encoding="utf-8") as file:
         config = yaml.safe_load(file)
+    # Sub-conversation files are found relative to the configuration file
+    if isinstance(config.get("conversation"), dict):
+        config["conversation"].setdefault("base_path", str(Path(path).parent))
     return load_bot_interface_from_dict(config)
 
 
@@ -97,33 +108,13 @@ def load_bot_interface_from_dict(config: Dict[str, Any]) -> BotInterface:
     else:
         import_all_plugins()
 
+    # Set up the executors of the tools before the tools are loaded
+    configure_tool_execution(config.pop("tool_execution", None))
+
     # Initialize the intent router
     log.debug("Creating intent router")
     intent_router = IntentRouter(config.pop("conversation", {}))
 
-    # Get all the subclasses of Bot
-    subclasses: Set[BotInterface] = inheritors(BotInterface)
-    log.debug("Collected bot interface classes", bot_interfaces=subclasses)
-
-    for subclass in subclasses:
-        if not subclass.name:
-            log.error(
-                "Bot interface class '%s' does not have a name. This bot type will not be usable.",
-                subclass,
-                bot_interface_class=subclass,
-            )
-            continue
-
-        if subclass.name in _BOT_INTERFACES:
-            log.warning(
-                "Duplicate bot interface type '%s' found. The older class will be replaced by the newly imported one.",
-                subclass.name,
-                old_bot_interface_name=subclass.name,
-                old_bot_interface_class=_BOT_INTERFACES[subclass.name],
-                new_bot_interface_class=subclass,
-            )
-        _BOT_INTERFACES[subclass.name] = subclass
-
     # Identify the type of bot interface and see if it's known
     interface_class = config.pop("interface", None)
     if not interface_class:
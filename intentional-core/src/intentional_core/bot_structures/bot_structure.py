@@ -4,13 +4,13 @@
 Functions to load bot structure classes from config files.
 """
 
-from typing import Dict, Any, Optional, Set
+from typing import Dict, Any, Optional
 
 from abc import abstractmethod
 
 import structlog
 
-from intentional_core.utils import inheritors
+from intentional_core.utils import register_class
 from intentional_core.intent_routing import IntentRouter
 from intentional_core.events import EventListener
 
@@ -43,6 +43,13 @@ class BotStructure(EventListener):
     etc.
     """
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        """
+        Register every subclass as soon as it's defined, so that it can be found by its `name`.
+        """
+        super().__init_subclass__(**kwargs)
+        register_class(_BOT_STRUCTURES, cls, cls.name, "bot structure", key_name="name")
+
     async def connect(self) -> None:
         """
         Connect to the bot.
@@ -87,28 +94,6 @@ def load_bot_structure_from_dict(intent_router: IntentRouter, config: Dict[str,
     Returns:
         The BotStructure instance.
     """
-    # Get all the subclasses of Bot
-    subclasses: Set[BotStructure] = inheritors(BotStructure)
-    log.debug("Collected bot structure classes", bot_structure_classes=subclasses)
-    for subclass in subclasses:
-        if not subclass.name:
-            log.error(
-                "BotStructure class '%s' does not have a name. This bot structure type will not be usable.",
-                subclass,
-                bot_structure_class=subclass,
-            )
-            continue
-
-        if subclass.name in _BOT_STRUCTURES:
-            log.warning(
-                "Duplicate bot structure type '%s' found. The older class will be replaced by the newly imported one.",
-                subclass.name,
-                old_bot_structure_name=subclass.name,
-                old_bot_structure_class=_BOT_STRUCTURES[subclass.name],
-                new_bot_structure_class=subclass,
-            )
-        _BOT_STRUCTURES[subclass.name] = subclass
-
     # Identify the type of bot and see if it's known
     bot_structure_class = config.pop("type")
     log.debug("Creating bot structure", bot_structure_class=bot_structure_class)
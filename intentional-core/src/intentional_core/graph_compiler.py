@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Load-time analysis of the conversation graph: reachability, dead ends and unused tools.
+"""
+
+from typing import List, Set, TYPE_CHECKING
+from dataclasses import dataclass, field
+
+import structlog
+import networkx
+
+if TYPE_CHECKING:
+    from intentional_core.intent_routing import IntentRouter
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+@dataclass
+class CompilationReport:
+    """
+    The result of the analysis of a conversation graph.
+    """
+
+    initial_stage: str
+    reachable_stages: List[str] = field(default_factory=list)
+    unreachable_stages: List[str] = field(default_factory=list)
+    dead_end_stages: List[str] = field(default_factory=list)
+    unused_tools: List[str] = field(default_factory=list)
+    pruned: bool = False
+
+    def summary(self) -> str:
+        """
+        A compact, human readable version of the report.
+        """
+        action = "pruned" if self.pruned else "kept"
+        lines = [
+            f"Start stage: {self.initial_stage}",
+            f"Reachable stages: {len(self.reachable_stages)}",
+            f"Unreachable stages ({action}): {', '.join(self.unreachable_stages) or '-'}",
+            f"Stages that can't reach '_end_': {', '.join(self.dead_end_stages) or '-'}",
+            f"Unused tools ({action}): {', '.join(self.unused_tools) or '-'}",
+        ]
+        return "\n".join(lines)
+
+
+def build_flow_graph(intent_router: "IntentRouter", backtracking_connection: str) -> networkx.DiGraph:
+    """
+    Builds a graph of all the moves the conversation can make, including the indirect transitions given by the
+    `accessible_from` field of the stages. Edges coming from indirect transitions are marked with `indirect=True`.
+    Backtracking outcomes are not included, because they can only lead back to a stage that was already visited.
+
+    Args:
+        intent_router: the intent router to analyze.
+        backtracking_connection: the name of the backtracking connection, to skip.
+
+    Returns:
+        A directed graph where an edge means that the origin stage can move to the target stage in one step.
+    """
+    flow = networkx.DiGraph()
+    flow.add_nodes_from(intent_router.stages)
+    for name, stage in intent_router.stages.items():
+        for outcome in stage.outcomes.values():
+            if outcome["move_to"] != backtracking_connection:
+                flow.add_edge(name, outcome["move_to"])
+
+        if "_all_" in stage.accessible_from:
+            origins = [origin for origin in intent_router.stages if origin != name]
+        else:
+            origins = [origin for origin in stage.accessible_from if origin in intent_router.stages and origin != name]
+        for origin in origins:
+            flow.add_edge(origin, name, indirect=True)
+    return flow
+
+
+def compile_conversation_graph(intent_router: "IntentRouter", prune: bool = True) -> CompilationReport:
+    """
+    Analyzes the conversation graph of the intent router once, when the configuration is loaded.
+
+    Computes which stages are reachable from the start stage, which stages can never reach `_end_` and which tools are
+    only used by stages that can't be reached. If `prune` is set, unreachable stages and their tools are removed from
+    the intent router.
+
+    Args:
+        intent_router: the intent router to analyze.
+        prune: whether to remove the unreachable stages from the intent router.
+
+    Returns:
+        A report describing the graph.
+    """
+    # Imported here to avoid a circular import
+    from intentional_core.intent_routing import BACKTRACKING_CONNECTION  # pylint: disable=import-outside-toplevel
+
+    flow = build_flow_graph(intent_router, BACKTRACKING_CONNECTION)
+    reachable: Set[str] = {intent_router.initial_stage, "_end_"} | networkx.descendants(
+        flow, intent_router.initial_stage
+    )
+
+    # A backtracking outcome leads back to whichever stage made an indirect transition, so for the sake of finding
+    # dead ends we assume it can lead to any stage that has indirect transitions.
+    backtrack_targets = {origin for origin, _, indirect in flow.edges(data="indirect") if indirect}
+    for name, stage in intent_router.stages.items():
+        if any(outcome["move_to"] == BACKTRACKING_CONNECTION for outcome in stage.outcomes.values()):
+            flow.add_edges_from((name, target) for target in backtrack_targets if target != name)
+    can_end: Set[str] = {"_end_"} | networkx.ancestors(flow, "_end_")
+
+    report = CompilationReport(initial_stage=intent_router.initial_stage, pruned=prune)
+    report.reachable_stages = [name for name in intent_router.stages if name in reachable]
+    report.unreachable_stages = [name for name in intent_router.stages if name not in reachable]
+    report.dead_end_stages = [name for name in report.reachable_stages if name not in can_end]
+
+    used_tools = {tool for name in report.reachable_stages for tool in intent_router.stages[name].tools}
+    report.unused_tools = sorted(
+        {tool for name in report.unreachable_stages for tool in intent_router.stages[name].tools} - used_tools
+    )
+
+    if prune:
+        for name in report.unreachable_stages:
+            log.debug("Pruning unreachable stage", stage_name=name)
+            del intent_router.stages[name]
+            intent_router.graph.remove_node(name)
+
+    for name in report.dead_end_stages:
+        log.warning("Stage '%s' can never reach the end of the conversation.", name, stage_name=name)
+    log.debug("Conversation graph compiled", compilation_report=report.summary())
+    return report
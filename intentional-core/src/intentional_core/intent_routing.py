@@ -4,13 +4,23 @@
 Intent routing logic.
 """
 
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
+import copy
+import json
+import asyncio
+from pathlib import Path
+from dataclasses import dataclass
+
+import yaml
 import structlog
 import networkx
 
-from intentional_core.tools import Tool, ToolParameter, load_tools_from_dict
+from intentional_core.tools import LazyTools, Tool, ToolParameter, load_tools_from_dict
 from intentional_core.end_conversation import EndConversationTool
+from intentional_core.graph_compiler import compile_conversation_graph
+from intentional_core.outcome_matching import OutcomeResolver, DEFAULT_MATCH_THRESHOLD
+from intentional_core.tokenization import load_tokenizer_from_dict, tool_schema_text
 
 
 log = structlog.get_logger(logger_name=__name__)
@@ -18,6 +28,12 @@ log = structlog.get_logger(logger_name=__name__)
 
 BACKTRACKING_CONNECTION = "_backtrack_"
 START_CONNECTION = "_start_"
+SUBCONVERSATION_SEPARATOR = "/"
+
+_SUBCONVERSATIONS = {}
+""" This is a global dictionary that caches the parsed sub-conversation files by path, shared by all routers """
+_COMPILED_SUBCONVERSATIONS = {}
+""" This is a global dictionary that caches the compiled sub-conversations, shared by all routers """
 DEFAULT_PROMPT_TEMPLATE = """
 {background}
 
@@ -62,6 +78,7 @@ class IntentRouter(Tool):
     def __init__(self, config: Dict[str, Any]) -> None:
         self.background = config.get("background", "You're a helpful assistant.")
         self.initial_message = config.get("initial_message", None)
+        self.base_path = Path(config.get("base_path", "."))
         self.graph = networkx.MultiDiGraph()
 
         # Init the stages
@@ -69,10 +86,7 @@ class IntentRouter(Tool):
         if "stages" not in config or not config["stages"]:
             raise ValueError("The conversation must have at least one stage.")
         for name, stage_config in config["stages"].items():
-            log.debug("Adding stage", stage_name=name)
-            self.stages[name] = Stage(name, stage_config)
-            self.stages[name].tools[self.name] = self  # Add the intent router to the tools list of each stage
-            self.graph.add_node(name)
+            self.add_stage(name, stage_config, self.base_path)
 
         # Add end stage
         name = "_end_"
@@ -86,22 +100,7 @@ class IntentRouter(Tool):
         self.graph.add_node("_end_")
 
         # Connect the stages
-        for name, stage in self.stages.items():
-            for outcome_name, outcome_config in stage.outcomes.items():
-                if outcome_config["move_to"] not in [
-                    *self.stages,
-                    BACKTRACKING_CONNECTION,
-                ]:
-                    raise ValueError(
-                        f"Stage '{name}' has an outcome leading to an unknown stage '{outcome_config['move_to']}'"
-                    )
-                log.debug(
-                    "Adding connection",
-                    origin=name,
-                    target=outcome_config["move_to"],
-                    outcome=outcome_name,
-                )
-                self.graph.add_edge(name, outcome_config["move_to"], key=outcome_name)
+        self.connect_stages(list(self.stages))
 
         # Find initial stage
         self.initial_stage = ""
@@ -113,6 +112,22 @@ class IntentRouter(Tool):
                 self.initial_stage = name
         if not self.initial_stage:
             raise ValueError("No start stage found!")
+        if isinstance(self.stages[self.initial_stage], SubConversationStage):
+            raise ValueError("The start stage can't be a sub-conversation.")
+
+        # Analyze the graph once and drop the stages that can never be reached
+        self.compilation_report = compile_conversation_graph(self, prune=config.get("prune_unreachable_stages", True))
+
+        # Index the outcomes of each stage to resolve near misses without failing the tool call
+        self.outcome_match_threshold = config.get("outcome_match_threshold", DEFAULT_MATCH_THRESHOLD)
+        self.outcome_resolvers = {}
+        self.index_outcomes()
+
+        # Count the tokens of each stage's prompt and tools once
+        self.tokenizer = load_tokenizer_from_dict(config.get("tokenizer", None))
+        self.context_window = config.get("context_window", None)
+        self.max_prompt_share = config.get("max_prompt_share", 0.5)
+        self.count_stage_tokens()
 
         self.current_stage_name = self.initial_stage
         self.backtracking_stack = []
@@ -134,61 +149,250 @@ class IntentRouter(Tool):
         Returns:
             The new system prompt and the tools accessible in this stage.
         """
-        selected_outcome = params["outcome"]
-        transitions = self.get_external_transitions()
-
-        if selected_outcome not in self.current_stage.outcomes and selected_outcome not in transitions:
+        selected_outcome = self.outcome_resolvers[self.current_stage_name].resolve(params["outcome"])
+        if not selected_outcome:
             raise ValueError(f"Unknown outcome '{params['outcome']}' for stage '{self.current_stage_name}'")
+        if selected_outcome != params["outcome"]:
+            log.debug("Outcome resolved", given_outcome=params["outcome"], resolved_outcome=selected_outcome)
 
+        # Find the next stage first, and change the router's state only once it's ready
+        backtracking = False
+        indirect = False
         if selected_outcome in self.current_stage.outcomes:
-            next_stage = self.current_stage.outcomes[params["outcome"]]["move_to"]
-
-            if next_stage != BACKTRACKING_CONNECTION:
-                # Direct stage to stage connection
-                self.current_stage_name = next_stage
-            else:
-                # Backtracking connection
-                self.current_stage_name = self.backtracking_stack.pop()
+            next_stage = self.current_stage.outcomes[selected_outcome]["move_to"]
+            if next_stage == BACKTRACKING_CONNECTION:
+                if not self.backtracking_stack:
+                    raise ValueError(f"Stage '{self.current_stage_name}' has no previous stage to go back to.")
+                backtracking = True
+                next_stage = self.backtracking_stack[-1]
         else:
             # Indirect transition, needs to be tracked in the stack
+            indirect = True
+            next_stage = selected_outcome
+
+        # Sub-conversations are loaded on first entry, and then we move into their start stage
+        while isinstance(self.stages[next_stage], SubConversationStage):
+            if not self.stages[next_stage].initial_stage:
+                await self.load_subconversation(next_stage)
+            next_stage = self.stages[next_stage].initial_stage
+
+        if backtracking:
+            self.backtracking_stack.pop()
+        elif indirect:
             self.backtracking_stack.append(self.current_stage_name)
-            self.current_stage_name = selected_outcome
+        self.current_stage_name = next_stage
 
+        self.prefetch_tools()
         return self.get_prompt(), self.current_stage.tools
 
-    def get_prompt(self):
+    def prefetch_tools(self, stage_name: Optional[str] = None) -> None:
+        """
+        Start running in the background the tools of a stage that are safe to run ahead of time, so that their output
+        is ready when the LLM asks for it. Called on every stage transition. Needs a running event loop.
+
+        Args:
+            stage_name: the stage whose tools to prefetch. Defaults to the current stage.
+        """
+        for tool in self.stages[stage_name or self.current_stage_name].tools.values():
+            tool.start_prefetch()
+
+    def add_stage(self, name: str, config: Dict[str, Any], base_path: Path) -> None:
         """
-        Get the prompt for the current stage.
+        Create a stage and add it to the graph.
+
+        Args:
+            name: the name of the stage.
+            config: the configuration of the stage.
+            base_path: the folder relative paths to sub-conversation files are resolved from.
+        """
+        self.add_built_stage(name, self.build_stage(name, config, base_path))
+
+    def build_stage(self, name: str, config: Dict[str, Any], base_path: Path) -> "Stage":
         """
+        Create a stage, without adding it to the graph.
+
+        Args:
+            name: the name of the stage.
+            config: the configuration of the stage.
+            base_path: the folder relative paths to sub-conversation files are resolved from.
+
+        Returns:
+            The stage.
+        """
+        log.debug("Building stage", stage_name=name)
+        if "conversation_file" in config:
+            stage = SubConversationStage(name, config, base_path)
+        else:
+            stage = Stage(name, config)
+        stage.tools[self.name] = self  # Add the intent router to the tools list of each stage
+        return stage
+
+    def add_built_stage(self, name: str, stage: "Stage") -> None:
+        """
+        Add a stage created by `build_stage` to the graph.
+
+        Args:
+            name: the name of the stage.
+            stage: the stage.
+        """
+        log.debug("Adding stage", stage_name=name)
+        self.stages[name] = stage
+        self.graph.add_node(name)
+
+    def add_connected_stages(self, new_stages: Dict[str, "Stage"]) -> None:
+        """
+        Add stages created by `build_stage` to the graph together with their outcomes. If any outcome is invalid, none
+        of the stages is added.
+
+        Args:
+            new_stages: the stages to add, by name.
+        """
+        for name, stage in new_stages.items():
+            self.add_built_stage(name, stage)
+        try:
+            self.connect_stages(list(new_stages))
+        except ValueError:
+            for name in new_stages:
+                del self.stages[name]
+                self.graph.remove_node(name)
+            raise
+
+    def connect_stages(self, stage_names: List[str]) -> None:
+        """
+        Validate the outcomes of the given stages and add them to the graph as edges.
+
+        Args:
+            stage_names: the stages to connect.
+        """
+        for name in stage_names:
+            for outcome_name, outcome_config in self.stages[name].outcomes.items():
+                if outcome_config["move_to"] not in [
+                    *self.stages,
+                    BACKTRACKING_CONNECTION,
+                ]:
+                    raise ValueError(
+                        f"Stage '{name}' has an outcome leading to an unknown stage '{outcome_config['move_to']}'"
+                    )
+                log.debug(
+                    "Adding connection",
+                    origin=name,
+                    target=outcome_config["move_to"],
+                    outcome=outcome_name,
+                )
+                self.graph.add_edge(name, outcome_config["move_to"], key=outcome_name)
+
+    async def load_subconversation(self, stage_name: str) -> None:
+        """
+        Load the stages of a sub-conversation into the router. See `compile_subconversation`.
+
+        The sub-conversation is compiled only once per process: the file is read in a thread, so that the event loop
+        is not blocked in the middle of a conversation, and the compiled stages are shared by all routers. Each router
+        builds its own stages from them, because stages hold the tools of their session.
+
+        Args:
+            stage_name: the name of the stage that references the sub-conversation.
+        """
+        stage: SubConversationStage = self.stages[stage_name]
+        key = (stage_name, stage.conversation_file, json.dumps(stage.outcomes, sort_keys=True, default=str))
+        compiled = _COMPILED_SUBCONVERSATIONS.get(key)
+        if compiled is None:
+            log.debug("Compiling sub-conversation", stage_name=stage_name, conversation_file=stage.conversation_file)
+            compiled = await asyncio.to_thread(compile_subconversation, stage_name, stage)
+            _COMPILED_SUBCONVERSATIONS[key] = compiled
+
+        # Build the new stages apart, and add them to the router only if the whole sub-conversation is valid
+        log.debug("Loading sub-conversation", stage_name=stage_name, conversation_file=stage.conversation_file)
+        new_stages = {
+            name: self.build_stage(name, copy.deepcopy(config), stage.conversation_file.parent)
+            for name, config in compiled.stages.items()
+        }
+        self.add_connected_stages(new_stages)
+        self.index_outcomes(list(new_stages))
+        self.count_stage_tokens(list(new_stages))
+        stage.initial_stage = compiled.initial_stage
+
+    def get_prompt(self, stage_name: Optional[str] = None):
+        """
+        Get the prompt for the given stage.
+
+        Args:
+            stage_name: the stage to get the prompt for. Defaults to the current stage.
+        """
+        stage_name = stage_name or self.current_stage_name
+        stage = self.stages[stage_name]
         outcomes = "You need to reach one of these situations:\n" + "\n".join(
-            f"  - {name}: {data['description']}" for name, data in self.current_stage.outcomes.items()
+            f"  - {name}: {data['description']}" for name, data in stage.outcomes.items()
         )
         transitions = "\n".join(
-            f"  - {stage}: {self.stages[stage].description}" for stage in self.get_external_transitions()
+            f"  - {target}: {self.stages[target].description}" for target in self.get_external_transitions(stage_name)
         )
-        template = self.current_stage.custom_template or DEFAULT_PROMPT_TEMPLATE
+        template = stage.custom_template or DEFAULT_PROMPT_TEMPLATE
         return template.format(
             intent_router_tool=self.name,
-            stage_name=self.current_stage_name,
+            stage_name=stage_name,
             background=self.background,
-            current_goal=self.current_stage.goal,
+            current_goal=stage.goal,
             outcomes=outcomes,
             transitions=transitions,
         )
 
-    def get_external_transitions(self):
+    def get_external_transitions(self, stage_name: Optional[str] = None):
         """
-        Return a list of all the stages that can be reached from the current stage that are not direct connections.
+        Return a list of all the stages that can be reached from the given stage that are not direct connections.
+
+        Args:
+            stage_name: the stage to start from. Defaults to the current stage.
         """
+        stage_name = stage_name or self.current_stage_name
         return [
             name
             for name, stage in self.stages.items()
-            if (
-                (self.current_stage_name in stage.accessible_from or "_all_" in stage.accessible_from)
-                and name != self.current_stage_name
-            )
+            if ((stage_name in stage.accessible_from or "_all_" in stage.accessible_from) and name != stage_name)
         ]
 
+    def index_outcomes(self, stage_names: Optional[List[str]] = None) -> None:
+        """
+        Build the index of the outcomes and indirect transitions available in each stage, used to resolve the outcome
+        given by the LLM. Must be called again if the stages change.
+
+        Args:
+            stage_names: the stages to index. Defaults to all stages.
+        """
+        for name in stage_names or list(self.stages):
+            self.outcome_resolvers[name] = OutcomeResolver(
+                [*self.stages[name].outcomes, *self.get_external_transitions(name)],
+                threshold=self.outcome_match_threshold,
+            )
+
+    def count_stage_tokens(self, stage_names: Optional[List[str]] = None) -> None:
+        """
+        Count the tokens taken by the prompt and the tools of each stage and cache them on the stage.
+        If a `context_window` is configured, warns about stages whose prompt and tools alone take more than
+        `max_prompt_share` of it. Must be called again if the stages change.
+
+        Args:
+            stage_names: the stages to count the tokens of. Defaults to all stages.
+        """
+        for name in stage_names or list(self.stages):
+            stage = self.stages[name]
+            if isinstance(stage, SubConversationStage):
+                # Never used as a prompt: the conversation moves directly into the sub-conversation
+                continue
+            stage.prompt_tokens = self.tokenizer.count_tokens(self.get_prompt(name))
+            # Counted without creating the tools that are still pending
+            tools = stage.tools.peek_values() if isinstance(stage.tools, LazyTools) else stage.tools.values()
+            stage.tools_tokens = sum(self.tokenizer.count_tokens(tool_schema_text(tool)) for tool in tools)
+            if self.context_window and stage.total_tokens > self.context_window * self.max_prompt_share:
+                log.warning(
+                    "The prompt and tools of stage '%s' take %s tokens, more than %s%% of the context window.",
+                    name,
+                    stage.total_tokens,
+                    round(self.max_prompt_share * 100),
+                    stage_name=name,
+                    stage_tokens=stage.total_tokens,
+                    context_window=self.context_window,
+                )
+
 
 class Stage:
     """
@@ -202,9 +406,33 @@ class Stage:
         self.accessible_from = config.get("accessible_from", [])
         if isinstance(self.accessible_from, str):
             self.accessible_from = [self.accessible_from]
-        self.tools = load_tools_from_dict(config.get("tools", {}))
+        # Tools are created when the stage is first entered, but their configuration is validated now
+        self.tools = load_tools_from_dict(config.get("tools", {}), lazy=True)
         self.outcomes = config.get("outcomes", {})
 
+        # Filled by the intent router once the whole graph is known
+        self.prompt_tokens: Optional[int] = None
+        self.tools_tokens: Optional[int] = None
+
+        self.validate(stage_name)
+
+        log.debug(
+            "Stage loaded",
+            custom_template=self.custom_template,
+            stage_goal=self.goal,
+            stage_description=self.description,
+            stage_accessible_from=self.accessible_from,
+            stage_tools=self.tools,
+            outcomes=self.outcomes,
+        )
+
+    def validate(self, stage_name: str) -> None:
+        """
+        Make sure the stage's configuration is complete.
+
+        Args:
+            stage_name: the name of the stage, for the error messages.
+        """
         # If a custom template is given, nothing else is strictly needed
         if not self.custom_template:
             # Make sure the stage has a goal
@@ -223,12 +451,148 @@ class Stage:
             if "move_to" not in outcome:
                 raise ValueError(f"Outcome '{name}' in stage '{stage_name}' is missing a 'move_to' field.")
 
-        log.debug(
-            "Stage loaded",
-            custom_template=self.custom_template,
-            stage_goal=self.goal,
-            stage_description=self.description,
-            stage_accessible_from=self.accessible_from,
-            stage_tools=self.tools,
-            outcomes=self.outcomes,
+    @property
+    def total_tokens(self) -> Optional[int]:
+        """
+        The tokens taken by the prompt and the tools of this stage, if they were counted.
+        """
+        if self.prompt_tokens is None or self.tools_tokens is None:
+            return None
+        return self.prompt_tokens + self.tools_tokens
+
+
+class SubConversationStage(Stage):
+    """
+    Stage that stands for a whole sub-conversation defined in a separate file. The sub-conversation is parsed and
+    loaded only the first time the conversation enters this stage.
+    """
+
+    def __init__(self, stage_name, config: Dict[str, Any], base_path: Path) -> None:
+        self.conversation_file = (Path(base_path) / config["conversation_file"]).resolve()
+        self.initial_stage: Optional[str] = None
+        """ Name of the start stage of the sub-conversation, once loaded. """
+        super().__init__(stage_name, {"goal": f"Complete the sub-conversation '{stage_name}'", **config})
+
+    def validate(self, stage_name: str) -> None:
+        """
+        Make sure the stage's configuration is complete and that the sub-conversation file exists.
+
+        Args:
+            stage_name: the name of the stage, for the error messages.
+        """
+        if not self.conversation_file.is_file():
+            raise ValueError(f"Sub-conversation file '{self.conversation_file}' of stage '{stage_name}' not found.")
+        super().validate(stage_name)
+
+    def exit_target(self, stage_name: str, outcome_name: str) -> str:
+        """
+        Find where the conversation should move to when the sub-conversation ends with the given outcome.
+
+        Args:
+            stage_name: the name of this stage, for the error messages.
+            outcome_name: the name of the outcome that ends the sub-conversation.
+
+        Returns:
+            The name of the stage to move to.
+        """
+        if outcome_name in self.outcomes:
+            return self.outcomes[outcome_name]["move_to"]
+        if len(self.outcomes) == 1:
+            return next(iter(self.outcomes.values()))["move_to"]
+        raise ValueError(
+            f"Outcome '{outcome_name}' ends the sub-conversation '{stage_name}', but stage '{stage_name}' has no "
+            "outcome with the same name."
         )
+
+
+@dataclass
+class CompiledSubConversation:
+    """
+    The stages of a sub-conversation, ready to be added to a router.
+    """
+
+    stages: Dict[str, Dict[str, Any]]
+    """ The configuration of each stage, by its name in the router. Don't modify them, make a copy instead. """
+    initial_stage: str
+    """ The name in the router of the start stage of the sub-conversation. """
+
+
+def compile_subconversation(stage_name: str, stage: "SubConversationStage") -> CompiledSubConversation:
+    """
+    Read a sub-conversation file and rewrite its stages for the router. The stages are named after the stage that
+    references the sub-conversation, like `stage_name/sub_stage_name`. Reads the file if it's not cached yet, so it
+    blocks.
+
+    Sub-conversations are self-contained: `accessible_from` can only refer to stages of the same sub-conversation,
+    and `_all_` means all the stages of the sub-conversation. Outcomes can only move to stages of the same
+    sub-conversation, backtrack, or move to `_end_` to leave the sub-conversation: they then move where the outcome
+    with the same name of the referencing stage moves to, or where its only outcome does. Outcomes can't move to the
+    stages of the parent conversation directly, because those stages may have been pruned when the parent was loaded.
+
+    Args:
+        stage_name: the name of the stage that references the sub-conversation.
+        stage: the stage that references the sub-conversation.
+
+    Returns:
+        The compiled sub-conversation.
+    """
+    sub_stages = load_subconversation_file(stage.conversation_file)
+    prefix = stage_name + SUBCONVERSATION_SEPARATOR
+    new_names = [prefix + sub_name for sub_name in sub_stages]
+
+    initial_stage = ""
+    stages: Dict[str, Dict[str, Any]] = {}
+    for sub_name, sub_config in sub_stages.items():
+        sub_config = copy.deepcopy(sub_config)
+
+        accessible_from = sub_config.get("accessible_from", [])
+        if isinstance(accessible_from, str):
+            accessible_from = [accessible_from]
+        if START_CONNECTION in accessible_from:
+            if initial_stage:
+                raise ValueError(f"Multiple start stages found in sub-conversation '{stage_name}'!")
+            initial_stage = prefix + sub_name
+        if "_all_" in accessible_from:
+            sub_config["accessible_from"] = [name for name in new_names if name != prefix + sub_name]
+        else:
+            sub_config["accessible_from"] = [prefix + name for name in accessible_from if name in sub_stages]
+
+        for outcome_name, outcome in sub_config.get("outcomes", {}).items():
+            if outcome.get("move_to") == "_end_":
+                outcome["move_to"] = stage.exit_target(stage_name, outcome_name)
+            elif outcome.get("move_to") in sub_stages:
+                outcome["move_to"] = prefix + outcome["move_to"]
+            elif outcome.get("move_to") != BACKTRACKING_CONNECTION:
+                raise ValueError(
+                    f"Outcome '{outcome_name}' of stage '{sub_name}' in sub-conversation '{stage_name}' moves to "
+                    f"'{outcome.get('move_to')}', which is not a stage of the sub-conversation. To leave the "
+                    "sub-conversation, move to '_end_' and add the outcome to the referencing stage."
+                )
+
+        stages[prefix + sub_name] = sub_config
+
+    if not initial_stage:
+        raise ValueError(f"No start stage found in sub-conversation '{stage_name}'!")
+    return CompiledSubConversation(stages=stages, initial_stage=initial_stage)
+
+
+def load_subconversation_file(path: Path) -> Dict[str, Any]:
+    """
+    Parse a sub-conversation file, or return it from the cache if it was already parsed by any router.
+    The file may contain either a full configuration with a `conversation` block, or just the conversation block.
+
+    Args:
+        path: the path to the sub-conversation file.
+
+    Returns:
+        The configuration of the stages of the sub-conversation. Don't modify it, make a copy instead.
+    """
+    if path not in _SUBCONVERSATIONS:
+        log.debug("Parsing sub-conversation file", conversation_file=path)
+        with open(path, "r", encoding="utf-8") as file:
+            config = yaml.safe_load(file) or {}
+        config = config.get("conversation", config)
+        if not config.get("stages"):
+            raise ValueError(f"The sub-conversation in '{path}' must have at least one stage.")
+        _SUBCONVERSATIONS[path] = config["stages"]
+    return _SUBCONVERSATIONS[path]
@@ -3,13 +3,13 @@
 """
 Functions to load LLM client classes from config files.
 """
-from typing import Optional, Dict, Any, Set, TYPE_CHECKING
+from typing import Optional, Dict, Any, TYPE_CHECKING
 
 from abc import ABC, abstractmethod
 
 import structlog
 
-from intentional_core.utils import inheritors
+from intentional_core.utils import register_class
 from intentional_core.events import EventEmitter
 from intentional_core.intent_routing import IntentRouter
 
@@ -38,6 +38,7 @@ KNOWN_LLM_EVENTS = [
     "on_user_speech_transcribed",
     "on_llm_speech_transcribed",
     "on_tool_invoked",
+    "on_tool_progress",
     "on_conversation_ended",
 ]
 
@@ -56,6 +57,13 @@ class LLMClient(ABC, EventEmitter):
     This string will be used in configuration files to identify the type of client to serve a LLM from.
     """
 
+    def __init_subclass__(cls, **kwargs) -> None:
+        """
+        Register every subclass as soon as it's defined, so that it can be found by its `name`.
+        """
+        super().__init_subclass__(**kwargs)
+        register_class(_LLM_CLIENTS, cls, cls.name, "LLM client", key_name="name")
+
     def __init__(self, parent: "BotStructure", intent_router: IntentRouter) -> None:
         """
         Initialize the LLM client.
@@ -70,6 +78,7 @@ class LLMClient(ABC, EventEmitter):
         """
         Connect to the LLM.
         """
+        self.intent_router.prefetch_tools()
         await self.emit("on_llm_connection", {})
 
     async def disconnect(self) -> None:
@@ -113,28 +122,6 @@ def load_llm_client_from_dict(parent: "BotStructure", intent_router: IntentRoute
     Returns:
         The LLMClient instance.
     """
-    # Get all the subclasses of LLMClient
-    subclasses: Set[LLMClient] = inheritors(LLMClient)
-    log.debug("Collected LLM client classes", llm_client_classes=subclasses)
-    for subclass in subclasses:
-        if not subclass.name:
-            log.error(
-                "LLM client class '%s' does not have a name. This LLM client type will not be usable.",
-                subclass,
-                llm_client_class=subclass,
-            )
-            continue
-
-        if subclass.name in _LLM_CLIENTS:
-            log.warning(
-                "Duplicate LLM client type '%s' found. The older class will be replaced by the newly imported one.",
-                subclass.name,
-                old_llm_client_name=subclass.name,
-                old_llm_client_class=_LLM_CLIENTS[subclass.name],
-                new_llm_client_class=subclass,
-            )
-        _LLM_CLIENTS[subclass.name] = subclass
-
     # Identify the type of bot and see if it's known
     llm_client_class = config.pop("client")
     log.debug("Creating LLM client", llm_client_class=llm_client_class)
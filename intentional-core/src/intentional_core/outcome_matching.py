@@ -0,0 +1,116 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Tolerant matching of the outcomes given by the LLM to the intent router.
+
+LLMs sometimes call the intent router with an outcome that is almost right: different casing, spaces instead of
+underscores, a small typo. Resolving these near misses locally saves a failed tool call and a full LLM round trip.
+"""
+
+from typing import Dict, Iterable, Optional
+
+import re
+import structlog
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+DEFAULT_MATCH_THRESHOLD = 0.8
+""" Minimum similarity (between 0 and 1) an outcome must have to be matched by edit distance. """
+
+_SEPARATORS = re.compile(r"[\s\-_.]+")
+
+
+def normalize_outcome(outcome: str) -> str:
+    """
+    Normalizes an outcome name: case-folds it and collapses whitespace, dashes, dots and underscores into a single
+    underscore.
+
+    Args:
+        outcome: the outcome name to normalize.
+
+    Returns:
+        The normalized outcome name.
+    """
+    return _SEPARATORS.sub("_", outcome.casefold()).strip("_")
+
+
+def edit_distance(first: str, second: str) -> int:
+    """
+    Levenshtein distance between two strings.
+
+    Args:
+        first: the first string.
+        second: the second string.
+
+    Returns:
+        The minimum number of insertions, deletions and substitutions that turn one string into the other.
+    """
+    if len(first) < len(second):
+        first, second = second, first
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, start=1):
+        current = [i]
+        for j, second_char in enumerate(second, start=1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (first_char != second_char),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+class OutcomeResolver:
+    """
+    Precomputed index of the outcomes available in a stage, used to resolve the outcome given by the LLM.
+    """
+
+    def __init__(self, outcomes: Iterable[str], threshold: float = DEFAULT_MATCH_THRESHOLD) -> None:
+        """
+        Args:
+            outcomes: all the outcomes the LLM can choose from, including indirect transitions.
+            threshold: the minimum similarity required to match an outcome by edit distance.
+        """
+        self.outcomes = set(outcomes)
+        self.threshold = threshold
+        self.index: Dict[str, Optional[str]] = {}
+        for outcome in self.outcomes:
+            key = normalize_outcome(outcome)
+            # Outcomes that normalize to the same key are ambiguous and can only be matched exactly
+            self.index[key] = None if key in self.index else outcome
+
+    def resolve(self, outcome: str) -> Optional[str]:
+        """
+        Finds the outcome the LLM meant.
+
+        Args:
+            outcome: the outcome given by the LLM.
+
+        Returns:
+            The name of the matching outcome, or None if no outcome matches with enough confidence.
+        """
+        if outcome in self.outcomes:
+            return outcome
+
+        key = normalize_outcome(outcome)
+        if key in self.index:
+            return self.index[key]
+
+        best_match, best_score, runner_up_score = None, 0.0, 0.0
+        for candidate, original in self.index.items():
+            if original is None:
+                continue
+            score = 1 - edit_distance(key, candidate) / max(len(key), len(candidate), 1)
+            if score > best_score:
+                best_match, best_score, runner_up_score = original, score, best_score
+            elif score > runner_up_score:
+                runner_up_score = score
+
+        if best_score >= self.threshold and best_score > runner_up_score:
+            log.debug("Outcome matched by edit distance", outcome=outcome, matched_outcome=best_match, score=best_score)
+            return best_match
+        return None
@@ -0,0 +1,310 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Matrix-based analysis of the paths a conversation can take through the stage graph.
+
+The conversation is modelled as an absorbing Markov chain: each stage is a state, each outcome or indirect transition
+is a move with a given probability, and `_end_` (together with any stage that has no way out) is absorbing. From the
+transition matrix we compute how many turns a conversation takes on average before ending, how likely it is to ever
+visit each stage and how many times it visits each stage.
+
+Requires NumPy: install it with `pip install intentional-core[analysis]`.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+from dataclasses import dataclass
+
+import structlog
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+if TYPE_CHECKING:
+    from intentional_core.intent_routing import IntentRouter
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+@dataclass
+class TransitionMatrix:
+    """
+    The transition matrix of a conversation. Row `i` holds the probability of moving from `stages[i]` to each other
+    stage in one turn. Absorbing stages have a probability of 1 of moving to themselves.
+    """
+
+    stages: List[str]
+    matrix: Any
+    initial_stage: str
+
+    @property
+    def absorbing_stages(self) -> List[str]:
+        """
+        The stages the conversation can't leave once it reaches them, such as `_end_`.
+        """
+        diagonal = numpy.diagonal(self.matrix)
+        return [stage for index, stage in enumerate(self.stages) if diagonal[index] == 1.0]
+
+
+@dataclass
+class PathAnalysis:
+    """
+    The result of the path analysis of a conversation, starting from its initial stage.
+    """
+
+    initial_stage: str
+    expected_turns: float
+    """ Expected number of turns (stage transitions) before the conversation reaches an absorbing stage. """
+    expected_turns_by_stage: Dict[str, float]
+    """ Same as `expected_turns`, but starting from each non-absorbing stage. """
+    hitting_probabilities: Dict[str, float]
+    """ Probability of ever visiting each stage. """
+    occupancy: Dict[str, float]
+    """ Expected number of turns spent in each non-absorbing stage. """
+    end_probability: float
+    """ Probability that the conversation reaches `_end_` rather than getting stuck in a stage with no way out. """
+
+
+def _require_numpy() -> None:
+    """
+    Raise a helpful error if NumPy is not installed.
+    """
+    if numpy is None:
+        raise ImportError("Path analysis requires NumPy. Install it with 'pip install intentional-core[analysis]'.")
+
+
+def stage_moves(intent_router: "IntentRouter") -> Dict[str, Dict[str, List[str]]]:
+    """
+    Lists all the moves the LLM can choose from in each stage, keyed by the name the LLM would give to the intent
+    router (an outcome name, or the name of a stage reachable through an indirect transition).
+
+    Backtracking can't be modelled exactly by a Markov chain, because it depends on the history of the conversation.
+    It's approximated by assuming that a backtracking outcome leads back, with equal probability, to any of the stages
+    that can reach the current one through an indirect transition.
+
+    Args:
+        intent_router: the intent router to analyze.
+
+    Returns:
+        A dictionary mapping each stage to its moves, and each move to the list of stages it may lead to.
+    """
+    # Imported here to avoid a circular import
+    from intentional_core.intent_routing import BACKTRACKING_CONNECTION  # pylint: disable=import-outside-toplevel
+
+    indirect_origins: Dict[str, List[str]] = {name: [] for name in intent_router.stages}
+    for name, stage in intent_router.stages.items():
+        if "_all_" in stage.accessible_from:
+            origins = [origin for origin in intent_router.stages if origin not in (name, "_end_")]
+        else:
+            origins = [origin for origin in stage.accessible_from if origin in intent_router.stages and origin != name]
+        for origin in origins:
+            indirect_origins[origin].append(name)
+
+    moves = {}
+    for name, stage in intent_router.stages.items():
+        moves[name] = {}
+        for outcome_name, outcome in stage.outcomes.items():
+            if outcome["move_to"] == BACKTRACKING_CONNECTION:
+                targets = [origin for origin, reachable in indirect_origins.items() if name in reachable]
+                if targets:
+                    moves[name][outcome_name] = targets
+            else:
+                moves[name][outcome_name] = [outcome["move_to"]]
+        for target in indirect_origins[name]:
+            moves[name].setdefault(target, [target])
+    return moves
+
+
+def transition_matrices(  # pylint: disable=too-many-locals
+    intent_router: "IntentRouter", scenarios: Sequence[Optional[Dict[str, Dict[str, float]]]]
+) -> List[TransitionMatrix]:
+    """
+    Builds one transition matrix for each probability scenario of the same conversation.
+
+    Args:
+        intent_router: the intent router to analyze.
+        scenarios: a list of dictionaries mapping each stage to the relative weight of each of its moves, such as
+            `{"ask_for_name": {"name_given": 0.9, "questions": 0.1}}`. Moves that are not listed for a stage get a
+            weight of zero. Stages that are not listed choose uniformly among all their moves. `None` means uniform
+            probabilities for all stages.
+
+    Returns:
+        The list of transition matrices, in the same order as the scenarios.
+    """
+    _require_numpy()
+    moves = stage_moves(intent_router)
+    stages = list(intent_router.stages)
+    index = {name: position for position, name in enumerate(stages)}
+
+    matrices = []
+    for scenario in scenarios:
+        scenario = scenario or {}
+        unknown_stages = set(scenario) - set(stages)
+        if unknown_stages:
+            raise ValueError(f"Unknown stages in the probability scenario: {sorted(unknown_stages)}")
+
+        matrix = numpy.zeros((len(stages), len(stages)))
+        for name, available in moves.items():
+            weights = scenario.get(name, {move: 1.0 for move in available})
+            unknown_moves = set(weights) - set(available)
+            if unknown_moves:
+                raise ValueError(f"Unknown moves for stage '{name}': {sorted(unknown_moves)}")
+            total = sum(weights.values())
+            if name == "_end_" or total <= 0:
+                # Absorbing stage
+                matrix[index[name], index[name]] = 1.0
+                continue
+            for move, weight in weights.items():
+                targets = available[move]
+                for target in targets:
+                    matrix[index[name], index[target]] += weight / total / len(targets)
+        matrices.append(TransitionMatrix(stages=stages, matrix=matrix, initial_stage=intent_router.initial_stage))
+    return matrices
+
+
+def transition_matrix(
+    intent_router: "IntentRouter", probabilities: Optional[Dict[str, Dict[str, float]]] = None
+) -> TransitionMatrix:
+    """
+    Builds the transition matrix of a conversation. See `transition_matrices` for the format of `probabilities`.
+
+    Args:
+        intent_router: the intent router to analyze.
+        probabilities: the relative weight of each move of each stage. Defaults to uniform probabilities.
+
+    Returns:
+        The transition matrix.
+    """
+    return transition_matrices(intent_router, [probabilities])[0]
+
+
+def _check_every_stage_can_end(transition: TransitionMatrix, transient: List[int], absorbing: List[int]) -> None:
+    """
+    Raises if some transient stages can't reach any absorbing stage, whatever the path. The conversation would loop
+    among them forever, so the expected length of the conversations passing through them is infinite.
+
+    Checked before solving: with inexact weights, I - Q is not exactly singular and solving it would return nonsense.
+    """
+    can_end = set(absorbing)
+    frontier = list(absorbing)
+    while frontier:
+        target = frontier.pop()
+        for origin in transient:
+            if origin not in can_end and transition.matrix[origin, target] > 0:
+                can_end.add(origin)
+                frontier.append(origin)
+    trapped = [transition.stages[i] for i in transient if i not in can_end]
+    if trapped:
+        raise ValueError(
+            f"The conversation starting at '{transition.initial_stage}' contains a loop that can never be left: "
+            f"the stages {trapped} can't reach any end, so its expected length is infinite."
+        )
+
+
+def _split_transient(transition: TransitionMatrix) -> Tuple[List[int], List[int]]:
+    """
+    Returns the indices of the transient and of the absorbing stages of a transition matrix. Raises if some
+    transient stages can never reach an absorbing one.
+    """
+    absorbing = set(transition.absorbing_stages)
+    transient = [i for i, stage in enumerate(transition.stages) if stage not in absorbing]
+    absorbing_indices = [i for i, stage in enumerate(transition.stages) if stage in absorbing]
+    _check_every_stage_can_end(transition, transient, absorbing_indices)
+    return transient, absorbing_indices
+
+
+def analyze_paths(transitions: Sequence[TransitionMatrix]) -> List[PathAnalysis]:  # pylint: disable=too-many-locals
+    """
+    Analyzes many transition matrices in one vectorized batch. The matrices can describe different conversations or
+    different probability scenarios of the same conversation, and don't need to have the same size.
+
+    Args:
+        transitions: the transition matrices to analyze.
+
+    Returns:
+        The analysis of each transition matrix, in the same order.
+
+    Raises:
+        ValueError: if a conversation contains stages that can never reach an absorbing stage.
+    """
+    _require_numpy()
+    if not transitions:
+        return []
+
+    splits = [_split_transient(transition) for transition in transitions]
+    size = max(max(len(transient), 1) for transient, _ in splits)
+    absorbing_size = max(max(len(absorbing), 1) for _, absorbing in splits)
+
+    # Pad every chain to the same number of transient and absorbing states. Padding states are never entered, so
+    # they don't change the result.
+    batch_q = numpy.zeros((len(transitions), size, size))
+    batch_r = numpy.zeros((len(transitions), size, absorbing_size))
+    for position, (transition, (transient, absorbing)) in enumerate(zip(transitions, splits)):
+        batch_q[position, : len(transient), : len(transient)] = transition.matrix[numpy.ix_(transient, transient)]
+        batch_r[position, : len(transient), : len(absorbing)] = transition.matrix[numpy.ix_(transient, absorbing)]
+
+    # Fundamental matrix N = (I - Q)^-1: N[i, j] is the expected number of visits to j when starting from i.
+    identity = numpy.broadcast_to(numpy.eye(size), batch_q.shape)
+    try:
+        fundamental = numpy.linalg.solve(identity - batch_q, identity)
+    except numpy.linalg.LinAlgError as exc:
+        raise ValueError(
+            "At least one conversation contains a loop that can never be left: its expected length is infinite."
+        ) from exc
+    expected_turns = fundamental.sum(axis=-1)
+    absorption = fundamental @ batch_r
+
+    results = []
+    for position, (transition, (transient, absorbing)) in enumerate(zip(transitions, splits)):
+        stages = transition.stages
+        local = {stages[i]: j for j, i in enumerate(transient)}
+        occupancy, hitting, turns_by_stage = {}, {}, {}
+        start = local.get(transition.initial_stage)
+
+        for stage, j in local.items():
+            turns_by_stage[stage] = float(expected_turns[position, j])
+            if start is None:
+                occupancy[stage], hitting[stage] = 0.0, 0.0
+                continue
+            occupancy[stage] = float(fundamental[position, start, j])
+            if j == start:
+                hitting[stage] = 1.0
+            else:
+                hitting[stage] = float(fundamental[position, start, j] / fundamental[position, j, j])
+
+        end_probability = 0.0
+        for k, i in enumerate(absorbing):
+            if start is None:
+                hitting[stages[i]] = 1.0 if stages[i] == transition.initial_stage else 0.0
+            else:
+                hitting[stages[i]] = float(absorption[position, start, k])
+            if stages[i] == "_end_":
+                end_probability = hitting[stages[i]]
+
+        results.append(
+            PathAnalysis(
+                initial_stage=transition.initial_stage,
+                expected_turns=turns_by_stage.get(transition.initial_stage, 0.0),
+                expected_turns_by_stage=turns_by_stage,
+                hitting_probabilities={stage: hitting[stage] for stage in stages},
+                occupancy=occupancy,
+                end_probability=end_probability,
+            )
+        )
+    log.debug("Path analysis completed", analyzed_conversations=len(results))
+    return results
+
+
+def analyze_path(transition: TransitionMatrix) -> PathAnalysis:
+    """
+    Analyzes a single transition matrix. See `analyze_paths` to analyze many of them at once.
+
+    Args:
+        transition: the transition matrix to analyze.
+
+    Returns:
+        The analysis of the transition matrix.
+    """
+    return analyze_paths([transition])[0]
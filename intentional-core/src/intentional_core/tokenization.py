@@ -0,0 +1,159 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Pluggable tokenizers, used to estimate how much of the context window prompts and tools take.
+"""
+
+from typing import Any, Dict, Optional, TYPE_CHECKING
+
+import json
+import math
+from abc import ABC, abstractmethod
+
+import structlog
+
+from intentional_core.utils import register_class
+
+if TYPE_CHECKING:
+    from intentional_core.tools import Tool
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+_TOKENIZERS = {}
+""" This is a global dictionary that maps tokenizer names to their classes """
+
+
+class Tokenizer(ABC):
+    """
+    Tiny base class used to recognize Intentional tokenizers.
+
+    In order for your tokenizer to be usable, you need to assign a value to the `name` class variable in the class
+    definition.
+    """
+
+    name: Optional[str] = None
+    """
+    The name of the tokenizer. This string will be used in configuration files to identify the tokenizer.
+    """
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """
+        Register every subclass as soon as it's defined, so that it can be found by its `name`.
+        """
+        super().__init_subclass__(**kwargs)
+        register_class(_TOKENIZERS, cls, cls.name, "tokenizer", key_name="name")
+
+    @abstractmethod
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the tokens in the given text.
+
+        Args:
+            text: the text to tokenize.
+
+        Returns:
+            The number of tokens.
+        """
+
+
+class ApproximateTokenizer(Tokenizer):
+    """
+    Tokenizer that estimates the token count from the length of the text. Needs no dependencies and is good enough to
+    spot oversized prompts, but it's not exact.
+    """
+
+    name = "approximate"
+
+    def __init__(self, chars_per_token: float = 4.0) -> None:
+        """
+        Args:
+            chars_per_token: the average number of characters in a token.
+        """
+        self.chars_per_token = chars_per_token
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Estimate the tokens in the given text.
+        """
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """
+    Exact tokenizer for OpenAI models. Requires `tiktoken` to be installed.
+    """
+
+    name = "tiktoken"
+
+    def __init__(self, model: str = "gpt-4o") -> None:
+        """
+        Args:
+            model: the name of the model whose encoding should be used.
+        """
+        try:
+            import tiktoken  # pylint: disable=import-outside-toplevel
+        except ImportError as exc:
+            raise ImportError(
+                "The 'tiktoken' tokenizer requires tiktoken. Install it with 'pip install tiktoken'."
+            ) from exc
+        self.encoding = tiktoken.encoding_for_model(model)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the tokens in the given text.
+        """
+        return len(self.encoding.encode(text))
+
+
+def tool_schema_text(tool: "Tool") -> str:
+    """
+    Serializes the definition of a tool in a provider-agnostic way, to estimate how many tokens it takes.
+
+    Args:
+        tool: the tool to serialize.
+
+    Returns:
+        A JSON string with the tool's name, description and parameters.
+    """
+    return json.dumps(
+        {
+            "name": tool.name,
+            "description": tool.description,
+            "parameters": [
+                {
+                    "name": param.name,
+                    "description": param.description,
+                    "type": param.type,
+                    "required": param.required,
+                    "default": param.default,
+                }
+                for param in tool.parameters
+            ],
+        },
+        default=str,
+    )
+
+
+def load_tokenizer_from_dict(config: Optional[Dict[str, Any]] = None) -> Tokenizer:
+    """
+    Load a tokenizer from a dictionary configuration.
+
+    Args:
+        config: The configuration dictionary. Defaults to the approximate tokenizer.
+
+    Returns:
+        The Tokenizer instance.
+    """
+    config = dict(config or {"type": ApproximateTokenizer.name})
+
+    # Identify the type of tokenizer and see if it's known
+    tokenizer_class = config.pop("type", ApproximateTokenizer.name)
+    log.debug("Creating tokenizer", tokenizer_class=tokenizer_class)
+    if tokenizer_class not in _TOKENIZERS:
+        raise ValueError(
+            f"Unknown tokenizer type '{tokenizer_class}'. Available types: {list(_TOKENIZERS)}. "
+            "Did you forget to install your plugin?"
+        )
+    return _TOKENIZERS[tokenizer_class](**config)
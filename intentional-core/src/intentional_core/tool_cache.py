@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Opt-in cache for the results of tools that are pure functions of their arguments, at least for a short time.
+"""
+
+from typing import Any, Dict, Hashable, Optional, Tuple, Union, TYPE_CHECKING
+
+import copy
+import json
+import time
+from collections import OrderedDict
+
+import structlog
+
+if TYPE_CHECKING:
+    from intentional_core.tools import Tool
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+_SHARED_CACHES = {}
+""" This is a global dictionary that maps tool ids to the caches shared by all the instances of that tool """
+
+
+class ToolResultCache:
+    """
+    Cache of tool results with a time-to-live and least-recently-used eviction.
+
+    Results are stored and returned as copies, so callers that modify a result don't change what the next callers
+    get. Results that can't be copied are not cached.
+    """
+
+    def __init__(self, ttl: Optional[float] = 60, max_size: int = 1024) -> None:
+        """
+        Args:
+            ttl: how many seconds a result stays valid. `None` means results never expire.
+            max_size: how many results to keep at most. The least recently used are evicted first.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[Hashable, Tuple[Optional[float], Any]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def make_key(tool: "Tool", params: Optional[Dict[str, Any]]) -> Hashable:
+        """
+        Build the cache key of a tool call from the tool's identity, its configuration and its normalized arguments,
+        so that differently configured instances of a tool never share results, even in a shared cache.
+
+        Args:
+            tool: the tool being called.
+            params: the arguments of the call.
+
+        Returns:
+            A hashable key.
+        """
+        return (
+            tool.id,
+            json.dumps(tool.init_config or {}, sort_keys=True, default=str),
+            tool.name,
+            json.dumps(params or {}, sort_keys=True, separators=(",", ":"), default=str),
+        )
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Look up a result.
+
+        Args:
+            key: the key of the tool call.
+
+        Returns:
+            A tuple with a boolean telling whether a valid result was found, and the result.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Store a result, evicting the least recently used ones if the cache is full.
+
+        Args:
+            key: the key of the tool call.
+            value: the result of the tool call.
+        """
+        try:
+            value = copy.deepcopy(value)
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.debug("Tool result can't be copied, not caching it", key=key, exc_info=True)
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drop all the cached results.
+        """
+        self._entries.clear()
+
+
+def load_tool_cache_from_dict(tool: "Tool", config: Union[bool, Dict[str, Any]]) -> Optional[ToolResultCache]:
+    """
+    Create the cache of a tool from the `cache` field of its configuration.
+
+    Args:
+        tool: the tool to cache the results of.
+        config: either `true`, to use the default settings, or a dictionary with `ttl` (seconds, default 60),
+            `max_size` (default 1024) and `shared` (default false). Shared caches are used by all the instances of
+            the tool in the process, for example by the same tool in different stages.
+
+    Returns:
+        The cache, or None if caching is disabled.
+
+    Raises:
+        ValueError: if the cache is shared and another instance of the tool configured it with a different `ttl` or
+            `max_size`.
+    """
+    if not config:
+        return None
+    config = {} if config is True else dict(config)
+    shared = config.pop("shared", False)
+    cache = ToolResultCache(**config)
+    if shared and tool.id in _SHARED_CACHES:
+        shared_cache = _SHARED_CACHES[tool.id]
+        if (shared_cache.ttl, shared_cache.max_size) != (cache.ttl, cache.max_size):
+            raise ValueError(
+                f"The shared cache of tool '{tool.id}' is configured with ttl={shared_cache.ttl} and "
+                f"max_size={shared_cache.max_size}, but another instance of the tool asks for ttl={cache.ttl} and "
+                f"max_size={cache.max_size}. Give all instances the same settings, or don't share the cache."
+            )
+        return shared_cache
+
+    log.debug("Creating tool cache", tool_id=tool.id, cache_config=config, shared=shared)
+    if shared:
+        _SHARED_CACHES[tool.id] = cache
+    return cache
@@ -0,0 +1,330 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Executors used to run tools away from the event loop.
+
+Tools with a synchronous `run` method, such as the ones wrapping blocking client libraries, would stall every session
+in the process if they ran on the event loop. They run in a bounded, process-wide thread pool instead.
+
+CPU-bound tools hold the GIL and would stall the event loop even from a thread. Tools configured with
+`execution: process` run in a pool of worker processes, where each worker keeps its own warm instance of the tool.
+"""
+
+from typing import Any, Callable, Dict, Optional, Tuple, TYPE_CHECKING
+
+import json
+import asyncio
+import os
+import threading
+import multiprocessing
+import concurrent.futures
+
+import structlog
+
+from intentional_core.tool_http import configure_http_client, close_http_client
+from intentional_core.tool_metrics import set_slow_call_threshold
+from intentional_core.tool_sandbox import configure_sandbox_pool, close_sandbox_pool
+
+if TYPE_CHECKING:
+    from intentional_core.tools import Tool
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+_THREAD_POOL: Optional["ToolThreadPool"] = None
+""" The thread pool shared by all the synchronous tools of the process. Created on first use. """
+
+_THREAD_POOL_CONFIG: Dict[str, Any] = {}
+""" The configuration the thread pool will be created with. """
+
+_PROCESS_POOL: Optional["ToolProcessPool"] = None
+""" The process pool shared by all the tools configured with `execution: process`. Created on first use. """
+
+_PROCESS_POOL_CONFIG: Dict[str, Any] = {}
+""" The configuration the process pool will be created with. """
+
+_WORKER_TOOLS: Dict[Tuple[type, str], "Tool"] = {}
+""" The tool instances living in a worker process, keyed by tool class and configuration. """
+
+EXECUTION_MODES = ("auto", "thread", "process", "sandbox")
+"""
+The values accepted by the `execution` field of a tool's configuration:
+
+- `auto`: coroutines run on the event loop, regular methods in the thread pool.
+- `thread`: the tool always runs in the thread pool. Only for regular methods.
+- `process`: the tool runs in the process pool. Only for regular methods.
+- `sandbox`: the tool runs in an isolated worker subprocess, see `intentional_core.tool_sandbox`.
+"""
+
+
+class ToolThreadPool:
+    """
+    Bounded thread pool that runs synchronous tools and keeps track of how many calls are waiting for a thread.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        """
+        Args:
+            max_workers: the maximum number of threads. Defaults to the number of CPUs plus 4, capped at 32, which is
+                the default of Python's `ThreadPoolExecutor`.
+        """
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="intentional-tool"
+        )
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.cancelled = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        The number of calls waiting for a free thread. Calls that were just submitted and will start as soon as an idle
+        thread picks them up are not counted as waiting.
+        """
+        pending = self.submitted - self.completed - self.cancelled
+        return max(pending - self.max_workers, 0)
+
+    @property
+    def active(self) -> int:
+        """
+        The number of calls running right now.
+        """
+        return self.started - self.completed
+
+    def metrics(self) -> Dict[str, int]:
+        """
+        A snapshot of the usage of the pool.
+
+        Returns:
+            A dictionary with the size of the pool, the calls queued and running right now, the highest queue depth
+            seen so far and the total number of calls completed and cancelled while queued.
+        """
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queue_depth,
+                "active": self.active,
+                "max_queue_depth": self.max_queue_depth,
+                "completed": self.completed,
+                "cancelled": self.cancelled,
+            }
+
+    async def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a blocking function in the pool.
+
+        Cancelling the returned coroutine removes the call from the queue if it didn't start yet. Calls that are
+        already running can't be interrupted and keep their thread busy until they return.
+
+        Args:
+            function: the function to run.
+            *args: the arguments of the function.
+
+        Returns:
+            The return value of the function.
+        """
+        with self._lock:
+            self.submitted += 1
+            queue_depth = self.queue_depth
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth)
+        if queue_depth:
+            log.debug(
+                "All tool threads are busy, the call will be queued.",
+                queue_depth=queue_depth,
+                max_workers=self.max_workers,
+            )
+        future = self._executor.submit(self._track, function, *args)
+        future.add_done_callback(self._on_done)
+        return await asyncio.wrap_future(future)
+
+    def _track(self, function: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run the function in a worker thread, updating the counters.
+        """
+        with self._lock:
+            self.started += 1
+        try:
+            return function(*args)
+        finally:
+            with self._lock:
+                self.completed += 1
+
+    def _on_done(self, future: concurrent.futures.Future) -> None:
+        """
+        Count the calls that were cancelled before they could start.
+        """
+        if future.cancelled():
+            with self._lock:
+                self.cancelled += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the pool's threads.
+
+        Args:
+            wait: whether to wait for the running calls to return.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def _run_tool_in_worker(tool_class: type, tool_config: Dict[str, Any], params: Optional[Dict[str, Any]]) -> Any:
+    """
+    Run a tool in a worker process, creating the tool the first time the worker sees it.
+    """
+    key = (tool_class, json.dumps(tool_config, sort_keys=True, default=str))
+    tool = _WORKER_TOOLS.get(key)
+    if tool is None:
+        tool = _WORKER_TOOLS[key] = tool_class(**tool_config)
+    return tool.run(params)
+
+
+def _warm_up_worker() -> None:
+    """
+    No-op task, used to make the pool start its worker processes.
+    """
+
+
+class ToolProcessPool:
+    """
+    Pool of worker processes that run CPU-bound tools.
+
+    Tools are not sent to the workers: each worker builds its own instance of the tool from the tool's class and
+    configuration the first time it runs it, and keeps it for the following calls. Only the arguments and the result
+    of each call cross the process boundary, so they must be picklable. The tool class must be importable, which means
+    it can't be defined inside a function.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, start_method: str = "spawn") -> None:
+        """
+        Args:
+            max_workers: the number of worker processes. Defaults to the number of CPUs.
+            start_method: how to start the workers: `spawn`, `forkserver` or `fork`. Forking a process that runs
+                threads is unsafe, so the default is `spawn`.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.start_method = start_method
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context(start_method)
+        )
+
+    def warm_up(self) -> None:
+        """
+        Start all the worker processes now rather than on the first tool calls.
+        """
+        for _ in range(self.max_workers):
+            self._executor.submit(_warm_up_worker)
+
+    async def run_tool(self, tool: "Tool", params: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Run a tool in one of the worker processes.
+
+        Cancelling the returned coroutine removes the call from the queue if it didn't start yet. Calls that are
+        already running can't be interrupted and keep their worker busy until they return.
+
+        Args:
+            tool: the tool to run.
+            params: the arguments of the tool.
+
+        Returns:
+            The output of the tool.
+        """
+        future = self._executor.submit(_run_tool_in_worker, type(tool), tool.init_config, params)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop the worker processes.
+
+        Args:
+            wait: whether to wait for the running calls to return.
+        """
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+def configure_tool_execution(config: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Configure the executors used to run tools, from the `tool_execution` field of the bot's configuration.
+
+    Args:
+        config: a dictionary that may contain `thread_pool`, with the `max_workers` of the pool used by synchronous
+            tools, and `process_pool`, with the `max_workers` and `start_method` of the pool used by tools configured
+            with `execution: process`. It may also contain `slow_call_threshold`, the number of seconds after which a
+            tool call is logged as slow (2 by default, `null` to disable the log), and `http_client`, the settings of
+            the HTTP client shared by the tools (see `intentional_core.tool_http.SharedHTTPClient`), and
+            `sandbox_pool`, the settings of the pool used by tools configured with `execution: sandbox` (see
+            `intentional_core.tool_sandbox.ToolSandboxPool`).
+    """
+    global _THREAD_POOL, _THREAD_POOL_CONFIG, _PROCESS_POOL, _PROCESS_POOL_CONFIG  # pylint: disable=global-statement
+    config = dict(config or {})
+    thread_pool_config = dict(config.pop("thread_pool", None) or {})
+    process_pool_config = dict(config.pop("process_pool", None) or {})
+    slow_call_threshold = config.pop("slow_call_threshold", 2.0)
+    http_client_config = config.pop("http_client", None)
+    sandbox_pool_config = config.pop("sandbox_pool", None)
+    if config:
+        raise ValueError(f"Unknown tool execution options: {list(config)}")
+    set_slow_call_threshold(slow_call_threshold)
+    configure_http_client(http_client_config)
+    configure_sandbox_pool(sandbox_pool_config)
+
+    if _THREAD_POOL is not None and thread_pool_config != _THREAD_POOL_CONFIG:
+        log.debug("Replacing the tool thread pool", thread_pool_config=thread_pool_config)
+        _THREAD_POOL.shutdown(wait=False)
+        _THREAD_POOL = None
+    _THREAD_POOL_CONFIG = thread_pool_config
+
+    if _PROCESS_POOL is not None and process_pool_config != _PROCESS_POOL_CONFIG:
+        log.debug("Replacing the tool process pool", process_pool_config=process_pool_config)
+        _PROCESS_POOL.shutdown(wait=False)
+        _PROCESS_POOL = None
+    _PROCESS_POOL_CONFIG = process_pool_config
+
+
+async def close_tool_execution() -> None:
+    """
+    Release what the tools share: the connections of the HTTP client, the sandboxed workers and the worker pools.
+    Must be called when the bot shuts down. They are created again if tools run afterwards.
+    """
+    global _THREAD_POOL, _PROCESS_POOL  # pylint: disable=global-statement
+    await close_http_client()
+    await close_sandbox_pool()
+    if _THREAD_POOL is not None:
+        _THREAD_POOL.shutdown(wait=False)
+        _THREAD_POOL = None
+    if _PROCESS_POOL is not None:
+        _PROCESS_POOL.shutdown(wait=False)
+        _PROCESS_POOL = None
+
+
+def get_thread_pool() -> ToolThreadPool:
+    """
+    Get the thread pool used by synchronous tools, creating it if needed.
+
+    Returns:
+        The process-wide tool thread pool.
+    """
+    global _THREAD_POOL  # pylint: disable=global-statement
+    if _THREAD_POOL is None:
+        log.debug("Creating the tool thread pool", thread_pool_config=_THREAD_POOL_CONFIG)
+        _THREAD_POOL = ToolThreadPool(**_THREAD_POOL_CONFIG)
+    return _THREAD_POOL
+
+
+def get_process_pool() -> ToolProcessPool:
+    """
+    Get the process pool used by tools configured with `execution: process`, creating and warming it up if needed.
+
+    Returns:
+        The process-wide tool process pool.
+    """
+    global _PROCESS_POOL  # pylint: disable=global-statement
+    if _PROCESS_POOL is None:
+        log.debug("Creating the tool process pool", process_pool_config=_PROCESS_POOL_CONFIG)
+        _PROCESS_POOL = ToolProcessPool(**_PROCESS_POOL_CONFIG)
+        _PROCESS_POOL.warm_up()
+    return _PROCESS_POOL
@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+A pooled async HTTP client shared by all the tools of the process.
+
+Tools that call HTTP backends would otherwise each open their own connections, paying for a new TLS handshake in every
+session. Tools that accept an `http_client` argument in their constructor get the shared client injected by
+`load_tools_from_dict` instead: it keeps connections alive between calls, caps the connections opened to each host and
+applies the timeouts set in the `tool_execution.http_client` section of the configuration.
+
+Requires httpx: install it with `pip install intentional-core[http]`.
+"""
+
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlsplit
+
+import asyncio
+
+import structlog
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+_HTTP_CLIENT: Optional["SharedHTTPClient"] = None
+""" The HTTP client shared by all the tools of the process. Created on first use. """
+
+_HTTP_CLIENT_CONFIG: Dict[str, Any] = {}
+""" The configuration the HTTP client will be created with. """
+
+_CLOSING: Set[asyncio.Task] = set()
+""" The replaced HTTP clients being closed in the background. """
+
+
+def _require_httpx() -> None:
+    """
+    Raise a helpful error if httpx is not installed.
+    """
+    if httpx is None:
+        raise ImportError(
+            "The shared HTTP client requires httpx. Install it with 'pip install intentional-core[http]'."
+        )
+
+
+def http_client_available() -> bool:
+    """
+    Whether the shared HTTP client can be created, that is, whether httpx is installed.
+    """
+    return httpx is not None
+
+
+class SharedHTTPClient:
+    """
+    An async HTTP client with a pool of keep-alive connections and a limit on the concurrent requests to each host.
+
+    It exposes the same `request`, `get` and `post` methods as `httpx.AsyncClient`, and returns `httpx.Response`s.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        max_connections: int = 100,
+        max_connections_per_host: int = 10,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+    ) -> None:
+        """
+        Args:
+            max_connections: the maximum number of connections open at once, to all hosts.
+            max_connections_per_host: the maximum number of requests in flight to the same host. Further requests to
+                that host wait for one of them to complete.
+            max_keepalive_connections: how many idle connections are kept open for reuse.
+            keepalive_expiry: after how many seconds an idle connection is closed.
+            timeout: the default timeout of each request, in seconds. Can be overridden per request with `timeout=`.
+            connect_timeout: the timeout for opening a new connection, in seconds.
+        """
+        _require_httpx()
+        self.max_connections_per_host = max_connections_per_host
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> "httpx.Response":
+        """
+        Send a request, waiting first if too many requests to the same host are already in flight.
+
+        Args:
+            method: the HTTP method.
+            url: the URL to send the request to.
+            **kwargs: any other argument accepted by `httpx.AsyncClient.request`.
+
+        Returns:
+            The response, with its body already read.
+        """
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._host_semaphores[host] = asyncio.Semaphore(self.max_connections_per_host)
+        async with semaphore:
+            return await self._client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs: Any) -> "httpx.Response":
+        """
+        Send a GET request. See `request`.
+        """
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> "httpx.Response":
+        """
+        Send a POST request. See `request`.
+        """
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self) -> None:
+        """
+        Close all the connections of the pool.
+        """
+        await self._client.aclose()
+
+
+def configure_http_client(config: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Configure the shared HTTP client, from the `tool_execution.http_client` field of the bot's configuration.
+
+    Args:
+        config: the keyword arguments of `SharedHTTPClient`.
+    """
+    global _HTTP_CLIENT, _HTTP_CLIENT_CONFIG  # pylint: disable=global-statement
+    config = dict(config or {})
+    if _HTTP_CLIENT is not None and config != _HTTP_CLIENT_CONFIG:
+        log.debug("Replacing the shared HTTP client", http_client_config=config)
+        client, _HTTP_CLIENT = _HTTP_CLIENT, None
+        _close_replaced_client(client)
+    _HTTP_CLIENT_CONFIG = config
+
+
+def _close_replaced_client(client: SharedHTTPClient) -> None:
+    """
+    Close a client that was replaced by a new one: in the background if the event loop is running, right away
+    otherwise. httpx doesn't close the connections of a client when it's garbage collected.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(client.aclose())
+        _CLOSING.add(task)
+        task.add_done_callback(_CLOSING.discard)
+        return
+    try:
+        asyncio.run(client.aclose())
+    except Exception:  # pylint: disable=broad-exception-caught
+        # The connections belong to an event loop that is gone: there's nothing left to close cleanly
+        log.debug("Could not close the replaced HTTP client", exc_info=True)
+
+
+def get_http_client() -> SharedHTTPClient:
+    """
+    Get the HTTP client shared by the tools, creating it if needed.
+
+    Returns:
+        The process-wide HTTP client.
+    """
+    global _HTTP_CLIENT  # pylint: disable=global-statement
+    if _HTTP_CLIENT is None:
+        log.debug("Creating the shared HTTP client", http_client_config=_HTTP_CLIENT_CONFIG)
+        _HTTP_CLIENT = SharedHTTPClient(**_HTTP_CLIENT_CONFIG)
+    return _HTTP_CLIENT
+
+
+async def close_http_client() -> None:
+    """
+    Close the shared HTTP client, if it was created. Called when the bot shuts down. The next call to
+    `get_http_client` creates a new one.
+    """
+    global _HTTP_CLIENT  # pylint: disable=global-statement
+    if _HTTP_CLIENT is not None:
+        client, _HTTP_CLIENT = _HTTP_CLIENT, None
+        await client.aclose()
@@ -0,0 +1,224 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Per-tool execution metrics, collected by the LLM clients around each tool call.
+
+For each tool the process keeps the number of calls, errors, timeouts and cancellations, a histogram of the latency
+and the size of the arguments and outputs. Calls slower than a threshold are also logged with their full context.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import dataclass, field
+
+import json
+import time
+import asyncio
+
+import structlog
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+""" Upper bounds, in seconds, of the buckets of the latency histograms. """
+
+_TOOL_STATS: Dict[str, "ToolStats"] = {}
+""" This is a global dictionary that maps tool names to their metrics """
+
+_SLOW_CALL_THRESHOLD: Optional[float] = 2.0
+""" Calls that take longer than this many seconds are logged as slow. `None` disables the log. """
+
+
+@dataclass
+class ToolStats:
+    """
+    The metrics of a tool since the process started or since the last reset.
+    """
+
+    calls: int = 0
+    errors: int = 0
+    """ Calls that failed, timeouts included. """
+    timeouts: int = 0
+    cancelled: int = 0
+    total_latency: float = 0.0
+    latency_buckets: List[int] = field(default_factory=lambda: [0] * len(LATENCY_BUCKETS))
+    """ How many calls fell in each of the `LATENCY_BUCKETS`. """
+    argument_bytes: int = 0
+    output_bytes: int = 0
+    max_output_bytes: int = 0
+
+    @property
+    def error_rate(self) -> float:
+        """
+        The fraction of calls that failed.
+        """
+        return self.errors / self.calls if self.calls else 0.0
+
+    @property
+    def timeout_rate(self) -> float:
+        """
+        The fraction of calls that timed out.
+        """
+        return self.timeouts / self.calls if self.calls else 0.0
+
+    @property
+    def mean_latency(self) -> float:
+        """
+        The average duration of a call, in seconds.
+        """
+        return self.total_latency / self.calls if self.calls else 0.0
+
+    def latency_percentile(self, percentile: float) -> float:
+        """
+        Estimate a latency percentile from the histogram.
+
+        Args:
+            percentile: the percentile, between 0 and 100.
+
+        Returns:
+            The upper bound of the bucket the percentile falls in, in seconds.
+        """
+        threshold = self.calls * percentile / 100
+        count = 0
+        for bound, bucket in zip(LATENCY_BUCKETS, self.latency_buckets):
+            count += bucket
+            if count >= threshold and count:
+                return bound
+        return 0.0
+
+
+def payload_size(payload: Any) -> int:
+    """
+    The size in bytes of a tool's arguments or output, as they would be sent to the LLM.
+    """
+    if payload is None:
+        return 0
+    if not isinstance(payload, str):
+        payload = json.dumps(payload, default=str)
+    return len(payload.encode("utf-8"))
+
+
+def get_tool_stats(tool_name: Optional[str] = None) -> Dict[str, ToolStats]:
+    """
+    Get the metrics collected so far.
+
+    Args:
+        tool_name: the tool to get the metrics of. Defaults to all the tools.
+
+    Returns:
+        A dictionary mapping the tool names to their metrics.
+    """
+    if tool_name is None:
+        return dict(_TOOL_STATS)
+    return {tool_name: _TOOL_STATS[tool_name]} if tool_name in _TOOL_STATS else {}
+
+
+def reset_tool_stats() -> None:
+    """
+    Forget all the metrics collected so far.
+    """
+    _TOOL_STATS.clear()
+
+
+def set_slow_call_threshold(threshold: Optional[float]) -> None:
+    """
+    Set after how many seconds a tool call is logged as slow.
+
+    Args:
+        threshold: the threshold in seconds, or None to stop logging slow calls.
+    """
+    global _SLOW_CALL_THRESHOLD  # pylint: disable=global-statement
+    _SLOW_CALL_THRESHOLD = threshold
+
+
+class ToolCallTracker:
+    """
+    Measures a tool call and records its metrics when it's done. Use it as a context manager around the call:
+
+    ```python
+    with ToolCallTracker(tool_name, call_id, arguments) as call:
+        try:
+            output = await tool.invoke(arguments)
+        except ToolTimeoutError as exc:
+            call.fail(exc)
+            output = {"error": str(exc)}
+        call.set_output(output)
+    ```
+
+    Exceptions leaving the block are recorded too: cancellations as such, anything else as an error.
+    """
+
+    def __init__(self, tool_name: str, call_id: Optional[str], arguments: Any) -> None:
+        """
+        Args:
+            tool_name: the name of the tool.
+            call_id: the ID of the tool call given by the LLM, if any.
+            arguments: the arguments of the call.
+        """
+        self.tool_name = tool_name
+        self.call_id = call_id
+        self.arguments = arguments
+        self.output: Any = None
+        self.error: Optional[BaseException] = None
+        self.started_at: Optional[float] = None
+
+    def __enter__(self) -> "ToolCallTracker":
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc is not None:
+            self.error = exc
+        self.record(time.perf_counter() - self.started_at)
+
+    def set_output(self, output: Any) -> None:
+        """
+        Record the output of the call.
+        """
+        self.output = output
+
+    def fail(self, error: BaseException) -> None:
+        """
+        Record that the call failed, for errors that are handled inside the block.
+        """
+        self.error = error
+
+    def record(self, duration: float) -> None:
+        """
+        Add the call to the metrics of its tool, and log it if it was slow.
+
+        Args:
+            duration: how long the call took, in seconds.
+        """
+        stats = _TOOL_STATS.setdefault(self.tool_name, ToolStats())
+        argument_bytes = payload_size(self.arguments)
+        output_bytes = payload_size(self.output)
+
+        stats.calls += 1
+        stats.total_latency += duration
+        stats.latency_buckets[next(i for i, bound in enumerate(LATENCY_BUCKETS) if duration <= bound)] += 1
+        stats.argument_bytes += argument_bytes
+        stats.output_bytes += output_bytes
+        stats.max_output_bytes = max(stats.max_output_bytes, output_bytes)
+        if isinstance(self.error, asyncio.CancelledError):
+            stats.cancelled += 1
+        elif self.error is not None:
+            stats.errors += 1
+            # Covers ToolTimeoutError, which subclasses it
+            if isinstance(self.error, asyncio.TimeoutError):
+                stats.timeouts += 1
+
+        if _SLOW_CALL_THRESHOLD is not None and duration > _SLOW_CALL_THRESHOLD:
+            log.warning(
+                "Slow tool call: '%s' took %.2f seconds.",
+                self.tool_name,
+                duration,
+                tool_name=self.tool_name,
+                call_id=self.call_id,
+                duration=duration,
+                tool_arguments=self.arguments,
+                argument_bytes=argument_bytes,
+                output_bytes=output_bytes,
+                error=repr(self.error) if self.error is not None else None,
+            )
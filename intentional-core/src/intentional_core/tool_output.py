@@ -0,0 +1,236 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Size limits for the outputs of tools.
+
+Tool outputs are added to the conversation history and sent back to the LLM with every later request, so a single
+large output slows down the rest of the conversation. Tools configured with an `output_limit` get their outputs
+trimmed to a budget in bytes or tokens before the LLM client sees them. Outputs over budget are first given to the
+tool's `summarize_output` hook, and whatever is still too large is truncated in a way that keeps its structure: lists
+keep their first items, dictionaries their first keys and strings their beginning, with a note of what was left out.
+"""
+
+from typing import Any, Dict, List, Optional, Union, TYPE_CHECKING
+
+import json
+
+import structlog
+
+from intentional_core.tokenization import Tokenizer, load_tokenizer_from_dict
+from intentional_core.tool_streaming import ToolProgress
+
+if TYPE_CHECKING:
+    from intentional_core.tools import Tool
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+MIN_TRUNCATED_SIZE = 32
+""" Items that would be left with fewer bytes than this are dropped rather than truncated. """
+
+TRUNCATED_MARKER = "[truncated]"
+""" What's left of outputs whose budget is too small even for their truncated structure. """
+
+
+def _size(value: Any) -> int:
+    """
+    The size in bytes of a value serialized as JSON.
+    """
+    return len(json.dumps(value, default=str).encode("utf-8"))
+
+
+def _truncate_string(text: str, budget: int) -> str:
+    """
+    Cut a string so that it fits in the budget (in bytes, JSON-encoded), noting how much was cut.
+    """
+    encoded = text.encode("utf-8")
+    marker = f"... [{len(encoded)} bytes, truncated]"
+    # Leave room for the quotes and the escapes JSON may add
+    keep = max(budget - len(marker) - 2, 0)
+    while keep and _size(encoded[:keep].decode("utf-8", errors="ignore")) + len(marker) > budget:
+        keep = keep * 9 // 10
+    return encoded[:keep].decode("utf-8", errors="ignore") + marker
+
+
+def _truncate_list(items: List[Any], budget: int) -> List[Any]:
+    """
+    Keep the first items of a list that fit in the budget, noting how many were left out.
+    """
+    kept: List[Any] = []
+    remaining = budget - 2 - len(f'"[{len(items)} more items]", ')
+    for index, item in enumerate(items):
+        item_size = _size(item) + 2
+        if item_size > remaining:
+            dropped = len(items) - index
+            if remaining > MIN_TRUNCATED_SIZE:
+                kept.append(truncate_value(item, remaining - 2))
+                dropped -= 1
+            if dropped:
+                kept.append(f"[{dropped} more items]")
+            break
+        kept.append(item)
+        remaining -= item_size
+    return kept
+
+
+def _truncate_dict(mapping: Dict[str, Any], budget: int) -> Dict[str, Any]:
+    """
+    Keep the first keys of a dictionary that fit in the budget, noting how many were left out.
+    """
+    kept: Dict[str, Any] = {}
+    remaining = budget - 2 - len(f'"_truncated": "{len(mapping)} more keys", ')
+    for index, (key, value) in enumerate(mapping.items()):
+        key_size = _size(str(key)) + 4
+        value_size = _size(value)
+        if key_size + value_size > remaining:
+            dropped = len(mapping) - index
+            if remaining - key_size > MIN_TRUNCATED_SIZE:
+                kept[key] = truncate_value(value, remaining - key_size)
+                dropped -= 1
+            if dropped:
+                kept["_truncated"] = f"{dropped} more keys"
+            break
+        kept[key] = value
+        remaining -= key_size + value_size
+    return kept
+
+
+def truncate_value(value: Any, budget: int) -> Any:
+    """
+    Shrink a value until its JSON serialization fits in the budget, keeping its structure.
+
+    Args:
+        value: the value to shrink.
+        budget: the maximum size in bytes.
+
+    Returns:
+        The value itself if it fits, otherwise a smaller value of the same shape. If the budget is too small for that,
+        a short marker string, or an empty string if not even the marker fits.
+    """
+    if _size(value) <= budget:
+        return value
+    if isinstance(value, dict):
+        truncated = _truncate_dict(value, budget)
+    elif isinstance(value, (list, tuple)):
+        truncated = _truncate_list(list(value), budget)
+    else:
+        truncated = _truncate_string(value if isinstance(value, str) else str(value), budget)
+    if _size(truncated) > budget:
+        return _smallest_output(budget)
+    return truncated
+
+
+def _smallest_output(budget: int) -> str:
+    """
+    The marker that replaces outputs too large for their budget even once truncated.
+    """
+    return TRUNCATED_MARKER if _size(TRUNCATED_MARKER) <= budget else ""
+
+
+class OutputLimit:
+    """
+    A budget for the outputs of a tool, in bytes, tokens or both.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        tokenizer: Optional[Union[Tokenizer, Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        Args:
+            max_bytes: the maximum size of an output, serialized as JSON.
+            max_tokens: the maximum number of tokens of an output, serialized as JSON.
+            tokenizer: the tokenizer that counts the tokens, or its configuration. Defaults to the approximate one.
+        """
+        if max_bytes is None and max_tokens is None:
+            raise ValueError("Output limits need 'max_bytes', 'max_tokens' or both.")
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        if max_tokens is not None and not isinstance(tokenizer, Tokenizer):
+            tokenizer = load_tokenizer_from_dict(tokenizer)
+        self.tokenizer = tokenizer
+
+    def fits(self, output: Any) -> bool:
+        """
+        Whether an output is within the budget. Sizes in bytes are measured on the output serialized as JSON, like
+        when it's truncated.
+        """
+        if self.max_bytes is not None and _size(output) > self.max_bytes:
+            return False
+        if self.max_tokens is not None:
+            text = output if isinstance(output, str) else json.dumps(output, default=str)
+            return self.tokenizer.count_tokens(text) <= self.max_tokens
+        return True
+
+    def truncate(self, output: Any) -> Any:
+        """
+        Truncate an output to the budget, keeping its structure.
+
+        Token budgets are converted to bytes using the ratio of bytes to tokens of the whole output, and the result is
+        shrunk further if it's still over budget.
+
+        Args:
+            output: the output to truncate.
+
+        Returns:
+            The output itself if it fits, otherwise a truncated copy.
+        """
+        if self.fits(output):
+            return output
+        size = max(_size(output), 1)
+        budget = size if self.max_bytes is None else min(size, self.max_bytes)
+        if self.max_tokens is not None:
+            text = output if isinstance(output, str) else json.dumps(output, default=str)
+            tokens = max(self.tokenizer.count_tokens(text), 1)
+            budget = min(budget, self.max_tokens * size // tokens)
+        truncated = truncate_value(output, budget)
+        while budget > MIN_TRUNCATED_SIZE and not self.fits(truncated):
+            budget = budget * 9 // 10
+            truncated = truncate_value(output, budget)
+        if not self.fits(truncated):
+            truncated = _smallest_output(budget)
+        return truncated
+
+    def truncate_partial(self, partial: Any) -> Any:
+        """
+        Truncate a partial output of a streaming tool. Progress notes are left alone.
+        """
+        if isinstance(partial, ToolProgress):
+            return partial
+        return self.truncate(partial)
+
+    async def apply(self, tool: "Tool", output: Any) -> Any:
+        """
+        Bring an output within the budget: summarize it with the tool's hook first, then truncate what's left over.
+
+        Args:
+            tool: the tool that produced the output.
+            output: the output.
+
+        Returns:
+            An output within the budget.
+        """
+        if self.fits(output):
+            return output
+        log.debug("Tool output over budget", tool_id=tool.id, tool_name=tool.name, output_bytes=_size(output))
+        output = await tool.summarize_output(output)
+        return self.truncate(output)
+
+
+def load_output_limit_from_dict(config: Optional[Dict[str, Any]]) -> Optional[OutputLimit]:
+    """
+    Create the output limit of a tool from the `output_limit` field of its configuration.
+
+    Args:
+        config: a dictionary with `max_bytes`, `max_tokens` or both, and optionally the configuration of the
+            `tokenizer` that counts the tokens.
+
+    Returns:
+        The output limit, or None if the outputs are not limited.
+    """
+    if not config:
+        return None
+    return OutputLimit(**config)
@@ -0,0 +1,468 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Isolated worker subprocesses for tools whose code can't be trusted to share the bot's process.
+
+Tools configured with `execution: sandbox` run in a pool of separate Python interpreters. The workers are started
+ahead of time and import the tools' modules before their first call, so a call only costs a round trip over the
+worker's pipes. Each message is a 4-byte big-endian length followed by a JSON document: JSON rather than pickle, so
+that a misbehaving tool can't run code in the bot's process through its output.
+
+Workers are replaced after a number of calls or when their memory grows past a ceiling, and a call that is cancelled
+(for example because the user interrupted the bot, or the tool timed out) kills its worker rather than letting it run.
+
+The workers don't inherit the bot's environment, which usually holds API keys and other credentials: they only get
+the few variables in `SANDBOX_ENV`. The variables a tool needs, such as its own API key, must be listed in the
+`sandbox_env` field of its configuration, and are only set while that tool runs.
+
+Note that the workers are separate processes and nothing more: they run with the same user, filesystem and network
+access as the bot.
+"""
+
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Set, Union, TYPE_CHECKING
+
+import os
+import sys
+import json
+import struct
+import asyncio
+import inspect
+import importlib
+from contextlib import contextmanager
+
+import structlog
+
+from intentional_core.tool_streaming import consume_tool_stream
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+if TYPE_CHECKING:
+    from intentional_core.tools import Tool
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+_SANDBOX_POOL: Optional["ToolSandboxPool"] = None
+""" The pool of workers shared by all the tools configured with `execution: sandbox`. Created on first use. """
+
+_SANDBOX_POOL_CONFIG: Dict[str, Any] = {}
+""" The configuration the sandbox pool will be created with. """
+
+FRAME_HEADER = struct.Struct(">I")
+""" The header of each message exchanged with the workers: the length of the JSON document that follows. """
+
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+""" Messages longer than this are refused, and the worker that sent them is killed. """
+
+SANDBOX_ENV = ("PATH", "HOME", "LANG", "LC_ALL", "TZ", "TMPDIR", "SYSTEMROOT")
+""" The environment variables of the bot that every worker gets. Tools can ask for more with `sandbox_env`. """
+
+_WORKER_BOOTSTRAP = "from intentional_core.tool_sandbox import worker_main; worker_main()"
+""" The code run by the worker interpreters. The modules to preload are given as arguments. """
+
+
+class ToolSandboxError(RuntimeError):
+    """
+    Raised when a sandboxed tool fails, or when its worker dies or sends an invalid message.
+    """
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    """
+    Serialize a message for the workers' pipes.
+    """
+    payload = json.dumps(message, default=str, separators=(",", ":")).encode("utf-8")
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def _read_frame(stream: BinaryIO) -> Optional[Dict[str, Any]]:
+    """
+    Read a message from a blocking stream, in the worker. Returns None when the stream is closed.
+    """
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    return json.loads(stream.read(length))
+
+
+def _peak_memory_mb() -> Optional[float]:
+    """
+    The peak resident memory of the current process in megabytes, where the platform reports it.
+    """
+    if resource is None:  # pragma: no cover
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _import_tool_class(path: str) -> type:
+    """
+    Import a tool class from its `module:QualifiedName` path.
+    """
+    module_name, _, qualified_name = path.partition(":")
+    target: Any = importlib.import_module(module_name)
+    for name in qualified_name.split("."):
+        target = getattr(target, name)
+    return target
+
+
+def _run_tool_in_sandbox(loop: asyncio.AbstractEventLoop, tool: "Tool", params: Optional[Dict[str, Any]]) -> Any:
+    """
+    Run a tool's `run` method to completion in the worker, whatever kind of method it is. Coroutines run on the
+    worker's own event loop, which lives as long as the worker, so tools can keep async clients between calls.
+    """
+    result = tool.run(params)
+    if inspect.isasyncgen(result):
+        result = consume_tool_stream(result)
+    if inspect.isawaitable(result):
+        result = loop.run_until_complete(result)
+    return result
+
+
+@contextmanager
+def _tool_environment(env: Dict[str, str]) -> Iterator[None]:
+    """
+    Set the environment variables a tool is allowed to see while it runs in the worker, and remove them afterwards,
+    so that the next tool doesn't see them.
+    """
+    previous = {name: os.environ.get(name) for name in env}
+    os.environ.update(env)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def worker_main() -> None:
+    """
+    The main loop of a worker: preload the modules given as arguments, then run tool calls until stdin is closed.
+    """
+    channel_in = sys.stdin.buffer
+    # The pipe to the bot is reserved to the replies: whatever the tools print goes to stderr instead
+    channel_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+
+    for module_name in sys.argv[1:]:
+        importlib.import_module(module_name)
+    channel_out.write(encode_frame({"ready": True}))
+    channel_out.flush()
+
+    loop = asyncio.new_event_loop()
+    tools: Dict[str, "Tool"] = {}
+    while True:
+        request = _read_frame(channel_in)
+        if request is None:
+            return
+        try:
+            key = request["tool"] + json.dumps(request["config"], sort_keys=True)
+            with _tool_environment(request.get("env") or {}):
+                tool = tools.get(key)
+                if tool is None:
+                    tool = tools[key] = _import_tool_class(request["tool"])(**request["config"])
+                reply = {"output": _run_tool_in_sandbox(loop, tool, request["params"])}
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            reply = {"error": f"{type(exc).__name__}: {exc}"}
+        reply["memory_mb"] = _peak_memory_mb()
+        channel_out.write(encode_frame(reply))
+        channel_out.flush()
+
+
+class SandboxWorker:
+    """
+    A worker subprocess, seen from the bot.
+    """
+
+    def __init__(self, process: "asyncio.subprocess.Process") -> None:
+        """
+        Args:
+            process: the worker process, with pipes on its stdin and stdout.
+        """
+        self.process = process
+        self.calls = 0
+        self.memory_mb: Optional[float] = None
+
+    @classmethod
+    async def start(cls, preload: Iterable[str] = ()) -> "SandboxWorker":
+        """
+        Start a worker and wait until it's ready.
+
+        Args:
+            preload: the modules the worker imports before taking calls.
+
+        Returns:
+            The ready worker.
+        """
+        # The workers must be able to import everything the bot can, but don't get the bot's credentials
+        env = {name: os.environ[name] for name in SANDBOX_ENV if name in os.environ}
+        env["PYTHONPATH"] = os.pathsep.join(path for path in sys.path if path)
+        process = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-c",
+            _WORKER_BOOTSTRAP,
+            *preload,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            env=env,
+        )
+        worker = cls(process)
+        try:
+            await worker.receive()
+        except BaseException:
+            worker.kill()
+            raise
+        return worker
+
+    async def receive(self) -> Dict[str, Any]:
+        """
+        Read a message from the worker.
+        """
+        try:
+            header = await self.process.stdout.readexactly(FRAME_HEADER.size)
+            (length,) = FRAME_HEADER.unpack(header)
+            if length > MAX_FRAME_SIZE:
+                raise ToolSandboxError(f"The sandboxed worker sent a message of {length} bytes.")
+            return json.loads(await self.process.stdout.readexactly(length))
+        except asyncio.IncompleteReadError as exc:
+            raise ToolSandboxError(f"The sandboxed worker exited with code {await self.process.wait()}.") from exc
+        except ValueError as exc:
+            raise ToolSandboxError("The sandboxed worker sent an invalid message.") from exc
+
+    async def call(
+        self,
+        tool_path: str,
+        config: Dict[str, Any],
+        params: Optional[Dict[str, Any]],
+        env: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run a tool in the worker.
+
+        Args:
+            tool_path: the `module:QualifiedName` path of the tool class.
+            config: the arguments to create the tool with.
+            params: the arguments of the call.
+            env: the environment variables the tool may see during the call.
+
+        Returns:
+            The worker's reply, with either an `output` or an `error`.
+        """
+        self.calls += 1
+        try:
+            self.process.stdin.write(
+                encode_frame({"tool": tool_path, "config": config, "params": params, "env": env or {}})
+            )
+            await self.process.stdin.drain()
+        except ConnectionError as exc:
+            raise ToolSandboxError(f"The sandboxed worker exited with code {await self.process.wait()}.") from exc
+        reply = await self.receive()
+        self.memory_mb = reply.get("memory_mb")
+        return reply
+
+    def kill(self) -> None:
+        """
+        Stop the worker right away.
+        """
+        if self.process.returncode is None:
+            self.process.kill()
+
+
+class ToolSandboxPool:
+    """
+    Pool of sandboxed worker subprocesses that run the tools configured with `execution: sandbox`.
+
+    Like in the process pool, each worker builds its own instance of a tool the first time it runs it. The tool's
+    configuration and arguments are sent as JSON, and so is its output: outputs that JSON can't represent are
+    converted to strings. The tool class must be importable.
+
+    The pool lives on the event loop that first uses it.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        max_calls_per_worker: Optional[int] = 100,
+        max_memory_mb: Optional[float] = 512,
+        preload: Iterable[str] = (),
+    ) -> None:
+        """
+        Args:
+            max_workers: the number of worker processes. Defaults to the number of CPUs.
+            max_calls_per_worker: after how many calls a worker is replaced by a fresh one. None never replaces them.
+            max_memory_mb: the peak memory, in megabytes, above which a worker is replaced after its current call.
+                None never replaces them.
+            preload: the modules every worker imports when it starts, on top of the modules of the sandboxed tools.
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_calls_per_worker = max_calls_per_worker
+        self.max_memory_mb = max_memory_mb
+        self.preload: List[str] = list(preload)
+        self.recycled = 0
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: Set[SandboxWorker] = set()
+        self._starting: Set[asyncio.Task] = set()
+        self._stopping: Set[asyncio.Task] = set()
+
+    def add_preload(self, module_name: str) -> None:
+        """
+        Make the workers started from now on import the given module before their first call.
+        """
+        if module_name not in self.preload:
+            self.preload.append(module_name)
+
+    def warm_up(self) -> None:
+        """
+        Start all the workers now rather than on the first tool call. Must be called from the event loop.
+        """
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for _ in range(self.max_workers):
+                self._start_worker()
+
+    def _start_worker(self) -> None:
+        """
+        Start a worker in the background. It joins the idle queue when it's ready, or its error does if it fails.
+        """
+
+        async def start() -> None:
+            try:
+                worker = await SandboxWorker.start(self.preload)
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                log.exception("Could not start a sandboxed tool worker")
+                self._idle.put_nowait(exc)
+                return
+            self._workers.add(worker)
+            self._idle.put_nowait(worker)
+
+        task = asyncio.create_task(start())
+        self._starting.add(task)
+        task.add_done_callback(self._starting.discard)
+
+    def _retire(self, worker: SandboxWorker) -> None:
+        """
+        Kill a worker and start a new one in its place.
+        """
+        worker.kill()
+        self._workers.discard(worker)
+        task = asyncio.create_task(worker.process.wait())
+        self._stopping.add(task)
+        task.add_done_callback(self._stopping.discard)
+        self._start_worker()
+
+    async def run_tool(self, tool: "Tool", params: Optional[Dict[str, Any]] = None) -> Any:
+        """
+        Run a tool in one of the workers, waiting for one to be free if they're all busy.
+
+        Cancelling the returned coroutine kills the worker if the call already started, and a new one takes its place.
+
+        Args:
+            tool: the tool to run.
+            params: the arguments of the tool.
+
+        Returns:
+            The output of the tool.
+        """
+        self.warm_up()
+        worker: Union[SandboxWorker, Exception] = await self._idle.get()
+        if isinstance(worker, Exception):
+            self._start_worker()
+            raise ToolSandboxError("Could not start a sandboxed tool worker.") from worker
+
+        tool_class = type(tool)
+        try:
+            tool_path = f"{tool_class.__module__}:{tool_class.__qualname__}"
+            env = {name: os.environ[name] for name in tool.sandbox_env if name in os.environ}
+            reply = await worker.call(tool_path, tool.init_config or {}, params, env)
+        except BaseException:
+            # Cancelled, or the worker is broken: either way, it can't take other calls
+            self._retire(worker)
+            raise
+
+        if self._should_recycle(worker):
+            log.debug("Recycling a sandboxed tool worker", calls=worker.calls, memory_mb=worker.memory_mb)
+            self.recycled += 1
+            self._retire(worker)
+        else:
+            self._idle.put_nowait(worker)
+
+        if "error" in reply:
+            raise ToolSandboxError(f"Tool '{tool.name}' failed in its sandbox: {reply['error']}")
+        return reply["output"]
+
+    def _should_recycle(self, worker: SandboxWorker) -> bool:
+        """
+        Whether a worker reached its call limit or memory ceiling.
+        """
+        if self.max_calls_per_worker is not None and worker.calls >= self.max_calls_per_worker:
+            return True
+        return self.max_memory_mb is not None and worker.memory_mb is not None and worker.memory_mb > self.max_memory_mb
+
+    def shutdown(self) -> None:
+        """
+        Kill all the workers.
+        """
+        for task in self._starting:
+            task.cancel()
+        for worker in self._workers:
+            worker.kill()
+        self._workers.clear()
+        self._idle = None
+
+    async def aclose(self) -> None:
+        """
+        Kill all the workers and wait for them to exit.
+        """
+        workers = list(self._workers)
+        self.shutdown()
+        await asyncio.gather(*(worker.process.wait() for worker in workers), *self._stopping)
+
+
+def configure_sandbox_pool(config: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Configure the sandbox pool, from the `tool_execution.sandbox_pool` field of the bot's configuration.
+
+    Args:
+        config: the keyword arguments of `ToolSandboxPool`.
+    """
+    global _SANDBOX_POOL, _SANDBOX_POOL_CONFIG  # pylint: disable=global-statement
+    config = dict(config or {})
+    if _SANDBOX_POOL is not None and config != _SANDBOX_POOL_CONFIG:
+        log.debug("Replacing the tool sandbox pool", sandbox_pool_config=config)
+        _SANDBOX_POOL.shutdown()
+        _SANDBOX_POOL = None
+    _SANDBOX_POOL_CONFIG = config
+
+
+async def close_sandbox_pool() -> None:
+    """
+    Stop the workers of the sandbox pool, if it was created. Called when the bot shuts down.
+    """
+    global _SANDBOX_POOL  # pylint: disable=global-statement
+    if _SANDBOX_POOL is not None:
+        pool, _SANDBOX_POOL = _SANDBOX_POOL, None
+        await pool.aclose()
+
+
+def get_sandbox_pool() -> ToolSandboxPool:
+    """
+    Get the pool used by tools configured with `execution: sandbox`, creating it if needed. The workers are started
+    on the first call.
+
+    Returns:
+        The process-wide tool sandbox pool.
+    """
+    global _SANDBOX_POOL  # pylint: disable=global-statement
+    if _SANDBOX_POOL is None:
+        log.debug("Creating the tool sandbox pool", sandbox_pool_config=_SANDBOX_POOL_CONFIG)
+        _SANDBOX_POOL = ToolSandboxPool(**_SANDBOX_POOL_CONFIG)
+    return _SANDBOX_POOL
@@ -0,0 +1,139 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Opt-in deduplication of identical tool calls that happen at the same time.
+
+While a call is in flight, identical calls from any session in the process wait for its output instead of reaching
+the backend again. Only calls that arrive within a short coalescing window from the first one join it, so that a slow
+call doesn't keep absorbing callers that would rather get fresh data. A call is cancelled once all the callers
+waiting for it are cancelled, for example because the users interrupted the bot.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Union, TYPE_CHECKING
+
+import json
+import time
+import asyncio
+from dataclasses import dataclass
+
+import structlog
+
+if TYPE_CHECKING:
+    from intentional_core.tools import Tool
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+@dataclass
+class _Flight:
+    """
+    A tool call in flight, with the number of callers waiting for it.
+    """
+
+    started_at: float
+    task: "asyncio.Future"
+    waiters: int = 0
+
+
+_IN_FLIGHT: Dict[Hashable, _Flight] = {}
+""" This is a global dictionary that maps the keys of the tool calls in flight to their flights """
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls to a tool into a single run.
+    """
+
+    def __init__(self, window: float = 1.0) -> None:
+        """
+        Args:
+            window: for how many seconds after a call started identical calls can join it.
+        """
+        self.window = window
+
+    @staticmethod
+    def make_key(tool: "Tool", params: Optional[Dict[str, Any]]) -> Hashable:
+        """
+        Build the key of a tool call. Calls are identical if they go to the same tool class, with the same
+        configuration and name, with the same arguments.
+
+        Args:
+            tool: the tool being called.
+            params: the arguments of the call.
+
+        Returns:
+            A hashable key.
+        """
+        return (
+            type(tool),
+            json.dumps(tool.init_config or {}, sort_keys=True, default=str),
+            tool.name,
+            json.dumps(params or {}, sort_keys=True, separators=(",", ":"), default=str),
+        )
+
+    async def run(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run the call, or wait for an identical one that is already in flight.
+
+        The call runs in its own task: if the caller that started it is cancelled, the others still get the output.
+        If all the callers are cancelled, so is the call.
+
+        Args:
+            key: the key of the call, see `make_key`.
+            function: starts the call when invoked.
+
+        Returns:
+            The output of the call.
+        """
+        now = time.monotonic()
+        flight = _IN_FLIGHT.get(key)
+        if flight is not None and now - flight.started_at <= self.window and not flight.task.done():
+            log.debug("Joining identical tool call in flight", tool_call_key=key)
+            return await self._wait(key, flight)
+
+        task = asyncio.ensure_future(function())
+        flight = _IN_FLIGHT[key] = _Flight(started_at=now, task=task)
+
+        def forget(done: "asyncio.Future") -> None:
+            if key in _IN_FLIGHT and _IN_FLIGHT[key].task is done:
+                del _IN_FLIGHT[key]
+            # Mark the exception as retrieved, in case all the callers were cancelled
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(forget)
+        return await self._wait(key, flight)
+
+    @staticmethod
+    async def _wait(key: Hashable, flight: _Flight) -> Any:
+        """
+        Wait for the output of a call in flight. The call is shielded from the cancellation of each caller, but it's
+        cancelled when the last caller waiting for it is.
+        """
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                log.debug("Cancelling tool call in flight: nobody is waiting for it anymore", tool_call_key=key)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+
+def load_single_flight_from_dict(config: Union[bool, Dict[str, Any], None]) -> Optional[SingleFlight]:
+    """
+    Create the single-flight layer of a tool from the `single_flight` field of its configuration.
+
+    Args:
+        config: either `true`, to use the default settings, or a dictionary with `window` (seconds, default 1).
+
+    Returns:
+        The single-flight layer, or None if it's disabled.
+    """
+    if not config:
+        return None
+    config = {} if config is True else dict(config)
+    return SingleFlight(**config)
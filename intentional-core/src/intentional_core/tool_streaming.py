@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Support for tools that stream their output.
+
+A tool can implement `run` as an async generator. Every value it yields is a partial output that the LLM client can
+forward to the user and to the LLM while the tool keeps working, and the last value it yields is the tool's output.
+To report progress without producing output, yield a `ToolProgress` instead.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from dataclasses import dataclass
+
+
+PartialOutputHandler = Callable[[Any], Awaitable[None]]
+""" Coroutine function called with each value yielded by a streaming tool. """
+
+
+@dataclass
+class ToolProgress:
+    """
+    A progress note yielded by a streaming tool, such as "Searching the second catalogue...". It's forwarded like the
+    partial outputs, but it's not part of the tool's output.
+    """
+
+    message: str
+
+
+async def consume_tool_stream(stream: AsyncIterator[Any], on_partial: Optional[PartialOutputHandler] = None) -> Any:
+    """
+    Run a streaming tool to completion.
+
+    Args:
+        stream: the async generator returned by the tool's `run` method.
+        on_partial: called with each value the tool yields, progress notes included.
+
+    Returns:
+        The last value yielded by the tool that is not a progress note, or None if there's none.
+    """
+    output = None
+    async for partial in stream:
+        if on_partial is not None:
+            await on_partial(partial)
+        if not isinstance(partial, ToolProgress):
+            output = partial
+    return output
+
+
+def tool_progress_event(tool_name: str, call_id: str, partial: Any) -> Dict[str, Any]:
+    """
+    Build the payload of the `on_tool_progress` event for a value yielded by a streaming tool.
+
+    Args:
+        tool_name: the name of the tool.
+        call_id: the ID of the tool call.
+        partial: the value yielded by the tool.
+
+    Returns:
+        The event payload, with either a `progress` message or a `partial_output`.
+    """
+    if isinstance(partial, ToolProgress):
+        return {"name": tool_name, "call_id": call_id, "progress": partial.message}
+    return {"name": tool_name, "call_id": call_id, "partial_output": partial}
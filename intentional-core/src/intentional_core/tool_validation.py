@@ -0,0 +1,169 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Validation of the arguments the LLM gives to tools.
+
+Validators are compiled once from the tool's parameters: they fill in defaults, coerce values to the declared types
+when that's unambiguous (such as `"3"` for an integer) and reject anything else with an error that can be sent back to
+the LLM right away, before running the tool.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import json
+
+if TYPE_CHECKING:
+    from intentional_core.tools import ToolParameter
+
+
+Validator = Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]
+""" A compiled validator: takes the arguments given by the LLM and returns the arguments to pass to the tool. """
+
+
+class ToolArgumentsError(ValueError):
+    """
+    Raised when the arguments given to a tool don't match its parameters.
+    """
+
+
+def _to_string(value: Any) -> str:
+    """
+    Accepts strings and numbers.
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError
+
+
+def _to_integer(value: Any) -> int:
+    """
+    Accepts integers, whole floats and numeric strings.
+    """
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str):
+        return int(value.strip())
+    raise TypeError
+
+
+def _to_number(value: Any) -> float:
+    """
+    Accepts integers, floats and numeric strings.
+    """
+    if isinstance(value, bool):
+        raise TypeError
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        return float(value.strip())
+    raise TypeError
+
+
+def _to_boolean(value: Any) -> bool:
+    """
+    Accepts booleans and the strings 'true' and 'false'.
+    """
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    raise TypeError
+
+
+def _to_container(expected_type: type) -> Callable[[Any], Any]:
+    """
+    Builds a converter that accepts values of the given type, or JSON strings that decode to it.
+    """
+
+    def convert(value: Any) -> Any:
+        if isinstance(value, str):
+            value = json.loads(value)
+        if not isinstance(value, expected_type):
+            raise TypeError
+        return value
+
+    return convert
+
+
+_CONVERTERS: Dict[Any, Callable[[Any], Any]] = {
+    "string": _to_string,
+    "integer": _to_integer,
+    "number": _to_number,
+    "boolean": _to_boolean,
+    "array": _to_container(list),
+    "object": _to_container(dict),
+}
+""" Converters for the JSON schema types, which are the ones LLM APIs expect. """
+_CONVERTERS.update(
+    {
+        str: _CONVERTERS["string"],
+        int: _CONVERTERS["integer"],
+        float: _CONVERTERS["number"],
+        bool: _CONVERTERS["boolean"],
+        list: _CONVERTERS["array"],
+        dict: _CONVERTERS["object"],
+    }
+)
+
+
+def compile_validator(tool_name: str, parameters: List["ToolParameter"]) -> Validator:
+    """
+    Build the validator for the arguments of a tool.
+
+    Parameters with a type that is neither a JSON schema type name nor the matching Python type are passed through
+    unchanged.
+
+    Args:
+        tool_name: the name of the tool, used in error messages.
+        parameters: the parameters of the tool.
+
+    Returns:
+        The validator. It raises ToolArgumentsError if the arguments are invalid.
+    """
+    # Everything that doesn't depend on the arguments is computed here, once
+    specs: List[Tuple[str, Optional[Callable[[Any], Any]], bool, Any, str]] = [
+        (
+            param.name,
+            _CONVERTERS.get(param.type),
+            param.required,
+            param.default,
+            getattr(param.type, "__name__", str(param.type)),
+        )
+        for param in parameters
+    ]
+    known_names = frozenset(name for name, *_ in specs)
+    names_list = ", ".join(sorted(known_names)) or "none"
+
+    def validate(params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        params = params or {}
+        unknown = [name for name in params if name not in known_names]
+        if unknown:
+            raise ToolArgumentsError(
+                f"Tool '{tool_name}' got unknown arguments: {', '.join(unknown)}. Valid arguments are: {names_list}."
+            )
+        validated = {}
+        for name, convert, required, default, type_name in specs:
+            if name not in params or params[name] is None:
+                if required:
+                    raise ToolArgumentsError(f"Tool '{tool_name}' is missing the required argument '{name}'.")
+                if default is not None:
+                    validated[name] = default
+                continue
+            value = params[name]
+            if convert is not None:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError) as exc:
+                    raise ToolArgumentsError(
+                        f"Argument '{name}' of tool '{tool_name}' must be of type '{type_name}', got {value!r}."
+                    ) from exc
+            validated[name] = value
+        return validated
+
+    return validate
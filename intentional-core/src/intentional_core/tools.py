@@ -3,11 +3,23 @@
 """
 Tools baseclass for Intentional.
 """
-from typing import List, Any, Dict, Set, Optional
+from typing import List, Any, Dict, Iterator, Optional, Tuple, Type, Union
+from collections.abc import MutableMapping
+import time
+import asyncio
+import inspect
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 import structlog
-from intentional_core.utils import inheritors
+from intentional_core.utils import register_class
+from intentional_core.tool_cache import ToolResultCache, load_tool_cache_from_dict
+from intentional_core.tool_single_flight import SingleFlight, load_single_flight_from_dict
+from intentional_core.tool_output import OutputLimit, load_output_limit_from_dict
+from intentional_core.tool_validation import Validator, compile_validator
+from intentional_core.tool_streaming import PartialOutputHandler, consume_tool_stream
+from intentional_core.tool_execution import EXECUTION_MODES, get_process_pool, get_thread_pool
+from intentional_core.tool_http import get_http_client, http_client_available
+from intentional_core.tool_sandbox import get_sandbox_pool
 
 
 log = structlog.get_logger(logger_name=__name__)
@@ -16,6 +28,15 @@ log = structlog.get_logger(logger_name=__name__)
 _TOOL_CLASSES = {}
 """ This is a global dictionary that maps tool names to their classes """
 
+_TOOL_SEMAPHORES = {}
+""" This is a global dictionary that maps tool ids and concurrency limits to the semaphores enforcing them """
+
+
+class ToolTimeoutError(asyncio.TimeoutError):
+    """
+    Raised when a tool doesn't return within its timeout.
+    """
+
 
 @dataclass
 class ToolParameter:
@@ -39,12 +60,62 @@ class ToolParameter:
 class Tool(ABC):
     """
     Tools baseclass for Intentional.
+
+    The `run` method is normally a coroutine. Tools that wrap blocking libraries can implement it as a regular
+    method instead: it will be run in a thread pool, so that it doesn't block the event loop. CPU-bound tools can be
+    run in a process pool by setting `execution: process` in their configuration. Tools that produce their output
+    bit by bit can implement it as an async generator, see `intentional_core.tool_streaming`. Tools that call HTTP
+    backends can accept an `http_client` argument in their constructor to receive the client shared by all the tools
+    of the process, see `intentional_core.tool_http`.
     """
 
     id: str = None
     name: str = None
     description: str = None
     parameters: List[ToolParameter] = None
+    cache: Optional[ToolResultCache] = None
+    """ Cache of the results of this tool, set by the `cache` field of the tool's configuration. """
+    single_flight: Optional[SingleFlight] = None
+    """
+    Deduplication of identical concurrent calls to this tool, set by the `single_flight` field of the tool's
+    configuration.
+    """
+    timeout: Optional[float] = None
+    """ Seconds after which a run of this tool is cancelled, set by the `timeout` field of the tool's configuration. """
+    max_concurrency: Optional[int] = None
+    """
+    Maximum number of concurrent runs of this tool in the process, across all sessions and all the tool instances
+    with the same id and the same limit. Set by the `max_concurrency` field of the tool's configuration.
+    """
+    execution: str = "auto"
+    """ Where the tool runs: one of `auto`, `thread`, `process` or `sandbox`. See `intentional_core.tool_execution`. """
+    sandbox_env: Tuple[str, ...] = ()
+    """
+    The environment variables of the bot that the tool can see when it runs in a sandboxed worker, which doesn't
+    inherit the bot's environment. Set by the `sandbox_env` field of the tool's configuration.
+    """
+    validator: Optional[Validator] = None
+    """ Validator of the arguments of this tool, compiled from its parameters on load or on the first call. """
+    init_config: Optional[Dict[str, Any]] = None
+    """ The configuration the tool was created with, used to create it again in worker processes. """
+    prefetch: bool = False
+    """
+    Whether the tool is safe to run ahead of time, with its default arguments, as soon as the conversation enters a
+    stage that offers it. Only tools without side effects and without required parameters should set it. Can be
+    overridden by the `prefetch` field of the tool's configuration.
+    """
+    prefetch_validity: float = 10.0
+    """ For how many seconds a prefetched output can be used. Set by the `prefetch_validity` field. """
+    output_limit: Optional[OutputLimit] = None
+    """ Budget for the outputs of this tool, set by the `output_limit` field of the tool's configuration. """
+    _prefetched: Optional[Tuple[float, Dict[str, Any], "asyncio.Task"]] = None
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        """
+        Register every subclass as soon as it's defined, so that it can be found by its `id`.
+        """
+        super().__init_subclass__(**kwargs)
+        register_class(_TOOL_CLASSES, cls, cls.id, "tool", key_name="id")
 
     def __repr__(self) -> str:
         return (
@@ -55,61 +126,458 @@ class Tool(ABC):
     @abstractmethod
     async def run(self, params: Optional[Dict[str, Any]] = None) -> Any:
         """
-        Run the tool.
+        Run the tool. Can be a coroutine, a regular method for blocking code, or an async generator for tools that
+        stream their output.
+        """
+
+    async def summarize_output(self, output: Any) -> Any:
+        """
+        Called with the outputs that exceed the tool's `output_limit`, before they're truncated. Tools can override it
+        to condense their output in a way that makes sense for them, for example by keeping only the most relevant
+        results or by asking an LLM for a summary. Whatever it returns is still truncated if it's over budget.
+
+        Args:
+            output: the complete output of the tool.
+
+        Returns:
+            The summarized output. By default, the output itself.
+        """
+        return output
+
+    async def invoke(
+        self, params: Optional[Dict[str, Any]] = None, on_partial: Optional[PartialOutputHandler] = None
+    ) -> Any:
+        """
+        Validate the arguments and run the tool through the execution options set in its configuration, such as
+        caching, timeouts and concurrency limits. LLM clients should call this method instead of `run`.
+
+        Args:
+            params: the arguments for the tool.
+            on_partial: called with each partial output or progress note of a streaming tool. Streaming tools
+                running in a thread or process pool, or served from the cache, don't produce partial outputs.
+
+        Returns:
+            The output of the tool, summarized or truncated if it exceeds the tool's `output_limit`.
+
+        Raises:
+            ToolArgumentsError: if the arguments don't match the tool's parameters. The tool is not run.
+            ToolTimeoutError: if the tool didn't return within its timeout, including the time spent waiting for
+                other runs of the same tool to finish.
+        """
+        if self.validator is None:
+            self.validator = compile_validator(self.name, self.parameters)
+        params = self.validator(params)
+
+        if self._prefetched is not None:
+            found, output = await self._take_prefetched(params)
+            if found:
+                log.debug("Tool output served from prefetch", tool_id=self.id, tool_name=self.name)
+                return output if self.output_limit is None else await self.output_limit.apply(self, output)
+        if self.output_limit is None:
+            return await self._invoke_validated(params, on_partial)
+        output = await self._invoke_validated(params, self._limit_partials(on_partial))
+        return await self.output_limit.apply(self, output)
+
+    def _limit_partials(self, on_partial: Optional[PartialOutputHandler]) -> Optional[PartialOutputHandler]:
+        """
+        Wrap the handler of the partial outputs, so that they're truncated to the tool's `output_limit` too.
+        """
+        if on_partial is None:
+            return None
+
+        async def forward_partial(partial: Any) -> None:
+            await on_partial(self.output_limit.truncate_partial(partial))
+
+        return forward_partial
+
+    def start_prefetch(self) -> None:
+        """
+        If the tool is safe to prefetch, start running it in the background with its default arguments, so that the
+        LLM's next call can be answered right away if it comes within `prefetch_validity` seconds. The prefetched
+        output answers a single call: later calls run the tool again. Does nothing if the tool
+        can't be prefetched or a valid prefetch is already available. Must be called with a running event loop.
+
+        Sandboxed tools also start their workers here, if they're not running yet.
+        """
+        if self.execution == "sandbox":
+            get_sandbox_pool().warm_up()
+        if not self.prefetch:
+            return
+        if self._prefetched is not None and self._prefetched[0] > time.monotonic():
+            return
+        if self.validator is None:
+            self.validator = compile_validator(self.name, self.parameters)
+        params = self.validator({})
+        log.debug("Prefetching tool", tool_id=self.id, tool_name=self.name)
+        task = asyncio.ensure_future(self._invoke_validated(params))
+        # Failed prefetches are simply ignored, and the tool runs again when the LLM calls it
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._prefetched = (time.monotonic() + self.prefetch_validity, params, task)
+
+    async def _take_prefetched(self, params: Dict[str, Any]) -> Tuple[bool, Any]:
+        """
+        Get the output of the prefetched run, if it's still valid and it was made with the same arguments. A
+        prefetched output is used only once.
+
+        Returns:
+            A tuple with a boolean telling whether a usable output was found, and the output.
+        """
+        prefetched = self._prefetched
+        expires_at, prefetched_params, task = prefetched
+        if expires_at <= time.monotonic() or params != prefetched_params or task.cancelled():
+            return False, None
+        try:
+            # Shielded, so that a cancelled call doesn't cancel the prefetch for everyone else
+            output = await asyncio.shield(task)
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.debug("Prefetched run failed, running the tool again", tool_id=self.id, tool_name=self.name)
+            output = None
+            found = False
+        else:
+            found = True
+        # Calls that were already waiting for it share the output, later ones run the tool again
+        if self._prefetched is prefetched:
+            self._prefetched = None
+        return found, output
+
+    async def _invoke_validated(self, params: Dict[str, Any], on_partial: Optional[PartialOutputHandler] = None) -> Any:
+        """
+        Run the tool with already validated arguments, going through the cache if the tool has one.
+        """
+        if self.cache is None:
+            return await self._run_deduplicated(params, on_partial)
+
+        key = self.cache.make_key(self, params)
+        found, output = self.cache.get(key)
+        if found:
+            log.debug("Tool output found in cache", tool_id=self.id, tool_name=self.name)
+            return output
+        output = await self._run_deduplicated(params, on_partial)
+        self.cache.set(key, output)
+        return output
+
+    async def _run_deduplicated(self, params: Dict[str, Any], on_partial: Optional[PartialOutputHandler] = None) -> Any:
+        """
+        Run the tool, or wait for an identical call already in flight if the tool has a single-flight layer. Calls
+        that join another one don't receive partial outputs.
+        """
+        if self.single_flight is None:
+            return await self._run_with_limits(params, on_partial)
+        key = self.single_flight.make_key(self, params)
+        return await self.single_flight.run(key, lambda: self._run_with_limits(params, on_partial))
+
+    async def _run_with_limits(
+        self, params: Optional[Dict[str, Any]] = None, on_partial: Optional[PartialOutputHandler] = None
+    ) -> Any:
+        """
+        Run the tool within its timeout and concurrency limit.
+        """
+        if self.timeout is None:
+            return await self._run_with_concurrency_limit(params, on_partial)
+        try:
+            return await asyncio.wait_for(self._run_with_concurrency_limit(params, on_partial), timeout=self.timeout)
+        except asyncio.TimeoutError as exc:
+            log.warning("Tool '%s' timed out.", self.name, tool_id=self.id, tool_name=self.name, timeout=self.timeout)
+            raise ToolTimeoutError(f"Tool '{self.name}' timed out after {self.timeout} seconds.") from exc
+
+    async def _run_with_concurrency_limit(
+        self, params: Optional[Dict[str, Any]] = None, on_partial: Optional[PartialOutputHandler] = None
+    ) -> Any:
+        """
+        Run the tool, waiting first for a free slot if the tool has a concurrency limit.
+        """
+        if not self.max_concurrency:
+            return await self._execute(params, on_partial)
+        # Semaphores are created lazily, so that they're bound to the running event loop. Instances configured with
+        # different limits don't share a semaphore, or all of them would get the limit of the first one to run.
+        key = (self.id, self.max_concurrency)
+        if key not in _TOOL_SEMAPHORES:
+            other_limits = [limit for tool_id, limit in _TOOL_SEMAPHORES if tool_id == self.id]
+            if other_limits:
+                log.warning(
+                    "Tool '%s' is configured with different concurrency limits: each limit applies separately.",
+                    self.id,
+                    tool_id=self.id,
+                    max_concurrency=self.max_concurrency,
+                    other_limits=other_limits,
+                )
+            _TOOL_SEMAPHORES[key] = asyncio.Semaphore(self.max_concurrency)
+        async with _TOOL_SEMAPHORES[key]:
+            return await self._execute(params, on_partial)
+
+    async def _execute(
+        self, params: Optional[Dict[str, Any]] = None, on_partial: Optional[PartialOutputHandler] = None
+    ) -> Any:
+        """
+        Run the tool where its execution mode says: on the event loop, in the thread pool, in the process pool or in
+        a sandboxed worker.
+        """
+        if self.execution == "process":
+            return await get_process_pool().run_tool(self, params)
+        if self.execution == "sandbox":
+            return await get_sandbox_pool().run_tool(self, params)
+        if self.execution == "auto":
+            if inspect.isasyncgenfunction(inspect.unwrap(self.run)):
+                return await consume_tool_stream(self.run(params), on_partial)
+            if inspect.iscoroutinefunction(inspect.unwrap(self.run)):
+                return await self.run(params)
+        return await self._run_in_thread_pool(params, on_partial)
+
+    async def _run_in_thread_pool(
+        self, params: Optional[Dict[str, Any]], on_partial: Optional[PartialOutputHandler]
+    ) -> Any:
+        """
+        Run the tool in the thread pool. Async methods behind decorators that hide them return a coroutine or an
+        async generator from the thread: those run on the event loop.
+        """
+        result = await get_thread_pool().run(self.run, params)
+        if inspect.isasyncgen(result):
+            return await consume_tool_stream(result, on_partial)
+        if inspect.isawaitable(result):
+            return await result
+        return result
+
+
+TOOL_OPTIONS = (
+    "cache",
+    "single_flight",
+    "timeout",
+    "max_concurrency",
+    "execution",
+    "prefetch",
+    "prefetch_validity",
+    "output_limit",
+    "sandbox_env",
+)
+""" The fields of a tool's configuration that are handled by Intentional rather than passed to the tool. """
+
+
+def resolve_tool_options(tool: Union[Tool, Type[Tool]], options: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate the execution options found in the configuration of a tool and build the attributes they set.
+
+    Args:
+        tool: the tool to configure, or its class if the tool is not created yet.
+        options: the options, see `TOOL_OPTIONS`.
+
+    Returns:
+        The attributes to set on the tool.
+    """
+    execution = options.get("execution")
+    if execution is not None and execution not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode '{execution}' for tool '{tool.id}'. Use one of {EXECUTION_MODES}.")
+    run = inspect.unwrap(tool.run)
+    if execution in ("thread", "process") and (inspect.iscoroutinefunction(run) or inspect.isasyncgenfunction(run)):
+        # They would need a new event loop for each call, which breaks clients and locks bound to a loop
+        raise ValueError(
+            f"Tool '{tool.id}' has an async 'run' method, so it can't use 'execution: {execution}'. "
+            "Use 'auto' to run it on the event loop, or 'sandbox' to isolate it."
+        )
+
+    attributes = {
+        "cache": load_tool_cache_from_dict(tool, options.get("cache")),
+        "single_flight": load_single_flight_from_dict(options.get("single_flight")),
+        "output_limit": load_output_limit_from_dict(options.get("output_limit")),
+    }
+    for option in ("timeout", "max_concurrency", "execution", "prefetch", "prefetch_validity"):
+        if options.get(option) is not None:
+            attributes[option] = options[option]
+    sandbox_env = options.get("sandbox_env")
+    if sandbox_env is not None:
+        if isinstance(sandbox_env, str) or not all(isinstance(name, str) for name in sandbox_env):
+            raise ValueError(f"'sandbox_env' of tool '{tool.id}' must be a list of environment variable names.")
+        if attributes.get("execution", tool.execution) != "sandbox":
+            raise ValueError(f"'sandbox_env' of tool '{tool.id}' only applies to tools with 'execution: sandbox'.")
+        attributes["sandbox_env"] = tuple(sandbox_env)
+    if attributes.get("prefetch", tool.prefetch) and any(param.required for param in tool.parameters or []):
+        raise ValueError(f"Tool '{tool.name}' has required parameters, so it can't be prefetched.")
+    return attributes
+
+
+def apply_tool_options(tool: Tool, options: Dict[str, Any]) -> None:
+    """
+    Apply the execution options found in the configuration of a tool.
+
+    Args:
+        tool: the tool to configure.
+        options: the options, see `TOOL_OPTIONS`.
+    """
+    for name, value in resolve_tool_options(tool, options).items():
+        setattr(tool, name, value)
+
+    if tool.execution == "process":
+        # Start the worker processes now, so the first calls don't pay for it
+        get_process_pool()
+    elif tool.execution == "sandbox":
+        # The workers import the tool's module when they start, rather than on its first call
+        get_sandbox_pool().add_preload(type(tool).__module__)
+
+
+def create_tool(tool_class: Type[Tool], tool_config: Dict[str, Any], options: Dict[str, Any]) -> Tool:
+    """
+    Create a tool and apply its execution options.
+
+    Args:
+        tool_class: the class of the tool.
+        tool_config: the arguments of the tool's constructor.
+        options: the execution options, see `TOOL_OPTIONS`.
+
+    Returns:
+        The tool, ready to be invoked.
+    """
+    init_config = dict(tool_config)
+    tool_config = dict(tool_config)
+    http_client_parameter = inspect.signature(tool_class).parameters.get("http_client")
+    if http_client_parameter is not None and "http_client" not in tool_config:
+        # Tools that talk to HTTP backends share the process-wide connection pool. Tools that can do without it keep
+        # their default if httpx is not installed.
+        if http_client_available() or http_client_parameter.default is inspect.Parameter.empty:
+            tool_config["http_client"] = get_http_client()
+    tool_instance: Tool = tool_class(**tool_config)
+    if getattr(tool_instance, "name", None) is None:
+        raise ValueError(f"Tool '{tool_class.id}' must have a name.")
+    if getattr(tool_instance, "description", None) is None:
+        raise ValueError(f"Tool '{tool_class.id}' must have a description.")
+    if getattr(tool_instance, "parameters", None) is None:
+        raise ValueError(f"Tool '{tool_class.id}' must have parameters.")
+    tool_instance.init_config = init_config
+    tool_instance.validator = compile_validator(tool_instance.name, tool_instance.parameters)
+    apply_tool_options(tool_instance, options)
+    return tool_instance
+
+
+class PendingTool:
+    """
+    A tool that was validated but not created yet. It knows the tool's name, description and parameters, which are
+    enough to describe the tool to the LLM or to count its tokens.
+    """
+
+    def __init__(self, tool_class: Type[Tool], tool_config: Dict[str, Any], options: Dict[str, Any]) -> None:
+        """
+        Args:
+            tool_class: the class of the tool.
+            tool_config: the arguments of the tool's constructor.
+            options: the execution options, see `TOOL_OPTIONS`.
+        """
+        self.tool_class = tool_class
+        self.tool_config = tool_config
+        self.options = options
+        self.id = tool_class.id
+        self.name = tool_class.name
+        self.description = tool_class.description
+        self.parameters = tool_class.parameters
+
+    def create(self) -> Tool:
+        """
+        Create the tool.
+        """
+        log.debug("Creating tool on first use", tool_id=self.id, tool_name=self.name)
+        return create_tool(self.tool_class, self.tool_config, self.options)
+
+
+class LazyTools(MutableMapping):
+    """
+    The tools of a stage, by name. Tools that are still pending are created the first time they're looked up, which
+    happens when their stage becomes current (to describe them to the LLM and to prefetch them) or when they're invoked.
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[str, Union[Tool, PendingTool]] = {}
+
+    def defer(self, name: str, pending: PendingTool) -> None:
+        """
+        Add a tool that will be created the first time it's looked up.
+        """
+        self._entries[name] = pending
+
+    def is_created(self, name: str) -> bool:
+        """
+        Whether the tool with this name was created already.
+        """
+        return not isinstance(self._entries[name], PendingTool)
+
+    def peek_values(self) -> List[Union[Tool, PendingTool]]:
+        """
+        The tools, without creating the pending ones.
         """
+        return list(self._entries.values())
 
+    def __getitem__(self, name: str) -> Tool:
+        entry = self._entries[name]
+        if isinstance(entry, PendingTool):
+            entry = self._entries[name] = entry.create()
+        return entry
 
-def load_tools_from_dict(config: List[Dict[str, Any]]) -> Dict[str, Tool]:
+    def __setitem__(self, name: str, tool: Tool) -> None:
+        self._entries[name] = tool
+
+    def __delitem__(self, name: str) -> None:
+        del self._entries[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        pending = [name for name, entry in self._entries.items() if isinstance(entry, PendingTool)]
+        return f"<LazyTools tools={list(self._entries)}, pending={pending}>"
+
+
+def _can_defer(tool_class: Type[Tool], tool_config: Dict[str, Any]) -> bool:
+    """
+    Whether a tool can be created later: only if its class tells its name, description and parameters, and the
+    configuration doesn't rename it.
+    """
+    if "name" in tool_config:
+        return False
+    return all(getattr(tool_class, attribute, None) is not None for attribute in ("name", "description", "parameters"))
+
+
+def load_tools_from_dict(config: List[Dict[str, Any]], lazy: bool = False) -> MutableMapping[str, Tool]:
     """
     Load a list of tools from a dictionary configuration.
 
     Args:
         config: The configuration dictionary.
+        lazy: whether to defer the creation of the tools until they're first looked up. The configuration of the
+            deferred tools is still validated right away. Tools whose name, description or parameters are only known
+            once they're created are always created right away.
 
     Returns:
-        A list of Tool instances.
-    """
-    # Get all the subclasses of Tool
-    subclasses: Set[Tool] = inheritors(Tool)
-    log.debug("Collected tool classes", tool_classes=subclasses)
-    for subclass in subclasses:
-        if not subclass.id:
-            log.error(
-                "Tool class '%s' does not have an id. This tool will not be usable.",
-                subclass.__name__,
-                tool_class=subclass,
-            )
-            continue
-
-        if subclass.id in _TOOL_CLASSES:
-            log.debug(
-                "Duplicate tool '%s' found. The older class will be replaced by the newly imported one.",
-                subclass.id,
-                old_tool_id=subclass.id,
-                old_tool_class=_TOOL_CLASSES[subclass.id],
-                new_tool_class=subclass,
-            )
-        _TOOL_CLASSES[subclass.id] = subclass
-
+        A dictionary of Tool instances by name, or `LazyTools` if `lazy` is set.
+    """
     # Initialize the tools
-    tools = {}
+    tools = LazyTools() if lazy else {}
     for tool_config in config:
         tool_id = tool_config.pop("id", None)
         if not tool_id:
             raise ValueError("Tool definitions must have an 'id' field.")
-        log.debug("Creating tool", tool_id=tool_id)
+        log.debug("Loading tool", tool_id=tool_id)
         if tool_id not in _TOOL_CLASSES:
             raise ValueError(
                 f"Unknown tool '{tool_id}'. Available tools: {list(_TOOL_CLASSES)}. "
                 "Did you forget to install a plugin?"
             )
-        tool_instance: Tool = _TOOL_CLASSES[tool_id](**tool_config)
-        if getattr(tool_instance, "name", None) is None:
-            raise ValueError(f"Tool '{tool_id}' must have a name.")
-        if getattr(tool_instance, "description", None) is None:
-            raise ValueError(f"Tool '{tool_id}' must have a description.")
-        if getattr(tool_instance, "parameters", None) is None:
-            raise ValueError(f"Tool '{tool_id}' must have parameters.")
-        tools[tool_instance.name] = tool_instance
+        # Execution options are handled by Intentional, not by the tool itself
+        options = {key: tool_config.pop(key) for key in TOOL_OPTIONS if key in tool_config}
+        tool_class = _TOOL_CLASSES[tool_id]
+
+        if lazy and _can_defer(tool_class, tool_config):
+            signature = inspect.signature(tool_class)
+            arguments = dict(tool_config)
+            if "http_client" in signature.parameters:
+                # Injected when the tool is created, see `create_tool`
+                arguments.setdefault("http_client", None)
+            try:
+                signature.bind(**arguments)
+            except TypeError as exc:
+                raise ValueError(f"Invalid configuration for tool '{tool_id}': {exc}") from exc
+            resolve_tool_options(tool_class, options)
+            tools.defer(tool_class.name, PendingTool(tool_class, tool_config, options))
+        else:
+            tool_instance = create_tool(tool_class, tool_config, options)
+            tools[tool_instance.name] = tool_instance
 
     return tools
@@ -6,5 +6,6 @@ Utilities for Intentional.
 
 from intentional_core.utils.importing import import_plugin, import_all_plugins
 from intentional_core.utils.inheritance import inheritors
+from intentional_core.utils.registry import register_class
 
-__all__ = ["inheritors", "import_plugin", "import_all_plugins"]
+__all__ = ["inheritors", "register_class", "import_plugin", "import_all_plugins"]
@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""
+Registries of the Intentional classes that can be referenced by name in configuration files.
+
+Base classes such as `Tool` or `LLMClient` call `register_class` from their `__init_subclass__` hook, so every
+subclass is registered once, as soon as its module is imported. Loading a configuration then only needs a dictionary
+lookup, instead of walking the whole subclass tree each time.
+"""
+
+from typing import Any, Dict, Optional
+import structlog
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+def register_class(registry: Dict[str, Any], class_: Any, key: Optional[str], kind: str, key_name: str = "name"):
+    """
+    Add a class to a registry.
+
+    Args:
+        registry: the registry to add the class to.
+        class_: the class to register.
+        key: the name the class will be referenced by in configuration files. Classes without one, such as
+            intermediate base classes, are not registered. Neither are abstract classes.
+        kind: what the class is, such as "tool" or "LLM client". Used in log messages.
+        key_name: the class variable the key comes from. Used in log messages.
+    """
+    if not key:
+        log.debug(
+            "%s class '%s' does not have a %s, so it can't be used in configuration files.",
+            kind.capitalize(),
+            class_.__name__,
+            key_name,
+            registered_class=class_,
+        )
+        return
+
+    # ABCMeta sets __abstractmethods__ only after __init_subclass__ runs, so abstract methods are looked up directly
+    abstract_methods = [
+        name for name in dir(class_) if getattr(getattr(class_, name, None), "__isabstractmethod__", False)
+    ]
+    if abstract_methods:
+        log.debug(
+            "%s class '%s' is abstract and will not be registered.",
+            kind.capitalize(),
+            class_.__name__,
+            registered_class=class_,
+            abstract_methods=abstract_methods,
+        )
+        return
+
+    if key in registry and registry[key] is not class_:
+        log.warning(
+            "Duplicate %s '%s' found. The older class will be replaced by the newly imported one.",
+            kind,
+            key,
+            old_class=registry[key],
+            new_class=class_,
+        )
+    registry[key] = class_
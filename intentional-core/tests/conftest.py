@@ -0,0 +1,14 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import pytest
+import intentional_core.tools as tools
+
+
+@pytest.fixture(autouse=True)
+def restore_collected_tools():
+    # Tools register themselves when they're defined: forget the ones defined by each test
+    collected_tools = dict(tools._TOOL_CLASSES)
+    yield
+    tools._TOOL_CLASSES.clear()
+    tools._TOOL_CLASSES.update(collected_tools)
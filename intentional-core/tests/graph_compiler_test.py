@@ -0,0 +1,117 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from intentional_core import IntentRouter, Tool
+
+
+def make_config(**kwargs):
+    config = {
+        "stages": {
+            "ask_for_name": {
+                "accessible_from": ["_start_"],
+                "goal": "Ask the user for their name",
+                "outcomes": {
+                    "name_given": {
+                        "description": "The user has given their name",
+                        "move_to": "ask_for_age",
+                    }
+                },
+            },
+            "ask_for_age": {
+                "goal": "Ask the user for their age",
+                "outcomes": {
+                    "age_given": {
+                        "description": "The user has given their age",
+                        "move_to": "_end_",
+                    },
+                    "doubts": {
+                        "description": "The user is not sure",
+                        "move_to": "loop_forever",
+                    },
+                },
+            },
+            "loop_forever": {
+                "goal": "Keep asking",
+                "outcomes": {
+                    "again": {
+                        "description": "The user is still not sure",
+                        "move_to": "loop_forever",
+                    }
+                },
+            },
+            "orphan": {
+                "goal": "Never reached",
+                "outcomes": {
+                    "done": {
+                        "description": "Done",
+                        "move_to": "_end_",
+                    }
+                },
+            },
+            "questions": {
+                "accessible_from": ["_all_"],
+                "description": "The user asks you a question.",
+                "goal": "Answer their question",
+                "outcomes": {
+                    "no_more_questions": {
+                        "description": "The user has no more questions",
+                        "move_to": "_backtrack_",
+                    }
+                },
+            },
+        }
+    }
+    config.update(kwargs)
+    return config
+
+
+def test_compiler_finds_unreachable_and_dead_end_stages():
+    router = IntentRouter(make_config())
+    report = router.compilation_report
+    assert report.initial_stage == "ask_for_name"
+    assert report.unreachable_stages == ["orphan"]
+    assert set(report.reachable_stages) == {"ask_for_name", "ask_for_age", "loop_forever", "questions", "_end_"}
+    # loop_forever can still reach _end_ through the 'questions' stage and backtracking
+    assert report.dead_end_stages == []
+
+
+def test_compiler_prunes_unreachable_stages():
+    router = IntentRouter(make_config())
+    assert "orphan" not in router.stages
+    assert "orphan" not in router.graph.nodes
+    assert router.compilation_report.pruned
+
+
+def test_compiler_can_keep_unreachable_stages():
+    router = IntentRouter(make_config(prune_unreachable_stages=False))
+    assert "orphan" in router.stages
+    assert not router.compilation_report.pruned
+
+
+def test_compiler_finds_dead_ends():
+    config = make_config()
+    del config["stages"]["questions"]
+    router = IntentRouter(config)
+    assert router.compilation_report.dead_end_stages == ["loop_forever"]
+
+
+def test_compiler_report_summary():
+    summary = IntentRouter(make_config()).compilation_report.summary()
+    assert "Unreachable stages (pruned): orphan" in summary
+    assert "Stages that can't reach '_end_': -" in summary
+
+
+def test_compiler_finds_unused_tools():
+    class UnusedTool(Tool):
+        id = "unused-test-tool"
+        name = "unused_test_tool"
+        description = "A tool nobody can call."
+        parameters = []
+
+        async def run(self, params=None):
+            return True
+
+    config = make_config()
+    config["stages"]["orphan"]["tools"] = [{"id": "unused-test-tool"}]
+    router = IntentRouter(config)
+    assert router.compilation_report.unused_tools == ["unused_test_tool"]
@@ -1,8 +1,10 @@
 # SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
+import asyncio
+
 import pytest
-from intentional_core import IntentRouter
+from intentional_core import IntentRouter, Tool
 
 
 def test_router_must_have_stages():
@@ -316,3 +318,184 @@ async def test_router_simple_backtracking():
     assert router.get_external_transitions() == []
     _, _ = await router.run({"outcome": "no_more_questions"})
     assert router.current_stage_name == "ask_for_name"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("outcome", ["name_given", "Name Given", " NAME-GIVEN ", "name_givne", "nam_given"])
+async def test_router_resolves_near_miss_outcomes(outcome):
+    router = IntentRouter(
+        {
+            "stages": {
+                "ask_for_name": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Ask the user for their name",
+                    "outcomes": {
+                        "name_given": {
+                            "description": "The user has given their name",
+                            "move_to": "_end_",
+                        },
+                        "name_refused": {
+                            "description": "The user doesn't want to give their name",
+                            "move_to": "_end_",
+                        },
+                    },
+                },
+                "questions": {
+                    "accessible_from": ["_all_"],
+                    "description": "The user asks you a question.",
+                    "goal": "Answer their question",
+                    "outcomes": {
+                        "no_more_questions": {
+                            "description": "The user has no more questions",
+                            "move_to": "_backtrack_",
+                        }
+                    },
+                },
+            }
+        }
+    )
+    _, _ = await router.run({"outcome": outcome})
+    assert router.current_stage_name == "_end_"
+
+
+@pytest.mark.asyncio
+async def test_router_resolves_near_miss_transitions():
+    router = IntentRouter(
+        {
+            "stages": {
+                "ask_for_name": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Ask the user for their name",
+                    "outcomes": {
+                        "name_given": {
+                            "description": "The user has given their name",
+                            "move_to": "_end_",
+                        }
+                    },
+                },
+                "questions": {
+                    "accessible_from": ["_all_"],
+                    "description": "The user asks you a question.",
+                    "goal": "Answer their question",
+                    "outcomes": {
+                        "no_more_questions": {
+                            "description": "The user has no more questions",
+                            "move_to": "_backtrack_",
+                        }
+                    },
+                },
+            }
+        }
+    )
+    _, _ = await router.run({"outcome": "Questions"})
+    assert router.current_stage_name == "questions"
+
+
+@pytest.mark.asyncio
+async def test_router_does_not_resolve_ambiguous_outcomes():
+    router = IntentRouter(
+        {
+            "outcome_match_threshold": 0.5,
+            "stages": {
+                "ask_for_name": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Ask the user for their name",
+                    "outcomes": {
+                        "name_a": {
+                            "description": "The user has given their name",
+                            "move_to": "_end_",
+                        },
+                        "name_b": {
+                            "description": "The user has given their name",
+                            "move_to": "_end_",
+                        },
+                    },
+                }
+            },
+        }
+    )
+    with pytest.raises(ValueError, match="Unknown outcome 'name_c' for stage 'ask_for_name'"):
+        _, _ = await router.run({"outcome": "name_c"})
+
+
+@pytest.mark.asyncio
+async def test_router_prefetches_tools_on_stage_entry():
+    class TodayTool(Tool):
+        id = "today-test-tool"
+        name = "today"
+        description = "Today's date."
+        parameters = []
+        prefetch = True
+        runs = 0
+
+        async def run(self, params=None):
+            TodayTool.runs += 1
+            return "2024-01-01"
+
+    router = IntentRouter(
+        {
+            "stages": {
+                "greet": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Greet the user",
+                    "outcomes": {"greeted": {"description": "The user was greeted", "move_to": "reschedule"}},
+                },
+                "reschedule": {
+                    "goal": "Reschedule the interview",
+                    "tools": [{"id": "today-test-tool"}],
+                    "outcomes": {"done": {"description": "Rescheduled", "move_to": "_end_"}},
+                },
+            }
+        }
+    )
+    _, tools = await router.run({"outcome": "greeted"})
+    await asyncio.sleep(0)
+    assert TodayTool.runs == 1
+    assert await tools["today"].invoke({}) == "2024-01-01"
+    assert TodayTool.runs == 1
+
+
+@pytest.mark.asyncio
+async def test_router_creates_tools_on_first_stage_entry():
+    class ConnectedTool(Tool):
+        id = "connected-test-tool"
+        name = "connected"
+        description = "Opens a connection when created."
+        parameters = []
+        created = 0
+
+        def __init__(self, host="localhost"):
+            ConnectedTool.created += 1
+            self.host = host
+
+        async def run(self, params=None):
+            return self.host
+
+    config = {
+        "stages": {
+            "greet": {
+                "accessible_from": ["_start_"],
+                "goal": "Greet the user",
+                "outcomes": {"greeted": {"description": "The user was greeted", "move_to": "lookup"}},
+            },
+            "lookup": {
+                "goal": "Look something up",
+                "tools": [{"id": "connected-test-tool", "host": "example.com"}],
+                "outcomes": {"done": {"description": "Done", "move_to": "_end_"}},
+            },
+        }
+    }
+    router = IntentRouter(config)
+    assert ConnectedTool.created == 0
+    assert not router.stages["lookup"].tools.is_created("connected")
+    assert router.stages["lookup"].tools_tokens > 0
+
+    _, tools = await router.run({"outcome": "greeted"})
+    assert ConnectedTool.created == 1
+    assert await tools["connected"].invoke({}) == "example.com"
+    assert ConnectedTool.created == 1
+
+    # The configuration is still validated when it's loaded
+    config["stages"]["lookup"]["tools"] = [{"id": "connected-test-tool", "port": 80}]
+    with pytest.raises(ValueError, match="Invalid configuration for tool 'connected-test-tool'"):
+        IntentRouter(config)
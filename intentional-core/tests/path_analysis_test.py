@@ -0,0 +1,127 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import pytest
+from intentional_core import IntentRouter
+
+numpy = pytest.importorskip("numpy")
+
+from intentional_core.path_analysis import (  # noqa: E402
+    TransitionMatrix,
+    analyze_path,
+    analyze_paths,
+    transition_matrices,
+    transition_matrix,
+)
+
+
+@pytest.fixture
+def intent_router():
+    return IntentRouter(
+        {
+            "stages": {
+                "ask_for_name": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Ask the user for their name",
+                    "outcomes": {
+                        "name_given": {
+                            "description": "The user has given their name",
+                            "move_to": "ask_for_age",
+                        },
+                        "refused": {
+                            "description": "The user doesn't want to talk",
+                            "move_to": "_end_",
+                        },
+                    },
+                },
+                "ask_for_age": {
+                    "goal": "Ask the user for their age",
+                    "outcomes": {
+                        "age_given": {
+                            "description": "The user has given their age",
+                            "move_to": "_end_",
+                        },
+                    },
+                },
+                "questions": {
+                    "accessible_from": ["ask_for_age"],
+                    "description": "The user asks you a question.",
+                    "goal": "Answer their question",
+                    "outcomes": {
+                        "no_more_questions": {
+                            "description": "The user has no more questions",
+                            "move_to": "_backtrack_",
+                        }
+                    },
+                },
+            }
+        }
+    )
+
+
+def test_transition_matrix_uniform(intent_router):
+    transition = transition_matrix(intent_router)
+    index = {stage: i for i, stage in enumerate(transition.stages)}
+    assert transition.matrix[index["ask_for_name"], index["ask_for_age"]] == 0.5
+    assert transition.matrix[index["ask_for_name"], index["_end_"]] == 0.5
+    assert transition.matrix[index["ask_for_age"], index["questions"]] == 0.5
+    assert transition.matrix[index["questions"], index["ask_for_age"]] == 1.0
+    assert transition.absorbing_stages == ["_end_"]
+    assert numpy.allclose(transition.matrix.sum(axis=1), 1.0)
+
+
+def test_transition_matrix_unknown_move(intent_router):
+    with pytest.raises(ValueError, match="Unknown moves for stage 'ask_for_name'"):
+        transition_matrix(intent_router, {"ask_for_name": {"wrong": 1.0}})
+
+
+def test_analyze_path(intent_router):
+    analysis = analyze_path(
+        transition_matrix(intent_router, {"ask_for_name": {"name_given": 1.0}, "ask_for_age": {"age_given": 1.0}})
+    )
+    assert analysis.expected_turns == pytest.approx(2.0)
+    assert analysis.end_probability == pytest.approx(1.0)
+    assert analysis.hitting_probabilities["questions"] == pytest.approx(0.0)
+    assert analysis.occupancy["ask_for_age"] == pytest.approx(1.0)
+
+
+def test_analyze_paths_batch(intent_router):
+    small_router = IntentRouter(
+        {
+            "stages": {
+                "greet": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Say hello",
+                    "outcomes": {"done": {"description": "Done", "move_to": "_end_"}},
+                }
+            }
+        }
+    )
+    transitions = transition_matrices(intent_router, [None, {"ask_for_name": {"name_given": 1.0}}])
+    transitions.append(transition_matrix(small_router))
+    uniform, always_continue, small = analyze_paths(transitions)
+
+    # From ask_for_age: E = 1 + 0.5 * (1 + E)  =>  E = 3
+    assert uniform.expected_turns_by_stage["ask_for_age"] == pytest.approx(3.0)
+    assert uniform.expected_turns == pytest.approx(1 + 0.5 * 3.0)
+    assert uniform.hitting_probabilities["ask_for_age"] == pytest.approx(0.5)
+    assert always_continue.expected_turns == pytest.approx(4.0)
+    assert always_continue.occupancy["ask_for_age"] == pytest.approx(2.0)
+    assert small.expected_turns == pytest.approx(1.0)
+    assert small.end_probability == pytest.approx(1.0)
+
+
+def test_analyze_paths_infinite_loop(intent_router):
+    transition = transition_matrix(intent_router, {"ask_for_age": {"questions": 1.0}})
+    with pytest.raises(ValueError, match="loop that can never be left"):
+        analyze_path(transition)
+
+
+@pytest.mark.parametrize("weights", [(0.1, 0.2), (0.7, 0.3), (1 / 3, 2 / 3)])
+def test_analyze_paths_infinite_loop_with_inexact_weights(weights):
+    # The rows of the loop add up to almost exactly 1, so I - Q is not exactly singular
+    first, second = weights[0] / sum(weights), weights[1] / sum(weights)
+    matrix = numpy.array([[0, first, second, 0], [1, 0, 0, 0], [1, 0, 0, 0], [0, 0, 0, 1]])
+    transition = TransitionMatrix(stages=["greet", "chat", "joke", "_end_"], matrix=matrix, initial_stage="greet")
+    with pytest.raises(ValueError, match=r"the stages \['greet', 'chat', 'joke'\] can't reach any end"):
+        analyze_path(transition)
@@ -0,0 +1,182 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import threading
+from textwrap import dedent
+
+import pytest
+import intentional_core.intent_routing as intent_routing
+from intentional_core import IntentRouter
+from intentional_core.intent_routing import SubConversationStage
+
+
+@pytest.fixture(autouse=True)
+def clear_subconversations_cache():
+    intent_routing._SUBCONVERSATIONS = {}
+    intent_routing._COMPILED_SUBCONVERSATIONS = {}
+
+
+@pytest.fixture
+def subconversation_file(tmp_path):
+    path = tmp_path / "address.yml"
+    path.write_text(
+        dedent(
+            """
+            stages:
+              ask_for_street:
+                accessible_from: _start_
+                goal: ask the user for their street.
+                outcomes:
+                  ok:
+                    description: user tells you their street
+                    move_to: ask_for_city
+              ask_for_city:
+                goal: ask the user for their city.
+                outcomes:
+                  ok:
+                    description: user tells you their city
+                    move_to: _end_
+                  refused:
+                    description: user doesn't want to tell you their city
+                    move_to: _end_
+            """
+        )
+    )
+    return path
+
+
+def make_router(tmp_path):
+    return IntentRouter(
+        {
+            "base_path": str(tmp_path),
+            "stages": {
+                "ask_for_name": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Ask the user for their name",
+                    "outcomes": {
+                        "name_given": {
+                            "description": "The user has given their name",
+                            "move_to": "collect_address",
+                        }
+                    },
+                },
+                "collect_address": {
+                    "conversation_file": "address.yml",
+                    "outcomes": {
+                        "ok": {"description": "The user gave their address", "move_to": "_end_"},
+                        "refused": {"description": "The user refused", "move_to": "ask_for_name"},
+                    },
+                },
+            },
+        }
+    )
+
+
+def test_subconversation_is_not_loaded_upfront(tmp_path, subconversation_file):
+    router = make_router(tmp_path)
+    assert isinstance(router.stages["collect_address"], SubConversationStage)
+    assert "collect_address/ask_for_street" not in router.stages
+    assert not intent_routing._SUBCONVERSATIONS
+
+
+def test_subconversation_file_must_exist(tmp_path):
+    with pytest.raises(ValueError, match="Sub-conversation file .* of stage 'collect_address' not found"):
+        make_router(tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_subconversation_is_loaded_on_entry(tmp_path, subconversation_file):
+    router = make_router(tmp_path)
+    prompt, _ = await router.run({"outcome": "name_given"})
+    assert router.current_stage_name == "collect_address/ask_for_street"
+    assert "ask the user for their street" in prompt
+    assert subconversation_file.resolve() in intent_routing._SUBCONVERSATIONS
+
+    await router.run({"outcome": "ok"})
+    assert router.current_stage_name == "collect_address/ask_for_city"
+
+
+@pytest.mark.asyncio
+async def test_subconversation_end_maps_to_outcomes(tmp_path, subconversation_file):
+    router = make_router(tmp_path)
+    await router.run({"outcome": "name_given"})
+    await router.run({"outcome": "ok"})
+    await router.run({"outcome": "refused"})
+    assert router.current_stage_name == "ask_for_name"
+
+    await router.run({"outcome": "name_given"})
+    assert router.current_stage_name == "collect_address/ask_for_street"
+    await router.run({"outcome": "ok"})
+    await router.run({"outcome": "ok"})
+    assert router.current_stage_name == "_end_"
+
+
+@pytest.mark.asyncio
+async def test_subconversation_is_cached_across_routers(tmp_path, subconversation_file):
+    router = make_router(tmp_path)
+    await router.run({"outcome": "name_given"})
+
+    # The file is not parsed again by other routers
+    subconversation_file.write_text("not: [valid")
+    other_router = make_router(tmp_path)
+    await other_router.run({"outcome": "name_given"})
+    assert other_router.current_stage_name == "collect_address/ask_for_street"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "content",
+    [
+        "not: [valid",
+        "stages:\n  ask_for_street:\n    goal: ask the user for their street.\n",
+        "stages:\n  ask_for_street:\n    accessible_from: _start_\n    goal: ask the user for their street.\n"
+        "    outcomes:\n      ok:\n        description: done\n        move_to: nowhere\n",
+    ],
+    ids=["bad-yaml", "no-start-stage", "unknown-target"],
+)
+async def test_failed_load_leaves_the_router_unchanged(tmp_path, subconversation_file, content):
+    subconversation_file.write_text(content)
+    router = make_router(tmp_path)
+    stages = set(router.stages)
+    with pytest.raises(Exception):
+        await router.run({"outcome": "name_given"})
+    assert router.current_stage_name == "ask_for_name"
+    assert router.backtracking_stack == []
+    assert set(router.stages) == stages
+    assert set(router.graph.nodes) >= stages and not any("/" in node for node in router.graph.nodes)
+    assert router.stages["collect_address"].initial_stage is None
+
+
+@pytest.mark.asyncio
+async def test_subconversation_is_compiled_once_off_the_event_loop(tmp_path, subconversation_file, monkeypatch):
+    compiled_in = []
+    compile_subconversation = intent_routing.compile_subconversation
+
+    def spy(stage_name, stage):
+        compiled_in.append(threading.get_ident())
+        return compile_subconversation(stage_name, stage)
+
+    monkeypatch.setattr(intent_routing, "compile_subconversation", spy)
+    routers = [make_router(tmp_path) for _ in range(3)]
+    for router in routers:
+        await router.run({"outcome": "name_given"})
+        assert router.current_stage_name == "collect_address/ask_for_street"
+
+    assert len(compiled_in) == 1
+    assert compiled_in[0] != threading.get_ident()
+    # Each router has its own stages, built from the shared compiled sub-conversation
+    assert (
+        routers[0].stages["collect_address/ask_for_street"] is not routers[1].stages["collect_address/ask_for_street"]
+    )
+
+
+@pytest.mark.asyncio
+async def test_subconversation_cant_move_to_parent_stages(tmp_path, subconversation_file):
+    subconversation_file.write_text(
+        "stages:\n  ask_for_street:\n    accessible_from: _start_\n    goal: ask the user for their street.\n"
+        "    outcomes:\n      help:\n        description: user wants a human\n        move_to: ask_for_name\n"
+    )
+    router = make_router(tmp_path)
+    with pytest.raises(ValueError, match="moves to 'ask_for_name', which is not a stage of the sub-conversation"):
+        await router.run({"outcome": "name_given"})
+    assert router.current_stage_name == "ask_for_name"
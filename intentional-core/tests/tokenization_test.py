@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import pytest
+import structlog
+from intentional_core import IntentRouter, Tokenizer, load_tokenizer_from_dict
+from intentional_core.tokenization import ApproximateTokenizer
+
+
+def make_router(**kwargs):
+    return IntentRouter(
+        {
+            "stages": {
+                "ask_for_name": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Ask the user for their name",
+                    "outcomes": {
+                        "name_given": {
+                            "description": "The user has given their name",
+                            "move_to": "_end_",
+                        }
+                    },
+                }
+            },
+            **kwargs,
+        }
+    )
+
+
+def test_default_tokenizer_is_approximate():
+    tokenizer = load_tokenizer_from_dict()
+    assert isinstance(tokenizer, ApproximateTokenizer)
+    assert tokenizer.count_tokens("12345678") == 2
+    assert tokenizer.count_tokens("123456789") == 3
+
+
+def test_unknown_tokenizer():
+    with pytest.raises(ValueError, match="Unknown tokenizer type 'nope'"):
+        load_tokenizer_from_dict({"type": "nope"})
+
+
+def test_custom_tokenizer():
+    class WordsTokenizer(Tokenizer):
+        name = "test-words"
+
+        def count_tokens(self, text):
+            return len(text.split())
+
+    router = make_router(tokenizer={"type": "test-words"})
+    stage = router.stages["ask_for_name"]
+    assert stage.prompt_tokens == len(router.get_prompt("ask_for_name").split())
+    assert stage.tools_tokens > 0
+    assert stage.total_tokens == stage.prompt_tokens + stage.tools_tokens
+
+
+def test_stage_tokens_are_counted_for_every_stage():
+    router = make_router()
+    for stage in router.stages.values():
+        assert stage.prompt_tokens
+        assert stage.total_tokens
+
+
+def test_oversized_stages_are_flagged():
+    with structlog.testing.capture_logs() as logs:
+        make_router(context_window=100)
+    warnings = [entry for entry in logs if entry["log_level"] == "warning"]
+    assert any(entry.get("stage_name") == "ask_for_name" for entry in warnings)
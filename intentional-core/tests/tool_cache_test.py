@@ -0,0 +1,140 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import pytest
+import intentional_core.tool_cache as tool_cache
+from intentional_core.tools import Tool, ToolParameter, load_tools_from_dict
+from intentional_core.tool_cache import ToolResultCache
+
+
+@pytest.fixture(autouse=True)
+def clear_shared_caches():
+    tool_cache._SHARED_CACHES = {}
+
+
+class CountingTool(Tool):
+    id = "counting-test-tool"
+    name = "counting_test_tool"
+    description = "Counts how many times it ran."
+    parameters = [ToolParameter("request", "A request.", "string", True, None)]
+
+    def __init__(self, name="counting_test_tool"):
+        self.name = name
+        self.calls = 0
+
+    async def run(self, params=None):
+        self.calls += 1
+        return f"{params['request']} {self.calls}"
+
+
+def test_cache_lru_eviction():
+    cache = ToolResultCache(ttl=None, max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert len(cache) == 2
+
+
+def test_cache_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(tool_cache.time, "monotonic", lambda: now[0])
+    cache = ToolResultCache(ttl=10)
+    cache.set("a", None)
+    assert cache.get("a") == (True, None)
+    now[0] = 111.0
+    assert cache.get("a") == (False, None)
+    assert not len(cache)
+
+
+def test_cache_key_normalizes_arguments():
+    tool = CountingTool()
+    assert ToolResultCache.make_key(tool, {"a": 1, "b": 2}) == ToolResultCache.make_key(tool, {"b": 2, "a": 1})
+
+
+@pytest.mark.asyncio
+async def test_tools_are_not_cached_by_default():
+    tool = load_tools_from_dict([{"id": "counting-test-tool"}])["counting_test_tool"]
+    assert tool.cache is None
+    assert await tool.invoke({"request": "x"}) == "x 1"
+    assert await tool.invoke({"request": "x"}) == "x 2"
+
+
+@pytest.mark.asyncio
+async def test_cached_tool():
+    tool = load_tools_from_dict([{"id": "counting-test-tool", "cache": {"ttl": 60, "max_size": 10}}])[
+        "counting_test_tool"
+    ]
+    assert await tool.invoke({"request": "x"}) == "x 1"
+    assert await tool.invoke({"request": "x"}) == "x 1"
+    assert await tool.invoke({"request": "y"}) == "y 2"
+    assert tool.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_shared_cache():
+    loaded = load_tools_from_dict(
+        [
+            {"id": "counting-test-tool", "cache": {"shared": True}},
+            {"id": "counting-test-tool", "name": "other", "cache": {"shared": True}},
+        ]
+    )
+    first, second = loaded["counting_test_tool"], loaded["other"]
+    assert first.cache is second.cache
+    # Tools with a different name don't share results, even in a shared cache
+    await first.invoke({"request": "x"})
+    assert await second.invoke({"request": "x"}) == "x 1"
+    assert second.calls == 1
+    other_first = load_tools_from_dict([{"id": "counting-test-tool", "cache": {"shared": True}}])["counting_test_tool"]
+    assert await other_first.invoke({"request": "x"}) == "x 1"
+    assert other_first.calls == 0
+
+
+class GreetingTool(Tool):
+    id = "greeting-test-tool"
+    name = "greeting_test_tool"
+    description = "Greets people."
+    parameters = []
+
+    def __init__(self, greeting="Hello"):
+        self.greeting = greeting
+
+    async def run(self, params=None):
+        return self.greeting
+
+
+@pytest.mark.asyncio
+async def test_shared_cache_keeps_configurations_apart():
+    english = load_tools_from_dict([{"id": "greeting-test-tool", "cache": {"shared": True}}])["greeting_test_tool"]
+    italian = load_tools_from_dict([{"id": "greeting-test-tool", "greeting": "Ciao", "cache": {"shared": True}}])[
+        "greeting_test_tool"
+    ]
+    assert english.cache is italian.cache
+    assert await english.invoke({}) == "Hello"
+    assert await italian.invoke({}) == "Ciao"
+
+
+def test_shared_cache_settings_must_match():
+    load_tools_from_dict([{"id": "counting-test-tool", "cache": {"shared": True, "ttl": 30}}])
+    load_tools_from_dict([{"id": "counting-test-tool", "name": "other", "cache": {"shared": True, "ttl": 30}}])
+    with pytest.raises(ValueError, match="The shared cache of tool 'counting-test-tool' is configured with ttl=30"):
+        load_tools_from_dict([{"id": "counting-test-tool", "cache": {"shared": True}}])
+
+
+def test_cached_results_are_copies():
+    cache = ToolResultCache()
+    result = {"items": ["a"]}
+    cache.set("key", result)
+    result["items"].append("b")
+    _, cached = cache.get("key")
+    assert cached == {"items": ["a"]}
+    cached["items"].append("c")
+    assert cache.get("key") == (True, {"items": ["a"]})
+
+
+def test_results_that_cant_be_copied_are_not_cached():
+    cache = ToolResultCache()
+    cache.set("key", (item for item in []))
+    assert cache.get("key") == (False, None)
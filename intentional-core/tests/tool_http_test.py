@@ -0,0 +1,192 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import intentional_core.tools as tools
+import intentional_core.tool_http as tool_http
+from intentional_core.tools import Tool, load_tools_from_dict
+from intentional_core.intent_routing import Stage
+from intentional_core.tool_http import SharedHTTPClient, configure_http_client
+from intentional_core.tool_execution import close_tool_execution
+
+
+@pytest.fixture(autouse=True)
+def reset_http_client():
+    yield
+    tool_http._HTTP_CLIENT = None
+    configure_http_client()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.client_ports.add(self.client_address[1])
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        time.sleep(server.delay)
+        with server.lock:
+            server.in_flight -= 1
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    pytest.importorskip("httpx")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.client_ports = set()
+    server.in_flight = 0
+    server.max_in_flight = 0
+    server.delay = 0.0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_connections_are_kept_alive(stub_server):
+    client = SharedHTTPClient()
+    url = f"http://127.0.0.1:{stub_server.server_port}/"
+    for _ in range(3):
+        response = await client.get(url)
+        assert response.text == "ok"
+    await client.aclose()
+    assert len(stub_server.client_ports) == 1
+
+
+@pytest.mark.asyncio
+async def test_connections_per_host_are_limited(stub_server):
+    stub_server.delay = 0.05
+    client = SharedHTTPClient(max_connections_per_host=2)
+    url = f"http://127.0.0.1:{stub_server.server_port}/"
+    await asyncio.gather(*(client.get(url) for _ in range(6)))
+    await client.aclose()
+    assert stub_server.max_in_flight == 2
+
+
+def test_http_client_is_injected(monkeypatch):
+    shared_client = object()
+    monkeypatch.setattr(tools, "get_http_client", lambda: shared_client)
+    monkeypatch.setattr(tools, "http_client_available", lambda: True)
+
+    class FetchTool(Tool):
+        id = "fetch-test-tool"
+        name = "fetch_test_tool"
+        description = "Fetches a page."
+        parameters = []
+
+        def __init__(self, http_client=None):
+            self.http_client = http_client
+
+        async def run(self, params=None):
+            return None
+
+    class OfflineTool(FetchTool):
+        id = "offline-test-tool"
+        name = "offline_test_tool"
+
+        def __init__(self):  # pylint: disable=super-init-not-called
+            self.http_client = None
+
+    loaded = load_tools_from_dict([{"id": "fetch-test-tool"}, {"id": "offline-test-tool"}])
+    assert loaded["fetch_test_tool"].http_client is shared_client
+    assert loaded["fetch_test_tool"].init_config == {}
+    assert loaded["offline_test_tool"].http_client is None
+
+
+def test_optional_http_client_without_httpx(monkeypatch):
+    monkeypatch.setattr(tool_http, "httpx", None)
+
+    class OptionalFetchTool(Tool):
+        id = "optional-fetch-test-tool"
+        name = "optional_fetch_test_tool"
+        description = "Fetches a page, with its own client if there's no shared one."
+        parameters = []
+
+        def __init__(self, http_client=None):
+            self.http_client = http_client
+
+        async def run(self, params=None):
+            return None
+
+    class RequiredFetchTool(OptionalFetchTool):
+        id = "required-fetch-test-tool"
+        name = "required_fetch_test_tool"
+
+        def __init__(self, http_client):  # pylint: disable=useless-parent-delegation
+            super().__init__(http_client)
+
+    assert load_tools_from_dict([{"id": "optional-fetch-test-tool"}])["optional_fetch_test_tool"].http_client is None
+    with pytest.raises(ImportError, match="requires httpx"):
+        load_tools_from_dict([{"id": "required-fetch-test-tool"}])
+
+
+def test_required_http_client_with_lazy_stage_tools(monkeypatch):
+    shared_client = object()
+    monkeypatch.setattr(tools, "get_http_client", lambda: shared_client)
+
+    class ClientOnlyTool(Tool):
+        id = "client-only-test-tool"
+        name = "client_only_test_tool"
+        description = "Fetches a page with the shared client."
+        parameters = []
+
+        def __init__(self, http_client):
+            self.http_client = http_client
+
+        async def run(self, params=None):
+            return None
+
+    stage = Stage("fetch", {"goal": "Fetch pages", "tools": [{"id": "client-only-test-tool"}]})
+    assert not stage.tools.is_created("client_only_test_tool")
+    assert stage.tools["client_only_test_tool"].http_client is shared_client
+
+    with pytest.raises(ValueError, match="Invalid configuration for tool 'client-only-test-tool'"):
+        Stage("fetch", {"goal": "Fetch pages", "tools": [{"id": "client-only-test-tool", "timeout_s": 1}]})
+
+
+class FakeClient:
+    closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_replaced_client_is_closed():
+    old_client = tool_http._HTTP_CLIENT = FakeClient()
+    configure_http_client({"timeout": 1.0})
+    assert old_client.closed
+    assert tool_http._HTTP_CLIENT is None
+
+
+@pytest.mark.asyncio
+async def test_replaced_client_is_closed_in_the_background():
+    old_client = tool_http._HTTP_CLIENT = FakeClient()
+    configure_http_client({"timeout": 1.0})
+    await asyncio.sleep(0)
+    assert old_client.closed
+
+
+@pytest.mark.asyncio
+async def test_client_is_closed_when_the_bot_shuts_down():
+    client = tool_http._HTTP_CLIENT = FakeClient()
+    await close_tool_execution()
+    assert client.closed
+    assert tool_http._HTTP_CLIENT is None
@@ -0,0 +1,66 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import asyncio
+
+import pytest
+import intentional_core.tool_metrics as tool_metrics
+from intentional_core.tools import ToolTimeoutError
+from intentional_core.tool_metrics import ToolCallTracker, get_tool_stats, reset_tool_stats, set_slow_call_threshold
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    reset_tool_stats()
+    yield
+    reset_tool_stats()
+    set_slow_call_threshold(2.0)
+
+
+def test_successful_call_is_recorded():
+    with ToolCallTracker("lookup", "call_1", {"key": "a"}) as call:
+        call.set_output("value")
+    stats = get_tool_stats("lookup")["lookup"]
+    assert stats.calls == 1
+    assert stats.errors == 0
+    assert sum(stats.latency_buckets) == 1
+    assert stats.argument_bytes == len('{"key": "a"}')
+    assert stats.output_bytes == len("value")
+    assert stats.latency_percentile(50) == tool_metrics.LATENCY_BUCKETS[0]
+
+
+def test_errors_timeouts_and_cancellations():
+    with ToolCallTracker("lookup", "call_1", {}) as call:
+        call.fail(ToolTimeoutError("Timed out"))
+    with pytest.raises(RuntimeError):
+        with ToolCallTracker("lookup", "call_2", {}):
+            raise RuntimeError("Boom")
+    with pytest.raises(asyncio.CancelledError):
+        with ToolCallTracker("lookup", "call_3", {}):
+            raise asyncio.CancelledError()
+    with ToolCallTracker("lookup", "call_4", {}):
+        pass
+
+    stats = get_tool_stats()["lookup"]
+    assert stats.calls == 4
+    assert stats.errors == 2
+    assert stats.timeouts == 1
+    assert stats.cancelled == 1
+    assert stats.error_rate == 0.5
+    assert stats.timeout_rate == 0.25
+
+
+def test_slow_calls_are_logged(monkeypatch):
+    warnings = []
+    monkeypatch.setattr(tool_metrics.log, "warning", lambda *args, **kwargs: warnings.append(kwargs))
+    set_slow_call_threshold(0.0)
+    with ToolCallTracker("lookup", "call_1", {"key": "a"}):
+        pass
+    assert warnings[0]["call_id"] == "call_1"
+    assert warnings[0]["tool_arguments"] == {"key": "a"}
+
+    warnings.clear()
+    set_slow_call_threshold(None)
+    with ToolCallTracker("lookup", "call_2", {"key": "a"}):
+        pass
+    assert not warnings
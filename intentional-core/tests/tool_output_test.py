@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json
+
+import pytest
+from intentional_core.tools import Tool, load_tools_from_dict
+from intentional_core.tool_output import OutputLimit, truncate_value
+from intentional_core.tool_streaming import ToolProgress
+
+
+def size(value):
+    return len(json.dumps(value).encode("utf-8"))
+
+
+def test_small_values_are_untouched():
+    value = {"a": [1, 2, 3]}
+    assert truncate_value(value, 100) is value
+
+
+def test_list_keeps_its_first_items():
+    rows = [{"id": index, "name": f"Product {index}"} for index in range(100)]
+    truncated = truncate_value(rows, 300)
+    assert size(truncated) <= 300
+    assert truncated[0] == rows[0]
+    assert truncated[-1].endswith("more items]")
+    assert all(isinstance(row, dict) for row in truncated[:-1])
+
+
+def test_dict_keeps_its_first_keys():
+    mapping = {"summary": "ok", "rows": list(range(1000)), "footer": "end"}
+    truncated = truncate_value(mapping, 200)
+    assert size(truncated) <= 200
+    assert truncated["summary"] == "ok"
+    assert isinstance(truncated["rows"], list)
+    assert truncated["_truncated"] == "1 more keys"
+
+
+def test_string_keeps_its_beginning():
+    text = "é" * 1000
+    truncated = truncate_value(text, 100)
+    assert size(truncated) <= 100
+    assert truncated.startswith("éé")
+    assert truncated.endswith("[2000 bytes, truncated]")
+
+
+@pytest.mark.parametrize(
+    "value",
+    [list(range(1000)), {f"key_{index}": index for index in range(50)}, "x" * 1000],
+    ids=["list", "dict", "str"],
+)
+@pytest.mark.parametrize("max_bytes", [20, 5])
+def test_tiny_budgets_are_respected(value, max_bytes):
+    limit = OutputLimit(max_bytes=max_bytes)
+    truncated = limit.truncate(value)
+    assert limit.fits(truncated)
+    assert size(truncated) <= max_bytes
+    assert truncated == ("[truncated]" if max_bytes == 20 else "")
+
+
+def test_token_budget():
+    limit = OutputLimit(max_tokens=50, tokenizer={"type": "approximate", "chars_per_token": 4})
+    truncated = limit.truncate(["word " * 10] * 20)
+    assert limit.fits(truncated)
+    assert truncated[0] == "word " * 10
+
+
+def test_limit_needs_a_budget():
+    with pytest.raises(ValueError):
+        OutputLimit()
+
+
+class CatalogueTool(Tool):
+    id = "catalogue-test-tool"
+    name = "catalogue_test_tool"
+    description = "Lists the whole catalogue."
+    parameters = []
+
+    def __init__(self, summarize=False):
+        self.summarize = summarize
+
+    async def run(self, params=None):
+        yield ToolProgress("Reading the catalogue...")
+        yield [f"Product {index}" for index in range(1000)]
+
+    async def summarize_output(self, output):
+        if self.summarize:
+            return {"products": len(output), "first": output[:3]}
+        return output
+
+
+@pytest.mark.asyncio
+async def test_tool_outputs_and_partials_are_truncated():
+    tool = load_tools_from_dict([{"id": "catalogue-test-tool", "output_limit": {"max_bytes": 200}}])[
+        "catalogue_test_tool"
+    ]
+    partials = []
+
+    async def on_partial(partial):
+        partials.append(partial)
+
+    output = await tool.invoke({}, on_partial=on_partial)
+    assert size(output) <= 200
+    assert output[0] == "Product 0"
+    assert partials[0] == ToolProgress("Reading the catalogue...")
+    assert partials[1] == output
+
+
+@pytest.mark.asyncio
+async def test_summarize_hook_runs_before_truncation():
+    tool = load_tools_from_dict([{"id": "catalogue-test-tool", "summarize": True, "output_limit": {"max_bytes": 200}}])[
+        "catalogue_test_tool"
+    ]
+    assert await tool.invoke({}) == {"products": 1000, "first": ["Product 0", "Product 1", "Product 2"]}
@@ -0,0 +1,146 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import os
+import asyncio
+
+import pytest
+import intentional_core.tool_sandbox as tool_sandbox
+from intentional_core.tools import Tool, ToolParameter, load_tools_from_dict
+from intentional_core.tool_sandbox import ToolSandboxError, ToolSandboxPool, configure_sandbox_pool
+
+
+@pytest.fixture(autouse=True)
+def reset_sandbox_pool():
+    yield
+    configure_sandbox_pool()
+    tool_sandbox._SANDBOX_POOL = None
+
+
+class SandboxedTool(Tool):
+    """
+    Must be defined at module level, so the workers can import it.
+    """
+
+    id = "sandboxed-test-tool"
+    name = "sandboxed_test_tool"
+    description = "Reports where it runs."
+    parameters = [ToolParameter("action", "What to do.", "string", False, "pid")]
+
+    def __init__(self, greeting="hello"):
+        self.greeting = greeting
+
+    async def run(self, params=None):
+        action = params.get("action", "pid")
+        if action == "fail":
+            raise ValueError("Broken on purpose")
+        if action == "hang":
+            await asyncio.sleep(10)
+        if action == "print":
+            print("This must not reach the bot's pipe")
+        if action == "env":
+            return {name: os.environ.get(name) for name in ("SANDBOX_TEST_SECRET", "SANDBOX_TEST_ALLOWED")}
+        return {"pid": os.getpid(), "greeting": self.greeting}
+
+
+def sandboxed_tool(**config):
+    tool = SandboxedTool(**config)
+    tool.init_config = config
+    return tool
+
+
+@pytest.mark.asyncio
+async def test_tool_runs_in_a_worker():
+    pool = ToolSandboxPool(max_workers=1)
+    try:
+        output = await pool.run_tool(sandboxed_tool(greeting="hi"), {"action": "print"})
+        assert output["pid"] != os.getpid()
+        assert output["greeting"] == "hi"
+        # Same worker, same warm tool instance
+        assert (await pool.run_tool(sandboxed_tool(greeting="hi"), {}))["pid"] == output["pid"]
+    finally:
+        await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_errors_are_reported_and_the_worker_survives():
+    pool = ToolSandboxPool(max_workers=1)
+    try:
+        with pytest.raises(ToolSandboxError, match="ValueError: Broken on purpose"):
+            await pool.run_tool(sandboxed_tool(), {"action": "fail"})
+        assert (await pool.run_tool(sandboxed_tool(), {}))["greeting"] == "hello"
+    finally:
+        await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_workers_are_recycled_after_max_calls():
+    pool = ToolSandboxPool(max_workers=1, max_calls_per_worker=2)
+    try:
+        pids = [(await pool.run_tool(sandboxed_tool(), {}))["pid"] for _ in range(3)]
+        assert pids[0] == pids[1] != pids[2]
+        assert pool.recycled == 1
+    finally:
+        await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_workers_are_recycled_above_the_memory_ceiling():
+    pool = ToolSandboxPool(max_workers=1, max_memory_mb=1)
+    try:
+        first = await pool.run_tool(sandboxed_tool(), {})
+        second = await pool.run_tool(sandboxed_tool(), {})
+        assert first["pid"] != second["pid"]
+    finally:
+        await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_calls_kill_their_worker():
+    pool = ToolSandboxPool(max_workers=1)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pool.run_tool(sandboxed_tool(), {"action": "hang"}), timeout=0.5)
+        assert (await pool.run_tool(sandboxed_tool(), {}))["greeting"] == "hello"
+    finally:
+        await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_sandbox_execution_mode():
+    configure_sandbox_pool({"max_workers": 1})
+    tool = load_tools_from_dict([{"id": "sandboxed-test-tool", "greeting": "hey", "execution": "sandbox"}])[
+        "sandboxed_test_tool"
+    ]
+    pool = tool_sandbox.get_sandbox_pool()
+    assert __name__ in pool.preload
+    try:
+        assert await tool.invoke({}) == {"pid": (await pool.run_tool(tool, {}))["pid"], "greeting": "hey"}
+    finally:
+        await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_workers_do_not_see_the_bots_environment(monkeypatch):
+    monkeypatch.setenv("SANDBOX_TEST_SECRET", "s3cret")
+    monkeypatch.setenv("SANDBOX_TEST_ALLOWED", "visible")
+    pool = ToolSandboxPool(max_workers=1)
+    allowed = sandboxed_tool()
+    allowed.sandbox_env = ("SANDBOX_TEST_ALLOWED",)
+    try:
+        assert await pool.run_tool(allowed, {"action": "env"}) == {
+            "SANDBOX_TEST_SECRET": None,
+            "SANDBOX_TEST_ALLOWED": "visible",
+        }
+        # The allowed variables are only set while the tool that asked for them runs
+        assert await pool.run_tool(sandboxed_tool(greeting="other"), {"action": "env"}) == {
+            "SANDBOX_TEST_SECRET": None,
+            "SANDBOX_TEST_ALLOWED": None,
+        }
+    finally:
+        await pool.aclose()
+
+
+def test_sandbox_env_needs_the_sandbox():
+    with pytest.raises(ValueError, match="only applies"):
+        load_tools_from_dict([{"id": "sandboxed-test-tool", "sandbox_env": ["SANDBOX_TEST_ALLOWED"]}])
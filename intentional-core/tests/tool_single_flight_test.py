@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import asyncio
+
+import pytest
+import intentional_core.tool_single_flight as tool_single_flight
+from intentional_core.tools import Tool, ToolParameter, load_tools_from_dict
+
+
+BACKEND_CALLS = []
+
+
+@pytest.fixture(autouse=True)
+def check_no_calls_left_in_flight():
+    BACKEND_CALLS.clear()
+    yield
+    assert not tool_single_flight._IN_FLIGHT
+
+
+class AvailabilityTool(Tool):
+    id = "availability-test-tool"
+    name = "check_availability"
+    description = "Checks the availability of a slot on a shared backend."
+    parameters = [ToolParameter("slot", "The slot to check.", "string", True, None)]
+
+    async def run(self, params=None):
+        BACKEND_CALLS.append(params["slot"])
+        await asyncio.sleep(0.05)
+        return f"{params['slot']} is free"
+
+
+def load_availability_tools(count, **options):
+    # Each session loads its own instance of the tool
+    return [
+        load_tools_from_dict([{"id": "availability-test-tool", **options}])["check_availability"] for _ in range(count)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_identical_concurrent_calls_are_coalesced():
+    sessions = load_availability_tools(5, single_flight=True)
+    outputs = await asyncio.gather(*[tool.invoke({"slot": "9am"}) for tool in sessions])
+    assert outputs == ["9am is free"] * 5
+    assert BACKEND_CALLS == ["9am"]
+
+
+@pytest.mark.asyncio
+async def test_different_calls_are_not_coalesced():
+    sessions = load_availability_tools(2, single_flight=True)
+    await asyncio.gather(sessions[0].invoke({"slot": "9am"}), sessions[1].invoke({"slot": "10am"}))
+    assert sorted(BACKEND_CALLS) == ["10am", "9am"]
+
+
+@pytest.mark.asyncio
+async def test_calls_are_not_coalesced_by_default():
+    sessions = load_availability_tools(2)
+    await asyncio.gather(*[tool.invoke({"slot": "9am"}) for tool in sessions])
+    assert BACKEND_CALLS == ["9am", "9am"]
+
+
+@pytest.mark.asyncio
+async def test_late_calls_do_not_join():
+    first, second = load_availability_tools(2, single_flight={"window": 0.01})
+    first_call = asyncio.ensure_future(first.invoke({"slot": "9am"}))
+    await asyncio.sleep(0.02)
+    await asyncio.gather(first_call, second.invoke({"slot": "9am"}))
+    assert BACKEND_CALLS == ["9am", "9am"]
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_first_caller_does_not_cancel_the_others():
+    first, second = load_availability_tools(2, single_flight=True)
+    first_call = asyncio.ensure_future(first.invoke({"slot": "9am"}))
+    second_call = asyncio.ensure_future(second.invoke({"slot": "9am"}))
+    await asyncio.sleep(0.01)
+    first_call.cancel()
+    assert await second_call == "9am is free"
+    assert BACKEND_CALLS == ["9am"]
+
+
+@pytest.mark.asyncio
+async def test_cancelling_all_the_callers_cancels_the_call():
+    cancelled = asyncio.Event()
+
+    class SlowAvailabilityTool(Tool):
+        id = "slow-availability-test-tool"
+        name = "check_slow_availability"
+        description = "Checks the availability of a slot on a slow backend."
+        parameters = []
+
+        async def run(self, params=None):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+    first, second = [
+        load_tools_from_dict([{"id": "slow-availability-test-tool", "single_flight": True}])["check_slow_availability"]
+        for _ in range(2)
+    ]
+    calls = [asyncio.ensure_future(first.invoke({})), asyncio.ensure_future(second.invoke({}))]
+    await asyncio.sleep(0.01)
+    calls[0].cancel()
+    await asyncio.sleep(0.01)
+    assert not cancelled.is_set()
+    calls[1].cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    await asyncio.gather(*calls, return_exceptions=True)
+    await asyncio.sleep(0)
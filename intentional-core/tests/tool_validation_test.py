@@ -0,0 +1,77 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import pytest
+from intentional_core.tools import Tool, ToolParameter, load_tools_from_dict
+from intentional_core.tool_validation import ToolArgumentsError, compile_validator
+
+
+PARAMETERS = [
+    ToolParameter("query", "What to search.", "string", True, None),
+    ToolParameter("limit", "How many results.", "integer", False, 10),
+    ToolParameter("threshold", "Minimum score.", "number", False, None),
+    ToolParameter("exact", "Exact match only.", "boolean", False, False),
+    ToolParameter("tags", "Tags to filter by.", "array", False, None),
+]
+
+
+def test_fills_defaults():
+    validate = compile_validator("search", PARAMETERS)
+    assert validate({"query": "shoes"}) == {"query": "shoes", "limit": 10, "exact": False}
+
+
+def test_coerces_types():
+    validate = compile_validator("search", PARAMETERS)
+    assert validate({"query": 42, "limit": "5", "threshold": "0.5", "exact": "true", "tags": '["red"]'}) == {
+        "query": "42",
+        "limit": 5,
+        "threshold": 0.5,
+        "exact": True,
+        "tags": ["red"],
+    }
+
+
+def test_accepts_python_types():
+    validate = compile_validator("search", [ToolParameter("limit", "How many results.", int, True, None)])
+    assert validate({"limit": 3.0}) == {"limit": 3}
+
+
+@pytest.mark.parametrize(
+    "params,message",
+    [
+        ({}, "Tool 'search' is missing the required argument 'query'."),
+        ({"query": None}, "Tool 'search' is missing the required argument 'query'."),
+        ({"query": "shoes", "limit": "many"}, "Argument 'limit' of tool 'search' must be of type 'integer'"),
+        ({"query": "shoes", "limit": 2.5}, "Argument 'limit' of tool 'search' must be of type 'integer'"),
+        ({"query": "shoes", "exact": "maybe"}, "Argument 'exact' of tool 'search' must be of type 'boolean'"),
+        ({"query": "shoes", "tags": "red"}, "Argument 'tags' of tool 'search' must be of type 'array'"),
+        ({"query": "shoes", "sort": "asc"}, "Tool 'search' got unknown arguments: sort."),
+    ],
+)
+def test_rejects_invalid_arguments(params, message):
+    validate = compile_validator("search", PARAMETERS)
+    with pytest.raises(ToolArgumentsError, match=message):
+        validate(params)
+
+
+@pytest.mark.asyncio
+async def test_invalid_arguments_do_not_run_the_tool():
+    calls = []
+
+    class SearchTool(Tool):
+        id = "search-test-tool"
+        name = "search"
+        description = "Search things."
+        parameters = PARAMETERS
+
+        async def run(self, params=None):
+            calls.append(params)
+            return "found"
+
+    tool = load_tools_from_dict([{"id": "search-test-tool"}])["search"]
+    with pytest.raises(ToolArgumentsError):
+        await tool.invoke({"limit": 3})
+    assert calls == []
+
+    assert await tool.invoke({"query": "shoes", "limit": "3"}) == "found"
+    assert calls == [{"query": "shoes", "limit": 3, "exact": False}]
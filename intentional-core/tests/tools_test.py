@@ -1,14 +1,35 @@
 # SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
 # SPDX-License-Identifier: AGPL-3.0-or-later
 
+import os
+import time
+import asyncio
+import functools
+import threading
+
 import pytest
 import intentional_core.tools as tools
-from intentional_core.tools import Tool, ToolParameter, load_tools_from_dict
+from intentional_core.tools import Tool, ToolParameter, ToolTimeoutError, load_tools_from_dict
+from intentional_core.tool_execution import ToolThreadPool, configure_tool_execution
+from intentional_core.tool_streaming import ToolProgress
+
+
+class WorkerTool(Tool):
+    """
+    Module-level tool, so that worker processes can import it.
+    """
+
+    id = "worker-test-tool"
+    name = "worker_test_tool"
+    description = "Counts its own calls."
+    parameters = []
 
+    def __init__(self, start=0):
+        self.calls = start
 
-@pytest.fixture(autouse=True)
-def clear_collected_tools():
-    tools._TOOL_CLASSES = {}
+    def run(self, params=None):
+        self.calls += 1
+        return os.getpid(), self.calls
 
 
 def test_define_tool():
@@ -157,3 +178,301 @@ def test_load_tool_must_specify_id():
 
     with pytest.raises(ValueError, match="Tool definitions must have an 'id' field."):
         load_tools_from_dict([{"name": "no-run-test-tool"}])
+
+
+@pytest.mark.asyncio
+async def test_tool_timeout():
+    class SlowTool(Tool):
+        id = "slow-test-tool"
+        name = "slow_test_tool"
+        description = "A slow tool."
+        parameters = []
+
+        async def run(self, params=None):
+            await asyncio.sleep(1)
+
+    tool = load_tools_from_dict([{"id": "slow-test-tool", "timeout": 0.01}])["slow_test_tool"]
+    with pytest.raises(ToolTimeoutError, match="Tool 'slow_test_tool' timed out after 0.01 seconds."):
+        await tool.invoke({})
+
+
+@pytest.mark.asyncio
+async def test_tool_max_concurrency():
+    running = []
+
+    class LimitedTool(Tool):
+        id = "limited-test-tool"
+        name = "limited_test_tool"
+        description = "A tool that can't run too many times at once."
+        parameters = []
+
+        async def run(self, params=None):
+            running.append(1)
+            assert len(running) <= 2
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    loaded = load_tools_from_dict(
+        [
+            {"id": "limited-test-tool", "max_concurrency": 2},
+            {"id": "limited-test-tool", "max_concurrency": 2},
+        ]
+    )
+    tool = loaded["limited_test_tool"]
+    await asyncio.gather(*[tool.invoke({}) for _ in range(6)])
+
+
+@pytest.mark.asyncio
+async def test_tool_instances_with_different_concurrency_limits():
+    running = []
+    max_running = []
+
+    class DifferentlyLimitedTool(Tool):
+        id = "differently-limited-test-tool"
+        name = "differently_limited_test_tool"
+        description = "A tool configured with two different limits."
+        parameters = []
+
+        async def run(self, params=None):
+            running.append(1)
+            max_running.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    strict = load_tools_from_dict([{"id": "differently-limited-test-tool", "max_concurrency": 1}])
+    relaxed = load_tools_from_dict([{"id": "differently-limited-test-tool", "max_concurrency": 3}])
+    await strict["differently_limited_test_tool"].invoke({})
+    await asyncio.gather(*[relaxed["differently_limited_test_tool"].invoke({}) for _ in range(3)])
+    assert max(max_running) == 3
+
+
+@pytest.mark.asyncio
+async def test_sync_tool_runs_in_thread_pool():
+    loop_thread = threading.get_ident()
+
+    class BlockingTool(Tool):
+        id = "blocking-test-tool"
+        name = "blocking_test_tool"
+        description = "A tool wrapping a blocking library."
+        parameters = []
+
+        def run(self, params=None):
+            time.sleep(0.01)
+            return threading.get_ident()
+
+    tool = load_tools_from_dict([{"id": "blocking-test-tool"}])["blocking_test_tool"]
+    assert await tool.invoke({}) != loop_thread
+
+
+def logged(function):
+    def wrapper(*args, **kwargs):
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+def traced(function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return function(*args, **kwargs)
+
+    return wrapper
+
+
+class DecoratedTool(Tool):
+    id = "decorated-test-tool"
+    name = "decorated_test_tool"
+    description = "An async tool behind a decorator."
+    parameters = []
+
+    @logged
+    async def run(self, params=None):
+        return "done"
+
+
+class WrappedTool(DecoratedTool):
+    id = "wrapped-test-tool"
+    name = "wrapped_test_tool"
+
+    @traced
+    async def run(self, params=None):
+        return threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_decorated_async_tools_are_awaited():
+    loaded = load_tools_from_dict([{"id": "decorated-test-tool"}, {"id": "wrapped-test-tool"}])
+    assert await loaded["decorated_test_tool"].invoke({}) == "done"
+    # Decorators that keep track of the wrapped method let the tool run on the event loop directly
+    assert await loaded["wrapped_test_tool"].invoke({}) == threading.get_ident()
+
+
+@pytest.mark.asyncio
+async def test_tool_thread_pool_idle_calls_are_not_queued():
+    pool = ToolThreadPool(max_workers=2)
+    try:
+        await pool.run(time.sleep, 0.01)
+        await asyncio.gather(pool.run(time.sleep, 0.01), pool.run(time.sleep, 0.01))
+        metrics = pool.metrics()
+        assert metrics["max_queue_depth"] == 0
+        assert metrics["completed"] == 3
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_tool_thread_pool_queue_depth():
+    pool = ToolThreadPool(max_workers=1)
+    release = threading.Event()
+    try:
+        calls = [asyncio.ensure_future(pool.run(release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        assert pool.metrics()["active"] == 1
+        assert pool.metrics()["queue_depth"] == 2
+
+        calls[2].cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*calls, return_exceptions=True)
+        metrics = pool.metrics()
+        assert metrics["queue_depth"] == 0
+        assert metrics["max_queue_depth"] == 2
+        assert metrics["completed"] == 2
+        assert metrics["cancelled"] == 1
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_process_tool_runs_in_warm_worker():
+    configure_tool_execution({"process_pool": {"max_workers": 1}})
+    try:
+        tool = load_tools_from_dict([{"id": "worker-test-tool", "start": 10, "execution": "process"}])[
+            "worker_test_tool"
+        ]
+        first_pid, first_count = await tool.invoke({})
+        second_pid, second_count = await tool.invoke({})
+        assert first_pid == second_pid != os.getpid()
+        assert (first_count, second_count) == (11, 12)
+        assert tool.calls == 10
+    finally:
+        configure_tool_execution({})
+
+
+def test_load_tool_unknown_execution_mode():
+    with pytest.raises(ValueError, match="Unknown execution mode 'gpu'"):
+        load_tools_from_dict([{"id": "worker-test-tool", "execution": "gpu"}])
+
+
+def test_tools_are_registered_when_defined():
+    class RegisteredTool(Tool):
+        id = "registered-test-tool"
+        name = "registered_test_tool"
+        description = "A tool."
+        parameters = []
+
+        async def run(self, params=None):
+            pass
+
+    assert tools._TOOL_CLASSES["registered-test-tool"] is RegisteredTool
+
+
+class StreamingTool(Tool):
+    id = "streaming-test-tool"
+    name = "streaming_test_tool"
+    description = "Finds results one at a time."
+    parameters = []
+
+    async def run(self, params=None):
+        yield ToolProgress("Starting the search")
+        yield ["a"]
+        yield ["a", "b"]
+        yield ToolProgress("Done")
+
+
+@pytest.mark.asyncio
+async def test_streaming_tool():
+    partials = []
+
+    async def on_partial(partial):
+        partials.append(partial)
+
+    tool = load_tools_from_dict([{"id": "streaming-test-tool"}])["streaming_test_tool"]
+    assert await tool.invoke({}, on_partial=on_partial) == ["a", "b"]
+    assert partials == [ToolProgress("Starting the search"), ["a"], ["a", "b"], ToolProgress("Done")]
+
+
+@pytest.mark.parametrize("tool_id", ["streaming-test-tool", "clock-test-tool"])
+@pytest.mark.parametrize("execution", ["thread", "process"])
+def test_async_tools_cant_leave_the_event_loop(tool_id, execution):
+    with pytest.raises(ValueError, match=f"has an async 'run' method, so it can't use 'execution: {execution}'"):
+        load_tools_from_dict([{"id": tool_id, "execution": execution}])
+
+
+class ClockTool(Tool):
+    id = "clock-test-tool"
+    name = "clock_test_tool"
+    description = "Tells the time."
+    parameters = [ToolParameter("timezone", "The timezone.", "string", False, "UTC")]
+    prefetch = True
+
+    def __init__(self):
+        self.runs = []
+
+    async def run(self, params=None):
+        self.runs.append(params)
+        await asyncio.sleep(0.01)
+        return f"12:00 {params['timezone']}"
+
+
+@pytest.mark.asyncio
+async def test_prefetched_tool_is_served_without_running_again():
+    tool = load_tools_from_dict([{"id": "clock-test-tool"}])["clock_test_tool"]
+    tool.start_prefetch()
+    tool.start_prefetch()
+    assert await tool.invoke({"timezone": "UTC"}) == "12:00 UTC"
+    assert tool.runs == [{"timezone": "UTC"}]
+
+
+@pytest.mark.asyncio
+async def test_prefetched_output_is_used_once():
+    tool = load_tools_from_dict([{"id": "clock-test-tool"}])["clock_test_tool"]
+    tool.start_prefetch()
+    assert await tool.invoke({}) == "12:00 UTC"
+    assert len(tool.runs) == 1
+    # The second call runs the tool again
+    assert await tool.invoke({}) == "12:00 UTC"
+    assert len(tool.runs) == 2
+
+
+@pytest.mark.asyncio
+async def test_prefetched_output_needs_the_same_arguments():
+    tool = load_tools_from_dict([{"id": "clock-test-tool"}])["clock_test_tool"]
+    tool.start_prefetch()
+    assert await tool.invoke({"timezone": "CET"}) == "12:00 CET"
+    assert len(tool.runs) == 2
+    # The prefetch is still there for a call with the default arguments
+    assert await tool.invoke({}) == "12:00 UTC"
+    assert len(tool.runs) == 2
+
+
+@pytest.mark.asyncio
+async def test_prefetched_output_expires():
+    tool = load_tools_from_dict([{"id": "clock-test-tool", "prefetch_validity": 0}])["clock_test_tool"]
+    tool.start_prefetch()
+    await tool.invoke({})
+    assert len(tool.runs) == 2
+
+
+def test_tools_with_required_parameters_cant_be_prefetched():
+    class LookupTool(Tool):
+        id = "lookup-test-tool"
+        name = "lookup_test_tool"
+        description = "Looks things up."
+        parameters = [ToolParameter("key", "What to look up.", "string", True, None)]
+
+        async def run(self, params=None):
+            pass
+
+    with pytest.raises(ValueError, match="has required parameters, so it can't be prefetched"):
+        load_tools_from_dict([{"id": "lookup-test-tool", "prefetch": True}])
@@ -8,10 +8,12 @@ import asyncio
 import logging
 import logging.config
 import argparse
+from pathlib import Path
 
 import yaml
 import structlog
-from intentional_core import load_configuration_file, IntentRouter
+from intentional_core import load_configuration_file, IntentRouter, BotInterface
+from intentional_core.tool_execution import close_tool_execution
 from intentional_core.utils import import_plugin
 
 from intentional.draw import to_image
@@ -114,7 +116,17 @@ def main():
         return
 
     bot = load_configuration_file(args.path)
-    asyncio.run(bot.run())
+    asyncio.run(run_bot(bot))
+
+
+async def run_bot(bot: BotInterface) -> None:
+    """
+    Run the bot, and release what its tools share when it stops.
+    """
+    try:
+        await bot.run()
+    finally:
+        await close_tool_execution()
 
 
 async def draw_intent_graph_from_config(path: str) -> IntentRouter:
@@ -134,5 +146,9 @@ async def draw_intent_graph_from_config(path: str) -> IntentRouter:
 
     # Remove YAML extension from path
     path = path.rsplit(".", 1)[0]
-    intent_router = IntentRouter(config.pop("conversation", {}))
+    # Draw the whole graph, including stages that can't be reached, as it's meant as a debugging aid
+    conversation_config = config.pop("conversation", {})
+    conversation_config.setdefault("prune_unreachable_stages", False)
+    conversation_config.setdefault("base_path", str(Path(path).parent))
+    intent_router = IntentRouter(conversation_config)
     return await to_image(intent_router, path + ".png")
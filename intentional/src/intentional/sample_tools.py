@@ -51,6 +51,7 @@ class GetCurrentDateTimeTool(Tool):
     name = "get_current_date_and_time"
     description = "Get the current date and time in the format 'YYYY-MM-DD HH:MM:SS'."
     parameters = []
+    prefetch = True
 
     async def run(self, params: Optional[Dict[str, Any]] = None) -> str:
         """
@@ -5,17 +5,26 @@
 Client for OpenAI's Chat Completion API.
 """
 
-from typing import Any, Dict, List, AsyncGenerator, TYPE_CHECKING
+from typing import Any, Dict, List, Set, AsyncGenerator, TYPE_CHECKING
 
 import os
 import json
+import asyncio
 import structlog
 
 import openai
 from intentional_core import LLMClient
 from intentional_core.intent_routing import IntentRouter
+from intentional_core.tokenization import load_tokenizer_from_dict
 from intentional_core.end_conversation import EndConversationTool
-from intentional_openai.tools import to_openai_tool
+from intentional_core.tools import ToolTimeoutError
+from intentional_core.tool_metrics import ToolCallTracker
+from intentional_core.tool_validation import ToolArgumentsError
+from intentional_core.tool_streaming import tool_progress_event
+from intentional_openai.tools import get_tool_schemas
+from intentional_openai.history import ConversationHistory
+from intentional_openai.context_window import ContextWindow
+from intentional_openai.compaction import load_compactor_from_dict
 
 if TYPE_CHECKING:
     from intentional_core.bot_structures.bot_structure import BotStructure
@@ -67,8 +76,17 @@ class ChatCompletionAPIClient(LLMClient):
         self.client = openai.AsyncOpenAI(api_key=self.api_key)
         self.system_prompt = None
         self.tools = None
+        self._tool_tasks: Set[asyncio.Task] = set()
+
+        # Limits on the history sent with each request. Tokens are counted with the router's tokenizer by default.
+        context_window_config = dict(config.get("context_window") or {})
+        tokenizer_config = context_window_config.pop("tokenizer", None)
+        tokenizer = load_tokenizer_from_dict(tokenizer_config) if tokenizer_config else self.intent_router.tokenizer
+        self.context_window = ContextWindow(tokenizer, **context_window_config)
+        # Summarizes the older turns in the background once the history gets long
+        self.compactor = load_compactor_from_dict(self.client, self.llm_name, config.get("compaction"))
+
         self.setup_initial_prompt()
-        self.conversation = [{"role": "system", "content": self.system_prompt}]
 
     def setup_initial_prompt(self) -> None:
         """
@@ -76,7 +94,10 @@ class ChatCompletionAPIClient(LLMClient):
         """
         self.system_prompt = self.intent_router.get_prompt()
         self.tools = self.intent_router.current_stage.tools
-        self.conversation: List[Dict[str, Any]] = [{"role": "system", "content": self.system_prompt}]
+        self.conversation = ConversationHistory(self.system_prompt)
+        self.context_window.reset()
+        if self.compactor:
+            self.compactor.cancel()
         log.debug("Initial system prompt set", system_prompt=self.system_prompt)
 
     async def run(self) -> None:
@@ -90,7 +111,7 @@ class ChatCompletionAPIClient(LLMClient):
         """
         Update the system prompt in the LLM.
         """
-        self.conversation = [{"role": "system", "content": self.system_prompt}] + self.conversation[1:]
+        self.conversation.system_prompt = self.system_prompt
         await self.emit("on_system_prompt_updated", {"system_prompt": self.system_prompt})
 
     async def handle_interruption(self, lenght_to_interruption: int) -> None:
@@ -102,7 +123,11 @@ class ChatCompletionAPIClient(LLMClient):
                 This value could be number of characters, number of words, milliseconds, number of audio frames, etc.
                 depending on the bot structure that implements it.
         """
-        log.warning("TODO! Implement handle_interruption in ChatCompletionAPIClient")
+        # Cancel the tools that are still running: their output is not needed anymore
+        for task in list(self._tool_tasks):
+            log.debug("Cancelling tool call due to a user's interruption.")
+            task.cancel()
+        log.warning("TODO! Implement response truncation in ChatCompletionAPIClient.handle_interruption")
 
     async def send(self, data: Dict[str, Any]) -> None:
         """
@@ -112,103 +137,153 @@ class ChatCompletionAPIClient(LLMClient):
 
         # Generate a response
         message = data["text_message"]
+        if message.get("role") == "user":
+            self._apply_compaction()
         response = await self._send_message(message)
 
         # Unwrap the response to make sure it contains no function calls to handle
-        call_id = ""
-        function_name = ""
-        function_args = ""
-        assistant_response = ""
-        async for r in response:
-            if not call_id:
-                call_id = r.to_dict()["id"]
-            delta = r.to_dict()["choices"][0]["delta"]
-
-            if "tool_calls" not in delta:
+        tool_calls: Dict[int, Dict[str, str]] = {}
+        assistant_fragments: List[str] = []
+        async for chunk in response:
+            # Read the fields straight from the chunk: converting each chunk to a dict costs more than the rest of
+            # the loop, and there's one chunk per token
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            if not delta.tool_calls:
                 # If this is not a function call, just stream out
-                await self.emit("on_text_message_from_llm", {"delta": delta.get("content")})
-                assistant_response += delta.get("content") or ""
+                await self.emit("on_text_message_from_llm", {"delta": delta.content})
+                if delta.content:
+                    assistant_fragments.append(delta.content)
             else:
-                # TODO handle multiple parallel function calls
-                if delta["tool_calls"][0]["index"] > 0 or len(delta["tool_calls"]) > 1:
-                    log.error("TODO: Multiple parallel function calls not supported yet. Please open an issue.")
-                    log.debug("Multiple parallel function calls", delta=delta)
-                # Consume the response to understand which tool to call with which parameters
-                for tool_call in delta["tool_calls"]:
-                    if not function_name:
-                        function_name = tool_call["function"].get("name")
-                    function_args += tool_call["function"]["arguments"]
-
-        if not function_name:
+                # Consume the response to understand which tools to call with which parameters.
+                # Each parallel call has its own index, and its fragments must be collected separately.
+                for tool_call in delta.tool_calls:
+                    call = tool_calls.setdefault(tool_call.index, {"id": "", "name": "", "arguments": ""})
+                    call["id"] = call["id"] or tool_call.id or ""
+                    if tool_call.function:
+                        call["name"] = call["name"] or tool_call.function.name or ""
+                        call["arguments"] += tool_call.function.arguments or ""
+        assistant_response = "".join(assistant_fragments)
+
+        if not tool_calls:
             # If there was no function call, update the conversation history and return
             self.conversation.append(message)
             self.conversation.append({"role": "assistant", "content": assistant_response})
+            if self.compactor:
+                self.compactor.maybe_start(self.conversation, self.context_window.total_tokens(self.conversation))
         else:
-            # Otherwise deal with the function call
-            await self._handle_function_call(message, call_id, function_name, function_args)
+            # Otherwise deal with the function calls
+            await self._handle_function_calls(message, [tool_calls[index] for index in sorted(tool_calls)])
 
         await self.emit("on_llm_stops_generating_response", {})
 
+    def _apply_compaction(self) -> None:
+        """
+        Swap in the compacted history, if a summary was written in the background. Only called between turns.
+        """
+        if not self.compactor:
+            return
+        conversation = self.compactor.apply(self.conversation)
+        if conversation is not None:
+            self.conversation = ConversationHistory(self.system_prompt, conversation[1:])
+            self.context_window.reset()
+
     async def _send_message(self, message: Dict[str, Any]) -> AsyncGenerator[Dict[str, Any], None]:
         """
-        Generate a response to a message.
+        Generate a response to a message. Only the part of the history that fits in the context window is sent.
 
         Args:
             message: The message to respond to.
         """
         return await self.client.chat.completions.create(
             model=self.llm_name,
-            messages=self.conversation + [message],
+            messages=self.context_window.select(self.conversation, message),
             stream=True,
-            tools=[{"type": "function", "function": to_openai_tool(t)} for t in self.tools.values()],
+            tools=get_tool_schemas(self.tools).chat_completion,
             tool_choice="auto",
             n=1,
         )
 
-    async def _handle_function_call(
-        self,
-        message: Dict[str, Any],
-        call_id: str,
-        function_name: str,
-        function_args: str,
-    ):
+    async def _handle_function_calls(self, message: Dict[str, Any], tool_calls: List[Dict[str, str]]):
         """
-        Handle a function call from the LLM.
+        Handle the function calls requested by the LLM in a single response. Regular tools are run concurrently and all
+        their results are sent back to the LLM in one follow-up request.
+
+        Args:
+            message: the message that triggered the function calls.
+            tool_calls: the function calls, each with its `id`, `name` and `arguments` (as a JSON string).
         """
-        log.debug(
-            "Function call detected",
-            function_name=function_name,
-            function_args=function_args,
-        )
-        function_args = json.loads(function_args)
+        log.debug("Function calls detected", tool_calls=tool_calls)
+        for tool_call in tool_calls:
+            tool_call["arguments"] = json.loads(tool_call["arguments"] or "{}")
+        names = [tool_call["name"] for tool_call in tool_calls]
 
         # Routing function call - this is special because it should not be recorded in the conversation history
-        if function_name == self.intent_router.name:
-            await self._route(function_args)
+        if self.intent_router.name in names:
+            if len(tool_calls) > 1:
+                log.warning("The LLM called other tools together with the router. Only the router will run.")
+            await self._route(tool_calls[names.index(self.intent_router.name)]["arguments"])
             # Send the same message again with the new system prompt and no trace of the routing call.
             # We don't append the user message to the history in order to avoid message duplication.
             await self.send({"text_message": message})
 
         # Check if the conversation should end
-        elif function_name == EndConversationTool.name:
+        elif EndConversationTool.name in names:
             await self.tools[EndConversationTool.name].run()
             self.setup_initial_prompt()
             await self.emit("on_conversation_ended", {})
 
         else:
-            # Handle a regular function call - this one shows up in the history as normal
+            # Handle regular function calls - these show up in the history as normal
             # so we start by appending the user message
             self.conversation.append(message)
-            output = await self._call_tool(call_id, function_name, function_args)
-            await self.send(
+            # Record the tool invocations in the conversation
+            self.conversation.append(
                 {
-                    "text_message": {
-                        "role": "tool",
-                        "content": json.dumps(output),
-                        "tool_call_id": call_id,
-                    }
+                    "role": "assistant",
+                    "tool_calls": [
+                        {
+                            "id": tool_call["id"],
+                            "type": "function",
+                            "function": {
+                                "arguments": json.dumps(tool_call["arguments"]),
+                                "name": tool_call["name"],
+                            },
+                        }
+                        for tool_call in tool_calls
+                    ],
                 }
             )
+            tasks = [
+                asyncio.create_task(self._call_tool(tool_call["id"], tool_call["name"], tool_call["arguments"]))
+                for tool_call in tool_calls
+            ]
+            self._tool_tasks.update(tasks)
+            try:
+                outputs = await asyncio.gather(*tasks, return_exceptions=True)
+            finally:
+                self._tool_tasks.difference_update(tasks)
+
+            interrupted = False
+            for index, output in enumerate(outputs):
+                if isinstance(output, asyncio.CancelledError):
+                    interrupted = True
+                    outputs[index] = {"error": "Cancelled because the user interrupted."}
+                elif isinstance(output, BaseException):
+                    raise output
+            results = [
+                {"role": "tool", "content": json.dumps(output), "tool_call_id": tool_call["id"]}
+                for tool_call, output in zip(tool_calls, outputs)
+            ]
+            if interrupted:
+                # The user interrupted: keep the history consistent, but don't ask for a reply
+                self.conversation.extend(results)
+                return
+            # All results but the last go straight into the history, the last one triggers the follow-up request
+            self.conversation.extend(results[:-1])
+            await self.send({"text_message": results[-1]})
 
     async def _route(self, routing_info: Dict[str, Any]) -> None:
         """
@@ -230,29 +305,25 @@ class ChatCompletionAPIClient(LLMClient):
         """
         await self.emit("on_tool_invoked", {"name": function_name, "args": function_args})
 
-        # Record the tool invocation in the conversation
-        self.conversation.append(
-            {
-                "role": "assistant",
-                "tool_calls": [
-                    {
-                        "id": call_id,
-                        "type": "function",
-                        "function": {
-                            "arguments": json.dumps(function_args),
-                            "name": function_name,
-                        },
-                    }
-                ],
-            }
-        )
-
         # Get the tool output
         if function_name not in self.tools:
             log.debug("The LLM called a non-existing tool.", tool=function_name)
             output = f"Tool '{function_name}' not found."
         else:
-            log.debug("Calling tool", function_name=function_name, function_args=function_args)
-            output = await self.tools[function_name].run(function_args)
+            log.debug("Calling tool", call_id=call_id, function_name=function_name, function_args=function_args)
+
+            async def forward_partial(partial: Any) -> None:
+                # Chat Completions needs the complete tool output, so partial outputs only reach the interface
+                await self.emit("on_tool_progress", tool_progress_event(function_name, call_id, partial))
+
+            with ToolCallTracker(function_name, call_id, function_args) as call:
+                try:
+                    output = await self.tools[function_name].invoke(function_args, on_partial=forward_partial)
+                except (ToolArgumentsError, ToolTimeoutError) as exc:
+                    # Let the LLM know right away, instead of running a tool that will fail or waiting for one that
+                    # may never return
+                    call.fail(exc)
+                    output = {"error": str(exc)}
+                call.set_output(output)
         log.debug("Tool run", tool_output=output)
         return output
@@ -0,0 +1,183 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+Background compaction of long conversation histories.
+
+Once the history grows past a threshold, the older turns are summarized by the LLM in a background task, while the
+conversation goes on. The summary replaces those turns in the history only between two turns, in a single step, so
+a turn never sees a history that is half compacted.
+"""
+
+from typing import Any, Dict, List, Optional
+
+import asyncio
+
+import structlog
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+DEFAULT_INSTRUCTIONS = (
+    "You are summarizing the beginning of a conversation between a user and an assistant, so that the assistant can "
+    "continue it without the full transcript. Keep every fact, name, number, decision and open question that may "
+    "matter later, and drop the small talk. If the transcript starts with an earlier summary, merge it into yours."
+)
+""" The instructions given to the LLM that writes the summaries. """
+
+
+def render_transcript(messages: List[Dict[str, Any]]) -> str:
+    """
+    Render messages as a plain-text transcript for the LLM that summarizes them.
+
+    Args:
+        messages: the messages to render.
+
+    Returns:
+        One line per message, prefixed by its role.
+    """
+    lines = []
+    for message in messages:
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call["function"]
+            lines.append(f"assistant called {function['name']} with {function['arguments']}")
+        if message.get("content"):
+            lines.append(f"{message['role']}: {message['content']}")
+    return "\n".join(lines)
+
+
+class HistoryCompactor:
+    """
+    Summarizes the older turns of a conversation in the background, once the history passes a token threshold.
+
+    The summary is a system message that takes the place of the turns it summarizes, right after the system prompt.
+    The most recent `keep_turns` turns are never compacted. Later compactions summarize the previous summary together
+    with the turns that followed it, so the summary keeps running for the whole conversation.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        model: str,
+        threshold_tokens: int,
+        keep_turns: int = 4,
+        instructions: str = DEFAULT_INSTRUCTIONS,
+    ) -> None:
+        """
+        Args:
+            client: the OpenAI client used to write the summaries.
+            model: the LLM that writes the summaries.
+            threshold_tokens: compaction starts when the history has more tokens than this.
+            keep_turns: how many of the most recent turns are always kept as they are.
+            instructions: the instructions for the LLM that writes the summaries.
+        """
+        self.client = client
+        self.model = model
+        self.threshold_tokens = threshold_tokens
+        self.keep_turns = keep_turns
+        self.instructions = instructions
+        self.summary: Optional[Dict[str, Any]] = None
+        """ The summary message currently in the history, if any. """
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        """
+        Whether a summary is being written.
+        """
+        return self._task is not None and not self._task.done()
+
+    def maybe_start(self, conversation: List[Dict[str, Any]], tokens: int) -> None:
+        """
+        Start summarizing the older turns in the background, if the history is over the threshold and no summary is
+        being written already. Returns immediately.
+
+        Args:
+            conversation: the conversation history, starting with the system prompt.
+            tokens: the tokens of the whole conversation.
+        """
+        if self._task is not None or tokens <= self.threshold_tokens:
+            return
+        turn_starts = [index for index, message in enumerate(conversation) if message.get("role") == "user"]
+        if len(turn_starts) <= self.keep_turns:
+            return
+        cut = turn_starts[-self.keep_turns] if self.keep_turns else len(conversation)
+        # Summarize a snapshot: the conversation may grow while the summary is being written
+        self._task = asyncio.create_task(self._summarize(conversation[1:cut], conversation[cut - 1]))
+        log.debug("Compacting the conversation history in the background", tokens=tokens, messages=cut - 1)
+
+    async def _summarize(self, messages: List[Dict[str, Any]], last_message: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Ask the LLM for a summary of the messages.
+
+        Returns:
+            The summary and the last message it covers, to find where the summary ends in the history.
+        """
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": self.instructions},
+                {"role": "user", "content": render_transcript(messages)},
+            ],
+        )
+        summary = response.choices[0].message.content
+        return {"summary": summary, "last_message": last_message}
+
+    def apply(self, conversation: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Build the compacted history, if a summary is ready. Must be called between turns.
+
+        Args:
+            conversation: the conversation history, starting with the system prompt.
+
+        Returns:
+            The compacted history, or None if no summary is ready or it doesn't apply to this history anymore.
+        """
+        if self._task is None or not self._task.done():
+            return None
+        task, self._task = self._task, None
+        if task.cancelled():
+            return None
+        if task.exception():
+            log.warning("Could not compact the conversation history", exc_info=task.exception())
+            return None
+        result = task.result()
+        # The summary covers the history up to its last message: if that's gone, the history was reset meanwhile
+        for cut, message in enumerate(conversation):
+            if message is result["last_message"]:
+                break
+        else:
+            return None
+        self.summary = {
+            "role": "system",
+            "content": f"Summary of the conversation so far:\n{result['summary']}",
+        }
+        log.debug("Conversation history compacted", compacted_messages=cut, summary=result["summary"])
+        return [conversation[0], self.summary] + conversation[cut + 1 :]
+
+    def cancel(self) -> None:
+        """
+        Drop the summary being written, if any. Must be called when the conversation starts over.
+        """
+        if self._task is not None:
+            self._task.cancel()
+        self._task = None
+        self.summary = None
+
+
+def load_compactor_from_dict(client: Any, model: str, config: Optional[Dict[str, Any]]) -> Optional[HistoryCompactor]:
+    """
+    Create the history compactor of a client from the `compaction` field of its configuration.
+
+    Args:
+        client: the OpenAI client used to write the summaries.
+        model: the LLM that writes the summaries, unless the configuration names another one in `model`.
+        config: a dictionary with `threshold_tokens` and optionally `keep_turns`, `model` and `instructions`.
+
+    Returns:
+        The compactor, or None if the history is not compacted.
+    """
+    if not config:
+        return None
+    config = {"model": model, **config}
+    return HistoryCompactor(client, **config)
@@ -0,0 +1,170 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+"""
+Token-aware selection of the messages sent to the Chat Completion API.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import json
+from bisect import bisect_left
+
+import structlog
+from intentional_core.tokenization import Tokenizer
+from intentional_openai.history import ConversationHistory
+
+
+log = structlog.get_logger(logger_name=__name__)
+
+
+class ContextWindow:
+    """
+    Decides which messages of the conversation history are sent to the LLM with each request.
+
+    The history is split in turns: each turn starts with a user message and contains the assistant's replies, its tool
+    calls and the tool results that follow it, so tool calls are never separated from their results. The system
+    prompt is always sent, and so are the first `pinned_turns` turns. Of the remaining turns, the oldest ones are left
+    out until the request fits in `max_tokens` and contains at most `max_turns` turns. The turn in progress is always
+    sent, even if it's over budget on its own.
+
+    The token count of each message is computed once, when the message is first seen, and kept in a running sum, so
+    the cost of choosing the messages doesn't grow with the length of the conversation.
+    """
+
+    def __init__(
+        self,
+        tokenizer: Tokenizer,
+        max_tokens: Optional[int] = None,
+        max_turns: Optional[int] = None,
+        pinned_turns: int = 0,
+    ) -> None:
+        """
+        Args:
+            tokenizer: the tokenizer used to count the tokens of each message.
+            max_tokens: the maximum number of tokens of a request's messages. No limit if not set.
+            max_turns: the maximum number of turns sent with each request, pinned ones included. No limit if not set.
+            pinned_turns: how many turns at the start of the conversation are always sent.
+        """
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.max_turns = max_turns
+        self.pinned_turns = pinned_turns
+        self._prefix_tokens: List[int] = [0]
+        """ Running sum of the tokens of the history (system prompt excluded): item `i` is the sum of the first `i`. """
+        self._turn_starts: List[int] = []
+        """ The position in the history (system prompt excluded) of the first message of each turn. """
+        self._turn_prefixes: List[int] = []
+        """ The running sum of the tokens at the start of each turn, to find the turns that fit by bisection. """
+        self._system_prompt: Optional[str] = None
+        self._system_tokens = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether any limit is set. Without limits the whole history is sent and no tokens are counted.
+        """
+        return self.max_tokens is not None or self.max_turns is not None
+
+    @property
+    def history_tokens(self) -> int:
+        """
+        The tokens of the history seen so far, system prompt excluded.
+        """
+        return self._prefix_tokens[-1]
+
+    def reset(self) -> None:
+        """
+        Forget the history seen so far. Must be called when the conversation starts over.
+        """
+        self._prefix_tokens = [0]
+        self._turn_starts = []
+        self._turn_prefixes = []
+
+    def count_tokens(self, message: Dict[str, Any]) -> int:
+        """
+        Count the tokens of a message, as serialized in the request.
+        """
+        return self.tokenizer.count_tokens(json.dumps(message, default=str))
+
+    def total_tokens(self, conversation: Sequence[Dict[str, Any]]) -> int:
+        """
+        The tokens of the whole conversation, system prompt included. Only new messages are counted.
+        """
+        self._update(conversation)
+        return self._system_tokens + self._prefix_tokens[-1]
+
+    def _update(self, conversation: Sequence[Dict[str, Any]]) -> None:
+        """
+        Count the tokens of the messages added to the conversation since the last call, and of the system prompt if
+        it changed.
+        """
+        system_prompt = conversation[0].get("content")
+        if system_prompt != self._system_prompt:
+            self._system_prompt = system_prompt
+            self._system_tokens = self.count_tokens(conversation[0])
+        if len(conversation) < len(self._prefix_tokens):
+            # The conversation started over without a reset
+            self.reset()
+        for index in range(len(self._prefix_tokens), len(conversation)):
+            if conversation[index].get("role") == "user":
+                self._turn_starts.append(index - 1)
+                self._turn_prefixes.append(self._prefix_tokens[-1])
+            self._prefix_tokens.append(self._prefix_tokens[-1] + self.count_tokens(conversation[index]))
+
+    def select(self, conversation: Sequence[Dict[str, Any]], message: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        """
+        Choose the messages to send with a request.
+
+        Args:
+            conversation: the conversation history, starting with the system prompt.
+            message: the new message, not part of the history yet.
+
+        Returns:
+            The messages to send: the system prompt, the pinned turns, the most recent turns and the new message.
+            When nothing is left out, the history is not copied.
+        """
+        if not self.enabled:
+            return _with_message(conversation, message)
+        self._update(conversation)
+
+        # The new message counts as part of the history, and starts a new turn if it's a user message
+        history_length = len(self._prefix_tokens) - 1
+        total_tokens = self._prefix_tokens[-1] + self.count_tokens(message)
+        turns = len(self._turn_starts) + (1 if message.get("role") == "user" else 0)
+        if turns <= self.pinned_turns:
+            return _with_message(conversation, message)
+
+        def turn_start(turn: int) -> int:
+            return self._turn_starts[turn] if turn < len(self._turn_starts) else history_length
+
+        pinned_end = turn_start(self.pinned_turns)
+        first_turn = self.pinned_turns
+        if self.max_turns is not None:
+            first_turn = max(first_turn, turns - max(self.max_turns - self.pinned_turns, 1))
+        if self.max_tokens is not None:
+            # The kept turns must fit in what's left after the system prompt and the pinned turns
+            budget = self.max_tokens - self._system_tokens - self._prefix_tokens[pinned_end]
+            first_turn = bisect_left(self._turn_prefixes, total_tokens - budget, lo=first_turn)
+        # The turn in progress is always sent
+        first_turn = min(first_turn, turns - 1)
+
+        kept_start = turn_start(first_turn)
+        if kept_start == pinned_end:
+            return _with_message(conversation, message)
+        log.debug(
+            "Leaving old turns out of the request",
+            dropped_turns=first_turn - self.pinned_turns,
+            dropped_tokens=self._prefix_tokens[kept_start] - self._prefix_tokens[pinned_end],
+        )
+        # Positions in the history are offset by one in the conversation, because of the system prompt
+        return conversation[: pinned_end + 1] + conversation[kept_start + 1 :] + [message]
+
+
+def _with_message(conversation: Sequence[Dict[str, Any]], message: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    """
+    The whole conversation followed by the new message, without copying the history if possible.
+    """
+    if isinstance(conversation, ConversationHistory):
+        return conversation.with_message(message)
+    return list(conversation) + [message]
@@ -0,0 +1,69 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+"""
+The conversation history of the Chat Completion client.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import itertools
+from collections.abc import Sequence
+
+
+class ConversationHistory(Sequence):
+    """
+    The messages of a conversation, starting with the system prompt.
+
+    Messages are only ever appended, and the system prompt is swapped in place, so neither a new message nor a new
+    system prompt copies the rest of the history.
+    """
+
+    def __init__(self, system_prompt: str, messages: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+        """
+        Args:
+            system_prompt: the system prompt.
+            messages: the messages that follow the system prompt, if any.
+        """
+        self._messages: List[Dict[str, Any]] = [{"role": "system", "content": system_prompt}]
+        self._messages.extend(messages or ())
+
+    @property
+    def system_prompt(self) -> str:
+        """
+        The system prompt, always the first message of the history.
+        """
+        return self._messages[0]["content"]
+
+    @system_prompt.setter
+    def system_prompt(self, system_prompt: str) -> None:
+        self._messages[0] = {"role": "system", "content": system_prompt}
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        return self._messages[index]
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._messages)
+
+    def __repr__(self) -> str:
+        return f"ConversationHistory({self._messages!r})"
+
+    def append(self, message: Dict[str, Any]) -> None:
+        """
+        Add a message at the end of the history.
+        """
+        self._messages.append(message)
+
+    def extend(self, messages: Iterable[Dict[str, Any]]) -> None:
+        """
+        Add several messages at the end of the history.
+        """
+        self._messages.extend(messages)
+
+    def with_message(self, message: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+        """
+        The history followed by a message that is not part of it yet, without copying the history.
+        """
+        return itertools.chain(self._messages, (message,))
@@ -8,7 +8,7 @@
 Client for OpenAI's Realtime API.
 """
 
-from typing import Dict, Any, Callable
+from typing import Dict, Any, Callable, List, Optional, Set
 
 import os
 import math
@@ -22,7 +22,11 @@ import websockets
 from intentional_core import LLMClient
 from intentional_core.intent_routing import IntentRouter
 from intentional_core.end_conversation import EndConversationTool
-from intentional_openai.tools import to_openai_tool
+from intentional_core.tools import ToolTimeoutError
+from intentional_core.tool_metrics import ToolCallTracker
+from intentional_core.tool_validation import ToolArgumentsError
+from intentional_core.tool_streaming import ToolProgress, tool_progress_event
+from intentional_openai.tools import get_tool_schemas
 
 
 log = structlog.get_logger(logger_name=__name__)
@@ -83,6 +87,9 @@ class RealtimeAPIClient(LLMClient):
         self._updating_system_prompt = False
         self._current_response_id = None
         self._current_item_id = None
+        self._response_in_progress = False
+        self._response_requested = False
+        self._tool_tasks: Set[asyncio.Task] = set()
 
         # Intent routering data
         self.intent_router = intent_router
@@ -109,6 +116,7 @@ class RealtimeAPIClient(LLMClient):
             "OpenAI-Beta": "realtime=v1",
         }
         self.ws = await websockets.connect(url, extra_headers=headers)
+        self.intent_router.prefetch_tools()
 
         await self._update_session(
             {
@@ -124,10 +132,10 @@ class RealtimeAPIClient(LLMClient):
                     "prefix_padding_ms": 500,
                     "silence_duration_ms": 200,
                 },
-                "tools": [to_openai_tool(tool) for tool in self.tools.values()],
                 "tool_choice": "auto",
                 "temperature": 0.8,
-            }
+            },
+            tools=get_tool_schemas(self.tools).realtime,
         )
         # Flag that we're connecting and look for this event in the run loop
         self._connecting = True
@@ -178,6 +186,7 @@ class RealtimeAPIClient(LLMClient):
                 # Track agent response state
                 elif event_name == "response.created":
                     self._current_response_id = event.get("response", {}).get("id")
+                    self._response_in_progress = True
                     log.debug(
                         "Agent started responding. Response created.",
                         response_id=self._current_response_id,
@@ -195,6 +204,11 @@ class RealtimeAPIClient(LLMClient):
                         "Agent finished generating a response.",
                         response_id=self._current_item_id,
                     )
+                    self._response_in_progress = False
+                    if self._response_requested:
+                        # A response was asked for while this one was being generated
+                        self._response_requested = False
+                        await self._request_response_from_llm()
 
                 # Tool call
                 elif event_name == "response.function_call_arguments.done":
@@ -260,10 +274,8 @@ class RealtimeAPIClient(LLMClient):
         log.debug("Setting new system prompt", system_prompt=self.system_prompt)
         log.debug("Setting new tools", tools=list(self.tools.keys()))
         await self._update_session(
-            {
-                "instructions": self.system_prompt,
-                "tools": [to_openai_tool(t) for t in self.tools.values()],
-            }
+            {"instructions": self.system_prompt},
+            tools=get_tool_schemas(self.tools).realtime,
         )
         # Flag that we're updating the system prompt and look for this event in the run loop
         self._updating_system_prompt = True
@@ -283,6 +295,11 @@ class RealtimeAPIClient(LLMClient):
             interruption_time=lenght_to_interruption,
         )
 
+        # Cancel the tools that are still running: their output is not needed anymore
+        for task in list(self._tool_tasks):
+            log.debug("Cancelling tool call due to a user's interruption.")
+            task.cancel()
+
         # Cancel the current response
         # Cancelling responses is effective when the response is still being generated by the LLM.
         if self._current_response_id:
@@ -312,16 +329,18 @@ class RealtimeAPIClient(LLMClient):
             }
             await self.ws.send(json.dumps(event))
 
-    async def _update_session(self, config: Dict[str, Any]) -> None:
+    async def _update_session(self, config: Dict[str, Any], tools: Optional[List[Dict[str, Any]]] = None) -> None:
         """
         Update session configuration.
 
         Args:
             config (Dict[str, Any]):
                 The new session configuration.
+            tools (Optional[List[Dict[str, Any]]]):
+                The already built tool definitions, if the tools should be updated too.
         """
-        event = {"type": "session.update", "session": config}
-        await self.ws.send(json.dumps(event))
+        session = {**config, "tools": tools} if tools is not None else config
+        await self.ws.send(json.dumps({"type": "session.update", "session": session}))
 
     async def _send_text_message(self, text: str) -> None:
         """
@@ -368,7 +387,7 @@ class RealtimeAPIClient(LLMClient):
     #     commit_event = {"type": "input_audio_buffer.commit"}
     #     await self.ws.send(json.dumps(commit_event))
 
-    async def _send_function_result(self, call_id: str, result: Any) -> None:
+    async def _send_function_result(self, call_id: str, result: Any, request_response: bool = True) -> None:
         """
         Send function call result back to the API.
 
@@ -377,6 +396,8 @@ class RealtimeAPIClient(LLMClient):
                 The ID of the function call.
             result (Any):
                 The result of the function call.
+            request_response (bool):
+                Whether to ask the LLM to respond to the result, as soon as it's not generating another response.
         """
         event = {
             "type": "conversation.item.create",
@@ -387,7 +408,8 @@ class RealtimeAPIClient(LLMClient):
             },
         }
         await self.ws.send(json.dumps(event))
-        await self._request_response_from_llm()
+        if request_response:
+            await self._request_response_when_idle()
 
     async def _request_response_from_llm(self) -> None:
         """
@@ -401,6 +423,18 @@ class RealtimeAPIClient(LLMClient):
         }
         await self.ws.send(json.dumps(event))
 
+    async def _request_response_when_idle(self) -> None:
+        """
+        Asks the LLM for a response, or, if it's still generating one, asks once that one is done: the API rejects a
+        new response while another is active. This is the case of tool results, which usually arrive while the
+        response that called the tool is still going.
+        """
+        if self._response_in_progress:
+            log.debug("Response in progress, asking for a new one once it's done")
+            self._response_requested = True
+        else:
+            await self._request_response_from_llm()
+
     async def _call_tool(self, event: Dict[str, Any]) -> None:
         """
         Calls the tool requested by the LLM.
@@ -436,14 +470,99 @@ class RealtimeAPIClient(LLMClient):
             return
 
         # Emit the event
-        self.emit("on_tool_invoked", {"name": tool_name, "args": tool_arguments})
+        await self.emit("on_tool_invoked", {"name": tool_name, "args": tool_arguments})
 
         # Make sure the tool actually exists
         if tool_name not in self.tools:
             log.error("Tool '%s' not found in the list of available tools.", tool_name)
             await self._send_function_result(call_id, f"Error: Tool {tool_name} not found")
+            return
 
-        # Invoke the tool and send back the output
-        result = await self.tools.get(tool_name).run(tool_arguments)
+        # Run the tool in the background, so that the receive loop is never blocked by a slow tool
+        task = asyncio.create_task(self._run_tool(call_id, tool_name, tool_arguments))
+        self._tool_tasks.add(task)
+        task.add_done_callback(self._tool_tasks.discard)
+
+    async def _run_tool(self, call_id: str, tool_name: str, tool_arguments: Dict[str, Any]) -> None:
+        """
+        Invokes a tool and sends back its output. Timeouts and failures are reported to the LLM as a structured error.
+
+        For streaming tools, the first partial output or progress note is sent right away as the result of the call,
+        so that the LLM can tell the user about it while the tool keeps working. The complete output follows as a
+        separate message once the tool is done.
+
+        Args:
+            call_id (str):
+                The ID of the function call.
+            tool_name (str):
+                The name of the tool to invoke.
+            tool_arguments (Dict[str, Any]):
+                The arguments to pass to the tool.
+        """
+        early_result_sent = False
+
+        async def forward_partial(partial: Any) -> None:
+            nonlocal early_result_sent
+            await self.emit("on_tool_progress", tool_progress_event(tool_name, call_id, partial))
+            if not early_result_sent:
+                early_result_sent = True
+                if isinstance(partial, ToolProgress):
+                    early_result = {"status": "in_progress", "progress": partial.message}
+                else:
+                    early_result = {"status": "in_progress", "partial_output": partial}
+                await self._send_function_result(call_id, json.dumps(early_result, default=str))
+
+        with ToolCallTracker(tool_name, call_id, tool_arguments) as call:
+            try:
+                result = str(await self.tools[tool_name].invoke(tool_arguments, on_partial=forward_partial))
+            except (ToolArgumentsError, ToolTimeoutError) as exc:
+                call.fail(exc)
+                result = json.dumps({"error": str(exc)})
+            except asyncio.CancelledError:
+                log.debug("Tool call cancelled", tool_name=tool_name, call_id=call_id)
+                if not early_result_sent:
+                    await self._send_function_result(
+                        call_id,
+                        json.dumps({"error": "Cancelled because the user interrupted."}),
+                        request_response=False,
+                    )
+                raise
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                # Nothing awaits this task: tell the LLM the tool failed, or the call would never be answered
+                call.fail(exc)
+                log.exception("Tool '%s' failed.", tool_name, tool_name=tool_name, call_id=call_id)
+                result = json.dumps({"error": f"{type(exc).__name__}: {exc}"})
+            call.set_output(result)
         log.debug("Tool run", tool_name=tool_name, tool_output=result)
-        await self._send_function_result(call_id, str(result))
+        if early_result_sent:
+            await self._send_final_tool_output(call_id, tool_name, result)
+        else:
+            await self._send_function_result(call_id, result)
+
+    async def _send_final_tool_output(self, call_id: str, tool_name: str, result: str) -> None:
+        """
+        Send the complete output of a streaming tool whose call was already answered with a partial output.
+
+        Args:
+            call_id (str):
+                The ID of the function call.
+            tool_name (str):
+                The name of the tool.
+            result (str):
+                The complete output of the tool.
+        """
+        event = {
+            "type": "conversation.item.create",
+            "item": {
+                "type": "message",
+                "role": "system",
+                "content": [
+                    {
+                        "type": "input_text",
+                        "text": f"The tool '{tool_name}' (call {call_id}) completed. Its complete output is: {result}",
+                    }
+                ],
+            },
+        }
+        await self.ws.send(json.dumps(event))
+        await self._request_response_when_idle()
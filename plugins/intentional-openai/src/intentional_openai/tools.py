@@ -5,9 +5,25 @@
 Tool utilities to interact with tools in OpenAI.
 """
 
+from typing import Any, Dict, List, Tuple
+
+from collections import OrderedDict
+
+import structlog
+
 from intentional_core import Tool
 
 
+log = structlog.get_logger(logger_name=__name__)
+
+
+MAX_CACHED_TOOL_SCHEMAS = 64
+""" How many sets of tools keep their schemas. The least recently used ones are dropped first. """
+
+_TOOL_SCHEMAS: "OrderedDict[Tuple[Tuple[str, Tool], ...], ToolSchemas]" = OrderedDict()
+""" This is a global dictionary that maps the most recently used sets of tools to their already built schemas """
+
+
 def to_openai_tool(tool: Tool):
     """
     The tool definition required by OpenAI.
@@ -29,3 +45,47 @@ def to_openai_tool(tool: Tool):
             "required": [param.name for param in tool.parameters if param.required],
         },
     }
+
+
+class ToolSchemas:
+    """
+    The definitions of a set of tools, in the formats needed by the OpenAI APIs. Built once per set of tools.
+    """
+
+    def __init__(self, tools: Dict[str, Tool]) -> None:
+        """
+        Args:
+            tools: the tools to describe.
+        """
+        self.realtime: List[Dict[str, Any]] = [to_openai_tool(tool) for tool in tools.values()]
+        """ The tool definitions for the Realtime API. """
+        self.chat_completion: List[Dict[str, Any]] = [
+            {"type": "function", "function": definition} for definition in self.realtime
+        ]
+        """ The tool definitions for the Chat Completion API. """
+
+
+def get_tool_schemas(tools: Dict[str, Tool]) -> ToolSchemas:
+    """
+    Get the schemas of a set of tools, such as the tools of a stage, building them only the first time.
+
+    The schemas are rebuilt if tools are added, removed or replaced, but not if an existing tool is modified in place.
+    Only the schemas of the last `MAX_CACHED_TOOL_SCHEMAS` sets of tools are kept, so the tools of stages and
+    conversations that are gone are eventually released.
+
+    Args:
+        tools: the tools to describe.
+
+    Returns:
+        The schemas of the tools.
+    """
+    key: Tuple[Tuple[str, Tool], ...] = tuple(tools.items())
+    schemas = _TOOL_SCHEMAS.get(key)
+    if schemas is not None:
+        _TOOL_SCHEMAS.move_to_end(key)
+        return schemas
+    log.debug("Building tool schemas", tools=list(tools))
+    schemas = _TOOL_SCHEMAS[key] = ToolSchemas(tools)
+    if len(_TOOL_SCHEMAS) > MAX_CACHED_TOOL_SCHEMAS:
+        _TOOL_SCHEMAS.popitem(last=False)
+    return schemas
@@ -0,0 +1,308 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import Mock
+
+import pytest
+from openai.types.chat import ChatCompletionChunk
+from intentional_core import IntentRouter, Tool, EventListener
+from intentional_core.tools import ToolParameter
+from intentional_core.tool_metrics import get_tool_stats, reset_tool_stats
+from intentional_core.tool_streaming import ToolProgress
+from intentional_openai.chatcompletion_api import ChatCompletionAPIClient
+
+
+def make_chunk(delta):
+    # Chunks with no choices, like the final usage report, are represented by None
+    return ChatCompletionChunk(
+        id="chatcmpl-1",
+        choices=[] if delta is None else [{"index": 0, "delta": delta}],
+        created=0,
+        model="gpt-4o",
+        object="chat.completion.chunk",
+    )
+
+
+class FakeCompletions:
+    """
+    Returns the given responses in order, each as a stream of chunks, and records the requests.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.summaries = []
+        self.summary_ready = asyncio.Event()
+        self.summary_ready.set()
+
+    async def create(self, **kwargs):
+        if not kwargs.get("stream"):
+            # Summaries are requested without streaming
+            self.summaries.append(kwargs["messages"][-1]["content"])
+            await self.summary_ready.wait()
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Questions 0 to N"))])
+        self.requests.append({**kwargs, "messages": list(kwargs["messages"])})
+        chunks = self.responses.pop(0)
+
+        async def stream():
+            for chunk in chunks:
+                yield make_chunk(chunk)
+
+        return stream()
+
+
+class Listener(EventListener):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    async def handle_event(self, event_name, event):
+        self.events.append((event_name, event))
+
+
+class SlowLookupTool(Tool):
+    id = "slow_lookup"
+    name = "slow_lookup"
+    description = "Looks something up, slowly."
+    parameters = [ToolParameter("key", "What to look up", "string", True, None)]
+
+    def __init__(self):
+        self.running = 0
+        self.max_running = 0
+
+    async def run(self, params=None):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return f"value of {params['key']}"
+
+
+def text_response(text):
+    return [{"content": text}]
+
+
+def tool_calls_response(*calls):
+    chunks = []
+    for index, (call_id, name, args) in enumerate(calls):
+        arguments = json.dumps(args)
+        chunks.append(
+            {"tool_calls": [{"index": index, "id": call_id, "function": {"name": name, "arguments": arguments[:5]}}]}
+        )
+        chunks.append({"tool_calls": [{"index": index, "function": {"arguments": arguments[5:]}}]})
+    return chunks
+
+
+@pytest.fixture
+def make_client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+
+    def factory(responses, tools=None, config=None):
+        router = IntentRouter(
+            {
+                "stages": {
+                    "lookup": {
+                        "accessible_from": ["_start_"],
+                        "goal": "Look things up",
+                        "outcomes": {"done": {"description": "Done", "move_to": "_end_"}},
+                    }
+                }
+            }
+        )
+        router.stages["lookup"].tools.update(tools or {})
+        listener = Listener()
+        client = ChatCompletionAPIClient(
+            parent=listener, intent_router=router, config={"name": "gpt-4o", **(config or {})}
+        )
+        client.client = Mock()
+        client.client.chat.completions = FakeCompletions(responses)
+        if client.compactor:
+            client.compactor.client = client.client
+        return client, listener
+
+    return factory
+
+
+@pytest.mark.asyncio
+async def test_send_text_message(make_client):
+    client, listener = make_client([text_response("Hello!")])
+    await client.send({"text_message": {"role": "user", "content": "Hi"}})
+    assert client.conversation[-1] == {"role": "assistant", "content": "Hello!"}
+    assert ("on_text_message_from_llm", {"delta": "Hello!"}) in listener.events
+
+
+@pytest.mark.asyncio
+async def test_parallel_tool_calls(make_client):
+    tool = SlowLookupTool()
+    client, _ = make_client(
+        [
+            tool_calls_response(("call_1", "slow_lookup", {"key": "a"}), ("call_2", "slow_lookup", {"key": "b"})),
+            text_response("Done!"),
+        ],
+        tools={"slow_lookup": tool},
+    )
+    await client.send({"text_message": {"role": "user", "content": "Look up a and b"}})
+
+    # Both tools ran at the same time
+    assert tool.max_running == 2
+
+    # A single follow-up request carried both results
+    follow_up = client.client.chat.completions.requests[1]["messages"]
+    assert follow_up[-3]["tool_calls"][0]["id"] == "call_1"
+    assert follow_up[-3]["tool_calls"][1]["function"] == {"name": "slow_lookup", "arguments": '{"key": "b"}'}
+    assert follow_up[-2] == {"role": "tool", "content": '"value of a"', "tool_call_id": "call_1"}
+    assert follow_up[-1] == {"role": "tool", "content": '"value of b"', "tool_call_id": "call_2"}
+    assert client.conversation[-1] == {"role": "assistant", "content": "Done!"}
+
+
+class HangingTool(Tool):
+    id = "hanging_tool"
+    name = "hanging_tool"
+    description = "Never returns."
+    parameters = []
+
+    async def run(self, params=None):
+        await asyncio.sleep(10)
+
+
+@pytest.mark.asyncio
+async def test_tool_timeout_returns_structured_error(make_client):
+    tool = HangingTool()
+    tool.timeout = 0.01
+    client, _ = make_client(
+        [tool_calls_response(("call_1", "hanging_tool", {})), text_response("Sorry!")],
+        tools={"hanging_tool": tool},
+    )
+    await client.send({"text_message": {"role": "user", "content": "Hang"}})
+    follow_up = client.client.chat.completions.requests[1]["messages"]
+    assert json.loads(follow_up[-1]["content"]) == {"error": "Tool 'hanging_tool' timed out after 0.01 seconds."}
+
+
+@pytest.mark.asyncio
+async def test_interruption_cancels_tools(make_client):
+    client, _ = make_client(
+        [tool_calls_response(("call_1", "hanging_tool", {}))], tools={"hanging_tool": HangingTool()}
+    )
+    send = asyncio.create_task(client.send({"text_message": {"role": "user", "content": "Hang"}}))
+    while not client._tool_tasks:
+        await asyncio.sleep(0)
+    await client.handle_interruption(0)
+    await asyncio.wait_for(send, timeout=1)
+
+    # No follow-up request, but the history is still consistent
+    assert len(client.client.chat.completions.requests) == 1
+    assert client.conversation[-1]["tool_call_id"] == "call_1"
+    assert "interrupted" in client.conversation[-1]["content"]
+
+
+class StreamingSearchTool(Tool):
+    id = "streaming_search"
+    name = "streaming_search"
+    description = "Searches in two places."
+    parameters = []
+
+    async def run(self, params=None):
+        yield ToolProgress("Searching the first catalogue...")
+        yield ["first"]
+        yield ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_streaming_tool_progress_reaches_the_interface(make_client):
+    client, listener = make_client(
+        [tool_calls_response(("call_1", "streaming_search", {})), text_response("Found two!")],
+        tools={"streaming_search": StreamingSearchTool()},
+    )
+    await client.send({"text_message": {"role": "user", "content": "Search"}})
+
+    progress = [event for name, event in listener.events if name == "on_tool_progress"]
+    assert progress == [
+        {"name": "streaming_search", "call_id": "call_1", "progress": "Searching the first catalogue..."},
+        {"name": "streaming_search", "call_id": "call_1", "partial_output": ["first"]},
+        {"name": "streaming_search", "call_id": "call_1", "partial_output": ["first", "second"]},
+    ]
+    follow_up = client.client.chat.completions.requests[1]["messages"]
+    assert json.loads(follow_up[-1]["content"]) == ["first", "second"]
+
+
+@pytest.mark.asyncio
+async def test_tool_calls_are_measured(make_client):
+    reset_tool_stats()
+    tool = HangingTool()
+    tool.timeout = 0.01
+    client, _ = make_client(
+        [
+            tool_calls_response(("call_1", "slow_lookup", {"key": "a"}), ("call_2", "hanging_tool", {})),
+            text_response("Done!"),
+        ],
+        tools={"slow_lookup": SlowLookupTool(), "hanging_tool": tool},
+    )
+    await client.send({"text_message": {"role": "user", "content": "Look up a"}})
+
+    stats = get_tool_stats()
+    assert stats["slow_lookup"].calls == 1
+    assert stats["slow_lookup"].output_bytes == len("value of a")
+    assert stats["hanging_tool"].timeouts == 1
+
+
+@pytest.mark.asyncio
+async def test_old_turns_are_left_out_of_the_context_window(make_client):
+    responses = [text_response(f"Answer {index}") for index in range(4)]
+    client, _ = make_client(responses, config={"context_window": {"max_turns": 2}})
+    for index in range(4):
+        await client.send({"text_message": {"role": "user", "content": f"Question {index}"}})
+
+    # The whole conversation is kept, but only the last turns are sent
+    assert len(client.conversation) == 9
+    messages = client.client.chat.completions.requests[-1]["messages"]
+    assert [message["content"] for message in messages] == [
+        client.system_prompt,
+        "Question 2",
+        "Answer 2",
+        "Question 3",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_history_is_compacted_in_the_background(make_client):
+    responses = [text_response(f"Answer {index}") for index in range(4)]
+    client, _ = make_client(responses, config={"compaction": {"threshold_tokens": 10, "keep_turns": 1}})
+    completions = client.client.chat.completions
+    completions.summary_ready.clear()
+    for index in range(3):
+        await client.send({"text_message": {"role": "user", "content": f"Question {index}"}})
+
+    # The summary is still being written: the turns go on with the whole history
+    await asyncio.sleep(0)
+    assert completions.summaries == ["user: Question 0\nassistant: Answer 0"]
+    assert len(client.conversation) == 7
+
+    # Once it's ready, it replaces the old turns before the next one
+    completions.summary_ready.set()
+    await asyncio.sleep(0)
+    await client.send({"text_message": {"role": "user", "content": "Question 3"}})
+    messages = completions.requests[-1]["messages"]
+    assert messages[1] == {"role": "system", "content": "Summary of the conversation so far:\nQuestions 0 to N"}
+    assert [message["content"] for message in messages[2:]] == [
+        "Question 1",
+        "Answer 1",
+        "Question 2",
+        "Answer 2",
+        "Question 3",
+    ]
+    assert client.conversation[1] is client.compactor.summary
+
+
+@pytest.mark.asyncio
+async def test_streamed_text_is_collected(make_client):
+    client, listener = make_client([[{"role": "assistant"}, {"content": "Hel"}, {"content": "lo!"}, None]])
+    await client.send({"text_message": {"role": "user", "content": "Hi"}})
+    assert client.conversation[-1] == {"role": "assistant", "content": "Hello!"}
+    assert [event["delta"] for name, event in listener.events if name == "on_text_message_from_llm"] == [
+        None,
+        "Hel",
+        "lo!",
+    ]
@@ -0,0 +1,86 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json
+
+from intentional_core.tokenization import load_tokenizer_from_dict
+from intentional_openai.context_window import ContextWindow
+
+
+def make_window(**limits):
+    return ContextWindow(load_tokenizer_from_dict({"type": "approximate", "chars_per_token": 1}), **limits)
+
+
+def make_conversation(turns):
+    conversation = [{"role": "system", "content": "You are a bot."}]
+    for index in range(turns):
+        conversation.append({"role": "user", "content": f"Question {index}"})
+        conversation.append({"role": "assistant", "content": f"Answer {index}"})
+    return conversation
+
+
+def contents(messages):
+    return [message.get("content") for message in messages]
+
+
+def test_no_limits_sends_everything():
+    conversation = make_conversation(10)
+    message = {"role": "user", "content": "Question 10"}
+    assert list(make_window().select(conversation, message)) == conversation + [message]
+
+
+def test_max_turns_keeps_the_latest_turns():
+    window = make_window(max_turns=2)
+    selected = window.select(make_conversation(10), {"role": "user", "content": "Question 10"})
+    assert contents(selected) == ["You are a bot.", "Question 9", "Answer 9", "Question 10"]
+
+
+def test_pinned_turns_are_always_sent():
+    window = make_window(max_turns=2, pinned_turns=1)
+    selected = window.select(make_conversation(10), {"role": "user", "content": "Question 10"})
+    assert contents(selected) == ["You are a bot.", "Question 0", "Answer 0", "Question 10"]
+
+
+def test_max_tokens_keeps_what_fits():
+    window = make_window(max_tokens=200)
+    conversation = make_conversation(10)
+    message = {"role": "user", "content": "Question 10"}
+    selected = window.select(conversation, message)
+    assert sum(window.count_tokens(message) for message in selected) <= 200
+    assert selected[0] == conversation[0]
+    assert selected[1]["role"] == "user"
+    assert selected[-3:] == conversation[-2:] + [message]
+    assert len(selected) < len(conversation)
+
+
+def test_tool_calls_stay_with_their_results():
+    conversation = make_conversation(5)
+    conversation.append({"role": "user", "content": "Look it up"})
+    conversation.append(
+        {
+            "role": "assistant",
+            "tool_calls": [{"id": "call_1", "type": "function", "function": {"name": "lookup", "arguments": "{}"}}],
+        }
+    )
+    result = {"role": "tool", "tool_call_id": "call_1", "content": json.dumps("x" * 500)}
+    # The turn in progress is sent even if it's over budget on its own
+    selected = make_window(max_tokens=100).select(conversation, result)
+    assert selected == [conversation[0]] + conversation[-2:] + [result]
+
+
+def test_token_counts_are_incremental():
+    window = make_window(max_turns=2)
+    conversation = make_conversation(3)
+    window.select(conversation, {"role": "user", "content": "Question 3"})
+    tokens = window.history_tokens
+
+    conversation.append({"role": "user", "content": "Question 3"})
+    conversation.append({"role": "assistant", "content": "Answer 3"})
+    window.select(conversation, {"role": "user", "content": "Question 4"})
+    assert window.history_tokens == tokens + window.count_tokens(conversation[-2]) + window.count_tokens(
+        conversation[-1]
+    )
+
+    window.reset()
+    window.select(conversation[:1], {"role": "user", "content": "Question 0"})
+    assert window.history_tokens == 0
@@ -0,0 +1,29 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+from intentional_openai.history import ConversationHistory
+
+
+def test_history_starts_with_the_system_prompt():
+    history = ConversationHistory("Be nice.", [{"role": "user", "content": "Hi"}])
+    assert len(history) == 2
+    assert history[0] == {"role": "system", "content": "Be nice."}
+    assert history[-1] == {"role": "user", "content": "Hi"}
+    assert history.system_prompt == "Be nice."
+
+
+def test_system_prompt_is_swapped_in_place():
+    history = ConversationHistory("Be nice.")
+    message = {"role": "user", "content": "Hi"}
+    history.append(message)
+    history.system_prompt = "Be brief."
+    assert history[0] == {"role": "system", "content": "Be brief."}
+    assert history[1] is message
+    assert len(history) == 2
+
+
+def test_with_message_does_not_change_the_history():
+    history = ConversationHistory("Be nice.")
+    message = {"role": "user", "content": "Hi"}
+    assert list(history.with_message(message)) == [history[0], message]
+    assert len(history) == 1
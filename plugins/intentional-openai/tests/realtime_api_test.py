@@ -0,0 +1,123 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json
+import asyncio
+
+import pytest
+from intentional_core import IntentRouter, Tool, EventListener
+from intentional_core.tool_metrics import get_tool_stats, reset_tool_stats
+from intentional_openai.realtime_api import RealtimeAPIClient
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.received = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    async def __aiter__(self):
+        while self.received:
+            yield json.dumps(self.received.pop(0))
+
+
+class BrokenTool(Tool):
+    id = "realtime_broken"
+    name = "broken"
+    description = "Always fails."
+    parameters = []
+
+    async def run(self, params=None):
+        raise RuntimeError("Backend unreachable")
+
+
+class SlowSearchTool(Tool):
+    id = "realtime_slow_search"
+    name = "slow_search"
+    description = "Finds results slowly."
+    parameters = []
+
+    def __init__(self):
+        self.release = asyncio.Event()
+
+    async def run(self, params=None):
+        yield ["first"]
+        await self.release.wait()
+        yield ["first", "second"]
+
+
+async def receive(client, *events):
+    client.ws.received.extend(events)
+    await client.run()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    router = IntentRouter(
+        {
+            "stages": {
+                "lookup": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Look things up",
+                    "outcomes": {"done": {"description": "Done", "move_to": "_end_"}},
+                }
+            }
+        }
+    )
+    client = RealtimeAPIClient(parent=EventListener(), intent_router=router, config={"name": "gpt-4o-realtime"})
+    client.ws = FakeWebSocket()
+    return client
+
+
+@pytest.mark.asyncio
+async def test_failing_tools_are_answered_with_an_error(client):
+    reset_tool_stats()
+    client.tools = {"broken": BrokenTool()}
+    await client._call_tool({"call_id": "call_1", "name": "broken", "arguments": "{}"})
+    await asyncio.gather(*client._tool_tasks)
+
+    output = client.ws.sent[0]["item"]
+    assert output["type"] == "function_call_output"
+    assert output["call_id"] == "call_1"
+    assert json.loads(output["output"]) == {"error": "RuntimeError: Backend unreachable"}
+    assert client.ws.sent[1]["type"] == "response.create"
+    assert get_tool_stats("broken")["broken"].errors == 1
+
+
+@pytest.mark.asyncio
+async def test_final_tool_output_waits_for_the_active_response(client):
+    tool = SlowSearchTool()
+    client.tools = {"slow_search": tool}
+    await client._call_tool({"call_id": "call_1", "name": "slow_search", "arguments": "{}"})
+    await asyncio.sleep(0.01)
+    assert [event["type"] for event in client.ws.sent] == ["conversation.item.create", "response.create"]
+
+    # The LLM is answering the partial output when the tool completes
+    await receive(client, {"type": "response.created", "response": {"id": "resp_1"}})
+    tool.release.set()
+    await asyncio.gather(*client._tool_tasks)
+    assert "first" in client.ws.sent[2]["item"]["content"][0]["text"]
+    assert [event["type"] for event in client.ws.sent[2:]] == ["conversation.item.create"]
+
+    await receive(client, {"type": "response.done", "response": {"id": "resp_1"}})
+    assert [event["type"] for event in client.ws.sent[2:]] == ["conversation.item.create", "response.create"]
+
+
+@pytest.mark.asyncio
+async def test_partial_tool_output_waits_for_the_active_response(client):
+    tool = SlowSearchTool()
+    client.tools = {"slow_search": tool}
+    # The response that calls the tool is still going when the partial output arrives
+    await receive(client, {"type": "response.created", "response": {"id": "resp_1"}})
+    await client._call_tool({"call_id": "call_1", "name": "slow_search", "arguments": "{}"})
+    await asyncio.sleep(0.01)
+    assert [event["type"] for event in client.ws.sent] == ["conversation.item.create"]
+    assert json.loads(client.ws.sent[0]["item"]["output"]) == {"status": "in_progress", "partial_output": ["first"]}
+
+    await receive(client, {"type": "response.done", "response": {"id": "resp_1"}})
+    assert [event["type"] for event in client.ws.sent] == ["conversation.item.create", "response.create"]
+    tool.release.set()
+    await asyncio.gather(*client._tool_tasks)
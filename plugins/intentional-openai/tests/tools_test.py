@@ -0,0 +1,84 @@
+# SPDX-FileCopyrightText: 2024-present ZanSara <github@zansara.dev>
+# SPDX-License-Identifier: AGPL-3.0-or-later
+
+import json
+
+import pytest
+from intentional_core import IntentRouter, Tool, EventListener
+from intentional_core.tools import ToolParameter
+import intentional_openai.tools as openai_tools
+from intentional_openai.tools import get_tool_schemas, to_openai_tool
+from intentional_openai.realtime_api import RealtimeAPIClient
+
+
+class LookupTool(Tool):
+    id = "schema_lookup"
+    name = "lookup"
+    description = "Looks something up."
+    parameters = [ToolParameter("key", "What to look up", "string", True, None)]
+
+    async def run(self, params=None):
+        return "value"
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+def test_tool_schemas_are_built_once():
+    tools = {"lookup": LookupTool()}
+    schemas = get_tool_schemas(tools)
+    assert schemas.realtime == [to_openai_tool(tools["lookup"])]
+    assert schemas.chat_completion == [{"type": "function", "function": to_openai_tool(tools["lookup"])}]
+    assert get_tool_schemas(tools) is schemas
+    assert get_tool_schemas(dict(tools)) is schemas
+
+
+def test_tool_schemas_change_with_the_tools():
+    tools = {"lookup": LookupTool()}
+    schemas = get_tool_schemas(tools)
+    tools["other_lookup"] = LookupTool()
+    assert get_tool_schemas(tools) is not schemas
+    assert len(get_tool_schemas(tools).realtime) == 2
+
+
+def test_tool_schemas_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(openai_tools, "MAX_CACHED_TOOL_SCHEMAS", 2)
+    monkeypatch.setattr(openai_tools, "_TOOL_SCHEMAS", type(openai_tools._TOOL_SCHEMAS)())
+    first, second, third = ({"lookup": LookupTool()} for _ in range(3))
+    first_schemas = get_tool_schemas(first)
+    get_tool_schemas(second)
+    assert get_tool_schemas(first) is first_schemas
+    get_tool_schemas(third)
+    assert len(openai_tools._TOOL_SCHEMAS) == 2
+    # The least recently used set of tools is forgotten
+    assert get_tool_schemas(first) is first_schemas
+    assert tuple(second.items()) not in openai_tools._TOOL_SCHEMAS
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("config", [{"instructions": "Be nice"}, {}])
+async def test_realtime_session_update_with_cached_tools(monkeypatch, config):
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    router = IntentRouter(
+        {
+            "stages": {
+                "lookup": {
+                    "accessible_from": ["_start_"],
+                    "goal": "Look things up",
+                    "outcomes": {"done": {"description": "Done", "move_to": "_end_"}},
+                }
+            }
+        }
+    )
+    client = RealtimeAPIClient(parent=EventListener(), intent_router=router, config={"name": "gpt-4o-realtime"})
+    client.ws = FakeWebSocket()
+    tools = {"lookup": LookupTool()}
+    await client._update_session(config, tools=get_tool_schemas(tools).realtime)
+    assert client.ws.sent == [
+        {"type": "session.update", "session": {**config, "tools": [to_openai_tool(tools["lookup"])]}}
+    ]